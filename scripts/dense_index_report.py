@@ -0,0 +1,137 @@
+"""
+Recall-vs-latency report for the dense index types in src/dense_index.py.
+
+Builds a flat (exact) baseline plus HNSW and IVF indexes over the same vectors
+and, for a sweep of efSearch / nprobe values, prints recall@k against the flat
+results and mean per-query latency. A second table compares vector storage
+modes (float32, fp16, sq8, pq) on flat indexes: bytes per vector on disk and
+recall with and without exact re-scoring of RESCORE_FACTOR * k candidates.
+
+Vectors come from the published FAISS index when one exists (--from-index),
+otherwise clustered synthetic unit vectors are generated (uniform random
+vectors have no neighbourhood structure and understate ANN recall).
+
+    python scripts/dense_index_report.py --vectors 200000 --queries 500
+    python scripts/dense_index_report.py --from-index
+"""
+import os
+import sys
+import time
+import argparse
+import tempfile
+
+import numpy as np
+
+# Add root to path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from src.dense_index import (
+    build_index, configure, vectors_of, rescore, ExactVectors, IVF_NPROBE, HNSW_EF_SEARCH, PQ_M, PQ_MIN_TRAIN,
+    RESCORE_FACTOR,
+)
+from src.index_store import current_paths
+
+
+def load_vectors(args) -> np.ndarray:
+    if args.from_index:
+        import faiss
+        paths = current_paths("data")
+        if paths is None:
+            sys.exit("No published index under data/ (run an ingestion first).")
+        index = faiss.read_index(os.path.join(paths["faiss"], "index.faiss"))
+        print(f"Loaded {index.ntotal} vectors from {paths['faiss']}")
+        return vectors_of(index)
+    rng = np.random.default_rng(0)
+    centers = rng.standard_normal((max(1, args.vectors // 100), args.dim)).astype(np.float32)
+    vectors = centers[rng.integers(0, len(centers), args.vectors)]
+    vectors += rng.normal(0, 0.5, vectors.shape).astype(np.float32)
+    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+    print(f"Generated {args.vectors} clustered unit vectors of dim {args.dim}")
+    return vectors
+
+
+def timed_search(index, queries: np.ndarray, k: int):
+    # One query at a time, like hybrid_search
+    start = time.perf_counter()
+    results = np.vstack([index.search(queries[i:i + 1], k)[1] for i in range(len(queries))])
+    return results, (time.perf_counter() - start) / len(queries) * 1000
+
+
+def timed_rescored_search(index, exact: ExactVectors, queries: np.ndarray, k: int):
+    start = time.perf_counter()
+    results = []
+    for query in queries:
+        positions = index.search(query[None, :], k * RESCORE_FACTOR)[1][0]
+        results.append(rescore(exact, query, positions[positions >= 0])[:k])
+    return np.vstack(results), (time.perf_counter() - start) / len(queries) * 1000
+
+
+def bytes_per_vector(index) -> float:
+    import faiss
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "index.faiss")
+        faiss.write_index(index, path)
+        return os.path.getsize(path) / max(1, index.ntotal)
+
+
+def recall(results: np.ndarray, truth: np.ndarray) -> float:
+    hits = sum(len(set(r) & set(t)) for r, t in zip(results, truth))
+    return hits / truth.size
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--from-index", action="store_true", help="use the vectors of the published index")
+    parser.add_argument("--vectors", type=int, default=100_000)
+    parser.add_argument("--dim", type=int, default=384)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=25)
+    args = parser.parse_args()
+
+    vectors = load_vectors(args)
+    rng = np.random.default_rng(1)
+    # Queries: perturbed corpus vectors, so true neighbours are meaningful
+    picks = rng.choice(len(vectors), min(args.queries, len(vectors)), replace=False)
+    queries = vectors[picks] + rng.normal(0, 0.05, (len(picks), vectors.shape[1])).astype(np.float32)
+
+    rows = []
+    start = time.perf_counter()
+    flat = build_index("flat", vectors, vectors.shape[1])
+    build_s = time.perf_counter() - start
+    truth, flat_ms = timed_search(flat, queries, args.k)
+    rows.append(("flat", "-", build_s, 1.0, flat_ms))
+
+    for kind, knob, values in (
+        ("hnsw", "efSearch", sorted({16, 32, HNSW_EF_SEARCH, 128, 256})),
+        ("ivf", "nprobe", sorted({1, 4, IVF_NPROBE, 64, 128})),
+    ):
+        start = time.perf_counter()
+        index = build_index(kind, vectors, vectors.shape[1])
+        build_s = time.perf_counter() - start
+        for value in values:
+            if kind == "hnsw":
+                configure(index, ef_search=value)
+            else:
+                configure(index, nprobe=value)
+            results, ms = timed_search(index, queries, args.k)
+            rows.append((kind, f"{knob}={value}", build_s, recall(results, truth), ms))
+
+    print(f"\n{'index':<6} {'setting':<14} {'build s':>8} {f'recall@{args.k}':>10} {'ms/query':>9} {'speedup':>8}")
+    for kind, setting, build_s, rec, ms in rows:
+        print(f"{kind:<6} {setting:<14} {build_s:>8.2f} {rec:>10.4f} {ms:>9.3f} {flat_ms / ms:>7.1f}x")
+
+    storages = ["float32", "fp16", "sq8"]
+    if vectors.shape[1] % PQ_M == 0 and len(vectors) >= PQ_MIN_TRAIN:
+        storages.append("pq")
+    exact = ExactVectors(vectors.shape[1], [vectors])
+    print(f"\n{'storage':<8} {'bytes/vec':>9} {f'recall@{args.k}':>10} {'ms/query':>9} {f'rescored x{RESCORE_FACTOR}':>13} {'ms/query':>9}")
+    for storage in storages:
+        index = build_index("flat", vectors, vectors.shape[1], storage)
+        results, ms = timed_search(index, queries, args.k)
+        rescored, rescored_ms = timed_rescored_search(index, exact, queries, args.k)
+        print(f"{storage:<8} {bytes_per_vector(index):>9.1f} {recall(results, truth):>10.4f} {ms:>9.3f} "
+              f"{recall(rescored, truth):>13.4f} {rescored_ms:>9.3f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,87 @@
+"""
+Import-time report: what importing the app's entry modules costs.
+
+Imports each module in a fresh interpreter under `python -X importtime` and
+prints the total import time, the heaviest top-level packages (by their own
+import time, so nested imports are not counted twice) and which of the known
+heavy stacks (torch, transformers, onnxruntime, ...) got pulled in. Importing
+src.ingest should stay cheap: models and indexes load on first use or in
+RAGPipeline.warm_up().
+
+    python scripts/import_time_report.py
+    python scripts/import_time_report.py src.ingest --top 20 --forbid torch,sentence_transformers
+
+Exits non-zero if a module fails to import or imports a --forbid package.
+"""
+import os
+import sys
+import argparse
+import subprocess
+from collections import defaultdict
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+
+DEFAULT_MODULES = ["src.ingest", "src.agent", "server"]
+# Stacks that cost seconds and hundreds of MB when imported
+HEAVY_PACKAGES = [
+    "torch", "transformers", "sentence_transformers", "onnxruntime", "tokenizers", "faiss",
+    "langchain_community", "langchain_openai", "openai", "unstructured", "pypdf", "docx2txt",
+    "streamlit", "scipy", "sklearn", "pandas",
+]
+
+
+def import_times(module: str):
+    """{top-level package: (self seconds, modules imported)} for importing `module`, or None with the error."""
+    out = subprocess.run([sys.executable, "-X", "importtime", "-c", f"import {module}"],
+                         capture_output=True, text=True, cwd=ROOT)
+    packages = defaultdict(lambda: [0.0, 0])
+    errors = []
+    for line in out.stderr.splitlines():
+        if not line.startswith("import time:"):
+            errors.append(line)
+            continue
+        fields = line[len("import time:"):].split("|")
+        if len(fields) != 3 or not fields[0].strip().isdigit():
+            continue  # header line
+        name = fields[2].strip().split(".")[0]
+        packages[name][0] += int(fields[0]) / 1e6
+        packages[name][1] += 1
+    if out.returncode:
+        return None, "\n".join(errors[-5:])
+    return {name: tuple(value) for name, value in packages.items()}, None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("modules", nargs="*", default=DEFAULT_MODULES)
+    parser.add_argument("--top", type=int, default=15, help="heaviest packages listed per module")
+    parser.add_argument("--forbid", default="", help="comma-separated packages that must not be imported")
+    args = parser.parse_args()
+    forbidden = [name for name in args.forbid.split(",") if name]
+
+    failed = False
+    for module in args.modules:
+        packages, error = import_times(module)
+        if packages is None:
+            print(f"\n{module}: import failed\n{error}")
+            failed = True
+            continue
+        total = sum(seconds for seconds, _ in packages.values())
+        print(f"\n{module}: {total:.2f}s, {sum(count for _, count in packages.values())} modules")
+        print(f"  {'package':<28} {'seconds':>8} {'share':>6} {'modules':>8}")
+        heaviest = sorted(packages.items(), key=lambda item: -item[1][0])[:args.top]
+        for name, (seconds, count) in heaviest:
+            print(f"  {name:<28} {seconds:>8.3f} {seconds / total:>6.1%} {count:>8}")
+        heavy = [name for name in HEAVY_PACKAGES if name in packages]
+        print(f"  heavy stacks imported: {', '.join(heavy) if heavy else 'none'}")
+        hit = [name for name in forbidden if name in packages]
+        if hit:
+            print(f"  FORBIDDEN: {', '.join(hit)}")
+            failed = True
+
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
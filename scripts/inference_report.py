@@ -0,0 +1,167 @@
+"""
+Parity and CPU throughput of the inference backends in src/inference.py.
+
+Loads the embedder and cross-encoder on PyTorch and on ONNX Runtime int8
+(exporting the ONNX models on first run), then prints:
+  - parity: cosine between the backends' embeddings, top-10 neighbour
+    overlap, and cross-encoder score correlation / top-5 agreement
+  - throughput per core (both backends pinned to --threads threads): single
+    query embeddings, batched chunk embeddings, and 25-pair rerank requests
+  - import footprint: seconds and peak RSS to import each backend's stack
+    in a fresh interpreter
+  - batching: padding efficiency (real / padded tokens) and chunks/s with
+    fixed EMBED_BATCH_SIZE batches in input order vs token-budget length buckets
+
+Texts come from the chunk store when an index is published, otherwise a
+small built-in sample is used. Exits non-zero if parity is below threshold.
+
+    python scripts/inference_report.py --texts 500 --threads 1
+"""
+import os
+import sys
+import time
+import argparse
+import subprocess
+
+import numpy as np
+
+# Add root to path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+SAMPLE_TEXTS = [
+    "The quarterly report shows revenue growth in all regions.",
+    "Employees may carry over up to five days of unused leave.",
+    "Reset your password from the account settings page.",
+    "The warranty covers manufacturing defects for two years.",
+    "Expense claims must be submitted within thirty days.",
+    "The API rate limit is one hundred requests per minute.",
+    "Backups run nightly and are kept for ninety days.",
+    "Contact the help desk to request access to the VPN.",
+]
+
+IMPORTS = {
+    "torch": "import torch, sentence_transformers",
+    "onnx": "import onnxruntime, tokenizers",
+}
+
+
+def load_texts(n: int):
+    from src.chunk_store import ChunkStore
+    from src.index_store import current_paths
+    if current_paths("data") is not None:
+        store = ChunkStore("data")
+        rows = store._conn().execute("SELECT text FROM chunks WHERE removed_in IS NULL LIMIT ?", (n,)).fetchall()
+        if rows:
+            return [text for (text,) in rows]
+    return (SAMPLE_TEXTS * (n // len(SAMPLE_TEXTS) + 1))[:n]
+
+
+def per_second(fn, items: int, repeat: int = 3) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - start)
+    return items / best
+
+
+# Peak RSS of the child itself (Linux VmHWM; ru_maxrss can carry over the parent's peak through fork)
+_PEAK_RSS_KB = ("next((int(line.split()[1]) for line in open('/proc/self/status') if line.startswith('VmHWM')), 0)"
+                " if sys.platform.startswith('linux') else resource.getrusage(resource.RUSAGE_SELF).ru_maxrss"
+                " // (1024 if sys.platform == 'darwin' else 1)")
+
+
+def import_footprint(statement: str):
+    """Seconds and peak MB to run an import statement in a fresh interpreter (None if it fails)."""
+    code = (f"import sys, time, resource; t = time.perf_counter(); {statement}; "
+            f"print(time.perf_counter() - t, {_PEAK_RSS_KB})")
+    out = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True)
+    if out.returncode:
+        return None
+    seconds, rss_kb = out.stdout.split()
+    return float(seconds), int(rss_kb) / 1024
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--texts", type=int, default=256)
+    parser.add_argument("--queries", type=int, default=64)
+    parser.add_argument("--threads", type=int, default=1, help="threads per backend (per-core throughput at 1)")
+    args = parser.parse_args()
+
+    # Both backends read their thread count at load time
+    os.environ["RAG_ONNX_THREADS"] = str(args.threads)
+    import torch
+    torch.set_num_threads(args.threads)
+    from src.inference import load_models, parity, parity_passed, token_lengths, EMBED_BATCH_SIZE
+    from src.batching import BATCH_TOKEN_BUDGET, padding_efficiency, token_buckets
+
+    texts = load_texts(args.texts)
+    queries = [" ".join(text.split()[:8]) for text in texts[:args.queries]]
+    pairs = [(query, text) for query in queries[:8] for text in texts[:25]]
+    print(f"{len(texts)} texts, {len(queries)} queries, {args.threads} thread(s)")
+
+    backends = {name: load_models(name) for name in ("torch", "onnx")}
+    outputs = {}
+    for name, (embeddings, cross_encoder) in backends.items():
+        outputs[name] = (
+            np.array(embeddings.embed_documents(texts), dtype=np.float32),
+            np.array(embeddings.embed_documents(queries), dtype=np.float32),
+            np.asarray(cross_encoder.predict(pairs), dtype=np.float32),
+        )
+
+    # Parity: ONNX against PyTorch
+    (ref_docs, ref_queries, ref_scores), (docs, query_vectors, scores) = outputs["torch"], outputs["onnx"]
+    embed_parity = parity(ref_docs, docs)
+    score_parity = parity(ref_scores, scores)
+    ref_top = np.argsort(-(ref_queries @ ref_docs.T), axis=1)[:, :10]
+    top = np.argsort(-(query_vectors @ docs.T), axis=1)[:, :10]
+    overlap = np.mean([len(set(a) & set(b)) / len(a) for a, b in zip(ref_top, top)])
+    agree = np.mean([
+        len(set(np.argsort(-ref_scores[i:i + 25])[:5]) & set(np.argsort(-scores[i:i + 25])[:5])) / 5
+        for i in range(0, len(pairs), 25)
+    ])
+    print("\nParity (onnx vs torch)")
+    print(f"  embeddings      min cosine {embed_parity['min_cosine']:.4f}  mean {embed_parity['mean_cosine']:.4f}"
+          f"  neighbour overlap@10 {overlap:.3f}")
+    print(f"  cross-encoder   pearson {score_parity['pearson']:.4f}  max |error| {score_parity['max_abs_error']:.4f}"
+          f"  top-5 agreement {agree:.3f}")
+
+    # Throughput
+    print(f"\n{'backend':<8} {'queries/s':>10} {'chunks/s':>10} {'reranks/s':>10} {'import s':>9} {'import MB':>10}")
+    rates = {}
+    for name, (embeddings, cross_encoder) in backends.items():
+        rates[name] = (
+            per_second(lambda: [embeddings.embed_query(q) for q in queries], len(queries)),
+            per_second(lambda: embeddings.embed_documents(texts), len(texts)),
+            per_second(lambda: cross_encoder.predict(pairs, batch_size=32), len(pairs) / 25),
+        )
+        footprint = import_footprint(IMPORTS[name])
+        seconds, mb = footprint if footprint else (float("nan"), float("nan"))
+        q, c, r = rates[name]
+        print(f"{name:<8} {q:>10.1f} {c:>10.1f} {r:>10.1f} {seconds:>9.2f} {mb:>10.0f}")
+    speedup = [o / t for o, t in zip(rates["onnx"], rates["torch"])]
+    print(f"{'speedup':<8} {speedup[0]:>9.2f}x {speedup[1]:>9.2f}x {speedup[2]:>9.2f}x")
+
+    # Batching: fixed-count batches in input order vs token-budget buckets
+    embedder = backends["torch"][0].model
+    lengths = token_lengths(embedder.tokenizer, texts, embedder.max_seq_length)
+    fixed = [range(start, min(start + EMBED_BATCH_SIZE, len(texts))) for start in range(0, len(texts), EMBED_BATCH_SIZE)]
+    efficiency = {0: padding_efficiency(lengths, fixed),
+                  BATCH_TOKEN_BUDGET: padding_efficiency(lengths, token_buckets(lengths, BATCH_TOKEN_BUDGET))}
+    print(f"\n{'batching':<22} {'padding eff':>11} " + " ".join(f"{f'{name} chunks/s':>15}" for name in backends))
+    for budget, label in ((0, f"fixed {EMBED_BATCH_SIZE}, input order"), (BATCH_TOKEN_BUDGET, f"{BATCH_TOKEN_BUDGET}-token buckets")):
+        chunk_rates = []
+        for embeddings, _ in backends.values():
+            embeddings.token_budget = budget
+            chunk_rates.append(per_second(lambda: embeddings.encode(texts), len(texts)))
+            embeddings.token_budget = BATCH_TOKEN_BUDGET
+        print(f"{label:<22} {efficiency[budget]:>11.3f} " + " ".join(f"{rate:>15.1f}" for rate in chunk_rates))
+    print("(sentence-transformers also sorts each encode() call by length, so torch's fixed batches are less padded)")
+
+    if not (parity_passed(embed_parity) and parity_passed(score_parity)):
+        sys.exit("ONNX backend is below the parity thresholds.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,124 @@
+"""
+Quality-vs-latency report for the cascaded reranker in src/rerank.py.
+
+Fuses candidates once per query against the published index, then reranks
+them under a sweep of settings: the fusion score ratio that cuts rerank depth
+(0 = always k_fusion candidates) and the passage token budget (0 = whole
+chunks). For each setting it prints the mean number of cross-encoder pairs
+per query, p50/p99 rerank latency per query with a cold score cache and with
+a warm one (the same questions asked again), top-k overlap with the full
+baseline (ratio 0, whole chunks) and, for sampled queries, how often the
+chunk a query was drawn from is in the top k.
+
+Queries are read from --queries (one per line) or sampled from indexed
+chunks (a span of words from a random chunk, which is then the target).
+
+    python scripts/rerank_report.py --sample 200
+    python scripts/rerank_report.py --queries questions.txt --k-final 5
+"""
+import os
+import sys
+import time
+import random
+import argparse
+
+import numpy as np
+
+# Add root to path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from src.ingest import rag
+
+
+def sample_queries(n: int, words: int):
+    """(query, target chunk ID) pairs: a run of words from random indexed chunks."""
+    rng = random.Random(0)
+    chunk_ids = rag.snapshot.chunk_ids().tolist()
+    queries = []
+    for chunk_id in rng.sample(chunk_ids, min(n, len(chunk_ids))):
+        doc = rag.chunk_store.get([chunk_id])[0]
+        tokens = doc.page_content.split() if doc is not None else []
+        if len(tokens) < words:
+            continue
+        start = rng.randrange(len(tokens) - words + 1)
+        queries.append((" ".join(tokens[start:start + words]), chunk_id))
+    return queries
+
+
+def run(queries, fused, k_final: int):
+    """Rerank every query on its own (like hybrid_search); returns results, pairs/query and per-query ms."""
+    model = rag.reranker.model
+    predict = model.predict
+    pairs = [0]
+
+    def counting_predict(batch, **kwargs):
+        pairs[0] += len(batch)
+        return predict(batch, **kwargs)
+
+    model.predict = counting_predict
+    try:
+        results, times = [], []
+        for (query, _), (candidates, scores) in zip(queries, fused):
+            start = time.perf_counter()
+            docs = rag.reranker.rerank([query], [candidates], [scores], k_final)[0]
+            times.append((time.perf_counter() - start) * 1000)
+            results.append([doc.metadata["chunk_id"] for doc in docs])
+    finally:
+        model.predict = predict
+    return results, pairs[0] / len(queries), np.array(times)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--queries", help="file with one query per line")
+    parser.add_argument("--sample", type=int, default=100, help="queries sampled from chunks without --queries")
+    parser.add_argument("--words", type=int, default=8, help="words per sampled query")
+    parser.add_argument("--k-fusion", type=int, default=25)
+    parser.add_argument("--k-final", type=int, default=5)
+    args = parser.parse_args()
+
+    snapshot = rag.snapshot
+    if not snapshot.vectorstore:
+        sys.exit("No published index under data/ (run an ingestion first).")
+    if args.queries:
+        with open(args.queries) as f:
+            queries = [(line.strip(), None) for line in f if line.strip()]
+    else:
+        queries = sample_queries(args.sample, args.words)
+    print(f"{len(queries)} queries, k_fusion={args.k_fusion}, k_final={args.k_final}")
+
+    texts = [query for query, _ in queries]
+    dense = rag._dense_leg(snapshot, texts, args.k_fusion)
+    sparse = rag._sparse_leg(snapshot, texts, args.k_fusion)
+    candidates, scores = rag._fuse(dense, sparse, args.k_fusion)
+    fused = list(zip(candidates, scores))
+
+    reranker = rag.reranker
+    defaults = (reranker.score_ratio, reranker.passage_tokens)
+    rows = []
+    baseline = None
+    for ratio in sorted({0.0, 0.5, 0.6, 0.7, defaults[0]}):
+        for tokens in sorted({0, 256, 128, 64, defaults[1]}, key=lambda t: -t if t else -10**9):
+            reranker.score_ratio, reranker.passage_tokens = ratio, tokens
+            reranker.cache.clear()
+            results, pairs, cold = run(queries, fused, args.k_final)
+            _, _, warm = run(queries, fused, args.k_final)
+            if baseline is None:
+                baseline = results
+            overlap = np.mean([len(set(r) & set(b)) / max(1, len(b)) for r, b in zip(results, baseline)])
+            targets = [(r, target) for r, (_, target) in zip(results, queries) if target is not None]
+            hit = np.mean([target in r for r, target in targets]) if targets else float("nan")
+            rows.append((ratio, tokens, pairs, cold, warm, overlap, hit))
+    reranker.score_ratio, reranker.passage_tokens = defaults
+    reranker.cache.clear()
+
+    print(f"\n{'ratio':>5} {'tokens':>6} {'pairs/q':>8} {'p50 ms':>7} {'p99 ms':>7} {'warm p50':>8} "
+          f"{f'overlap@{args.k_final}':>10} {f'hit@{args.k_final}':>6}")
+    for ratio, tokens, pairs, cold, warm, overlap, hit in rows:
+        marker = "  <- default" if (ratio, tokens) == defaults else ""
+        print(f"{ratio:>5.2f} {tokens or 'all':>6} {pairs:>8.1f} {np.percentile(cold, 50):>7.2f} "
+              f"{np.percentile(cold, 99):>7.2f} {np.percentile(warm, 50):>8.2f} {overlap:>10.3f} {hit:>6.3f}{marker}")
+
+
+if __name__ == "__main__":
+    main()
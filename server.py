@@ -1,9 +1,9 @@
 import os
-import shutil
-import json
-from typing import List
+import asyncio
+from contextlib import asynccontextmanager
+from typing import Optional
 
-from fastapi import FastAPI, UploadFile, WebSocket, WebSocketDisconnect, File, HTTPException
+from fastapi import FastAPI, Request, WebSocket, WebSocketDisconnect, HTTPException
 from fastapi.staticfiles import StaticFiles
 from fastapi.responses import JSONResponse
 from dotenv import load_dotenv
@@ -13,40 +13,176 @@ load_dotenv()
 
 # Import Project Logic
 from src.ingest import rag
+from src.jobs import IngestJobManager
+from src.uploads import MAX_REQUEST_BYTES, InvalidUpload, UploadTooLarge, make_spool_dir, remove_spool_dir, spool_multipart
 from src.agent import graph
 from langchain_core.messages import HumanMessage
 
-app = FastAPI()
+# Background ingestion jobs and the chat sockets that receive their progress
+jobs = IngestJobManager(rag)
+chat_sockets = set()
+
+async def broadcast(message: dict):
+    for websocket in list(chat_sockets):
+        try:
+            await websocket.send_json(message)
+        except Exception:
+            chat_sockets.discard(websocket)
+
+def log_failure(name: str):
+    """Done-callback for background startup work: report its exception instead of dropping it."""
+    def callback(future: asyncio.Future):
+        if not future.cancelled() and future.exception() is not None:
+            print(f"{name} failed: {future.exception()!r}")
+    return callback
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    loop = asyncio.get_running_loop()
+    # Pre-spawn ingestion workers off the event loop so the first upload is fast, and
+    # load indices and models in the background (/ready reports 503 until they are hot)
+    app.state.warm_ups = {
+        "Worker warm-up": loop.run_in_executor(None, rag.warm_up_workers),
+        "Pipeline warm-up": loop.run_in_executor(None, rag.warm_up),
+    }
+    for name, future in app.state.warm_ups.items():
+        future.add_done_callback(log_failure(name))
+
+    # Job progress is reported from the job thread; hop onto the loop to send it
+    def push_progress(job: dict):
+        asyncio.run_coroutine_threadsafe(broadcast({"type": "ingest", "job": job}), loop)
+    jobs.subscribe(push_progress)
+    yield
+    jobs.unsubscribe(push_progress)
+    # Let the running job finish, then tear down the persistent worker pool with the app
+    jobs.shutdown()
+    rag.shutdown()
+
+app = FastAPI(lifespan=lifespan)
 
 # --- API & WebSocket Routes (Defined FIRST) ---
 
 @app.post("/upload")
-async def upload_files(files: List[UploadFile] = File(...)):
+async def upload_files(request: Request):
     """
-    Handle file uploads for RAG ingestion.
+    Handle file uploads for RAG ingestion (multipart/form-data, `files` fields).
+    Each request spools into its own directory, hashing files as the body
+    streams in and rejecting oversized files mid-stream; files already indexed
+    with the same content are dropped before parsing. The rest are queued as a
+    background job whose ID is returned for polling at /jobs/{job_id}
+    (progress is also pushed over /ws/chat).
     """
-    temp_dir = "temp_uploads"
-    os.makedirs(temp_dir, exist_ok=True)
-    
+    try:
+        declared = int(request.headers.get("content-length") or 0)
+    except ValueError:
+        return JSONResponse({"status": "error", "message": "Invalid Content-Length header"}, status_code=400)
+    if declared > MAX_REQUEST_BYTES:
+        return JSONResponse({"status": "error", "message": "Upload exceeds the request size limit"}, status_code=413)
+
+    spool_dir = await asyncio.to_thread(make_spool_dir)
     file_paths = []
+    digests = {}
+    skipped = []
     try:
-        # Save uploaded files
-        for file in files:
-            path = os.path.join(temp_dir, file.filename)
-            with open(path, "wb") as f:
-                shutil.copyfileobj(file.file, f)
+        # Parsed from the raw body stream: limits hold even without a Content-Length
+        spooled = await spool_multipart(request, spool_dir)
+        if not spooled:
+            raise InvalidUpload("No files uploaded")
+        # Off the event loop: before warm-up finishes this read loads (or waits for) the indices
+        manifest = (await rag.asnapshot()).manifest
+        for path, digest, size in spooled:
+            # Same name, same content as what is indexed: nothing to do
+            entry = manifest.get(os.path.basename(path))
+            if entry and entry["hash"] == digest:
+                await asyncio.to_thread(os.remove, path)
+                skipped.append(os.path.basename(path))
+                continue
             file_paths.append(path)
-        
-        # Invoke Ingestion Pipeline (Synchronous call)
-        rag.process_documents(file_paths)
-        
-        return JSONResponse({"status": "success", "message": f"Successfully ingested {len(files)} files."})
+            digests[path] = digest
+    except UploadTooLarge as e:
+        await asyncio.to_thread(remove_spool_dir, spool_dir)
+        return JSONResponse({"status": "error", "message": str(e)}, status_code=413)
+    except ValueError as e:
+        # InvalidUpload, unsafe filenames and malformed multipart bodies
+        await asyncio.to_thread(remove_spool_dir, spool_dir)
+        return JSONResponse({"status": "error", "message": str(e)}, status_code=400)
     except Exception as e:
+        await asyncio.to_thread(remove_spool_dir, spool_dir)
         return JSONResponse({"status": "error", "message": str(e)}, status_code=500)
-    finally:
-        # Cleanup
-        if os.path.exists(temp_dir):
-            shutil.rmtree(temp_dir)
+
+    if not file_paths:
+        await asyncio.to_thread(remove_spool_dir, spool_dir)
+        return JSONResponse({
+            "status": "success",
+            "message": f"All {len(skipped)} files are already indexed.",
+            "skipped": skipped,
+        })
+
+    # The spooled copies are only needed until the job has indexed them
+    job = jobs.submit(
+        file_paths,
+        [os.path.basename(p) for p in file_paths],
+        digests=digests,
+        on_finish=lambda job: remove_spool_dir(spool_dir),
+    )
+    return JSONResponse({
+        "status": "accepted",
+        "message": f"Queued {len(file_paths)} files for ingestion ({len(skipped)} unchanged).",
+        "job_id": job.id,
+        "skipped": skipped,
+    }, status_code=202)
+
+@app.get("/jobs/{job_id}")
+async def get_job(job_id: str):
+    """Status, per-file progress and chunk counts of an ingestion job."""
+    job = jobs.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Unknown job")
+    return job.to_dict()
+
+@app.delete("/documents/{source:path}")
+async def delete_document(source: str):
+    """Remove a source file's chunks from the dense and sparse indexes."""
+    deleted = await asyncio.to_thread(rag.delete_source, source)
+    if not deleted:
+        raise HTTPException(status_code=404, detail="Unknown source")
+    return {"status": "success", "source": source, "deleted_chunks": deleted}
+
+@app.post("/compact")
+async def compact_indexes():
+    """Start a background compaction that reclaims the space of deleted chunks."""
+    snapshot = await rag.asnapshot()
+    started = rag.compact_in_background()
+    return JSONResponse({
+        "status": "accepted" if started else "running",
+        "tombstones": len(snapshot.tombstones),
+    }, status_code=202)
+
+@app.get("/index/versions")
+async def list_index_versions():
+    """Published index version and the older ones kept for rollback."""
+    snapshot = await rag.asnapshot()
+    return {"current": snapshot.version, "available": rag.versions.versions()}
+
+@app.post("/index/rollback")
+async def rollback_index(version: Optional[int] = None):
+    """Make a kept older index version current (default: the previous one)."""
+    try:
+        current = await asyncio.to_thread(rag.rollback, version)
+    except ValueError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    return {"status": "success", "current": current}
+
+@app.get("/cache/stats")
+async def cache_stats():
+    """Query embedding and search result cache counters."""
+    return rag.cache_stats()
+
+@app.get("/ready")
+async def ready():
+    """Readiness probe: 200 once the indices and models are loaded, 503 while warming up (with the error if warm-up failed)."""
+    status = rag.readiness()
+    return JSONResponse(status, status_code=200 if status["ready"] else 503)
 
 def get_memory_snapshot():
     """Read current memory state from markdown files."""
@@ -61,6 +197,7 @@ def get_memory_snapshot():
 @app.websocket("/ws/chat")
 async def websocket_endpoint(websocket: WebSocket):
     await websocket.accept()
+    chat_sockets.add(websocket)
     
     # Send initial memory state on connection
     await websocket.send_json({"type": "memory", "data": get_memory_snapshot()})
@@ -118,6 +255,8 @@ async def websocket_endpoint(websocket: WebSocket):
             
     except WebSocketDisconnect:
         print("Client disconnected")
+    finally:
+        chat_sockets.discard(websocket)
 
 # --- Static Files (Defined LAST to avoid masking routes) ---
 app.mount("/", StaticFiles(directory="static", html=True), name="static")
@@ -11,6 +11,7 @@ from langgraph.store.memory import InMemoryStore
 
 from src.memory import save_memory, read_memory_tool
 from src.ingest import rag
+from src.filters import ChunkFilter
 from src.tools.sandbox import python_interpreter
 from src.tools.weather import analyze_weather
 
@@ -108,16 +109,10 @@ def should_continue(state: AgentState) -> Literal["tools", "__end__"]:
 
 # --- 4. Tool Wrapper ---
 # Redefine retrieve_docs to use the Unified Ingest module (since I overwrote agent.py plan)
-from langchain_core.tools import tool
+from langchain_core.tools import StructuredTool
 import os
 
-@tool
-def retrieve_docs(query: str) -> str:
-    """
-    Search the knowledge base for information. 
-    Use this tool when the user asks questions about uploaded documents or specific knowledge.
-    """
-    docs = rag.hybrid_search(query)
+def _format_docs(docs) -> str:
     if not docs:
         return "No relevant information found in the knowledge base."
     
@@ -131,6 +126,35 @@ def retrieve_docs(query: str) -> str:
         result += f"--- Document {i+1} ---\nMetadata provided: [{citation_meta}]\nContent:\n{doc.page_content}\n\n"
     return result
 
+class RetrieveDocsInput(BaseModel):
+    query: str = Field(description="What to search the knowledge base for.")
+    source: Optional[str] = Field(
+        default=None,
+        description="Only search this uploaded file (file name, '*' wildcards allowed, e.g. 'handbook.pdf' or '*.md').",
+    )
+
+def _source_filter(source: Optional[str]) -> Optional[ChunkFilter]:
+    return ChunkFilter(sources=[source]) if source else None
+
+def _retrieve_docs(query: str, source: Optional[str] = None) -> str:
+    return _format_docs(rag.hybrid_search(query, chunk_filter=_source_filter(source)))
+
+async def _aretrieve_docs(query: str, source: Optional[str] = None) -> str:
+    # Async graph runs (the FastAPI websocket) search off the event loop
+    return _format_docs(await rag.ahybrid_search(query, chunk_filter=_source_filter(source)))
+
+retrieve_docs = StructuredTool.from_function(
+    func=_retrieve_docs,
+    coroutine=_aretrieve_docs,
+    name="retrieve_docs",
+    description=(
+        "Search the knowledge base for information. "
+        "Use this tool when the user asks questions about uploaded documents or specific knowledge. "
+        "Pass `source` when the question is about one particular file."
+    ),
+    args_schema=RetrieveDocsInput,
+)
+
 # Update tools list
 tools = [retrieve_docs, save_memory, read_memory_tool, python_interpreter, analyze_weather]
 tool_node = ToolNode(tools)
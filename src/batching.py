@@ -0,0 +1,50 @@
+# src/batching.py
+import os
+from typing import Callable, List, Sequence
+
+import numpy as np
+
+# Model calls are sized by padded tokens (inputs x longest input) instead of a
+# fixed count: short queries and tail chunks go many to a call, full-length
+# chunks few, and inputs of similar length share a call so little is padding.
+BATCH_TOKEN_BUDGET = int(os.getenv("RAG_BATCH_TOKENS", "4096"))
+# Upper bound on inputs per call, however short they are
+MAX_BATCH_SIZE = 256
+
+
+def token_buckets(lengths: Sequence[int], budget: int = BATCH_TOKEN_BUDGET,
+                  max_batch: int = MAX_BATCH_SIZE) -> List[np.ndarray]:
+    """
+    Input positions grouped into model calls: sorted by token length, longest
+    first, and cut so that each call's size x its longest input stays within
+    `budget` (at least one input per call, at most `max_batch`).
+    """
+    lengths = np.asarray(lengths, dtype=np.int64)
+    order = np.argsort(-lengths, kind="stable")
+    buckets = []
+    start = 0
+    while start < len(order):
+        # Sorted descending, so the first input of a bucket is its longest
+        size = max(1, min(max_batch, budget // max(1, int(lengths[order[start]]))))
+        buckets.append(order[start:start + size])
+        start += size
+    return buckets
+
+
+def run_bucketed(fn: Callable[[list], np.ndarray], items: Sequence, lengths: Sequence[int],
+                 budget: int = BATCH_TOKEN_BUDGET, max_batch: int = MAX_BATCH_SIZE) -> np.ndarray:
+    """`fn` over token-budget buckets of `items`, with output rows put back in input order."""
+    out = None
+    for bucket in token_buckets(lengths, budget, max_batch):
+        result = np.asarray(fn([items[i] for i in bucket]))
+        if out is None:
+            out = np.empty((len(items),) + result.shape[1:], dtype=result.dtype)
+        out[bucket] = result
+    return out if out is not None else np.empty(0, dtype=np.float32)
+
+
+def padding_efficiency(lengths: Sequence[int], batches: List[Sequence[int]]) -> float:
+    """Real tokens / padded tokens computed for the given batches of input positions."""
+    lengths = np.asarray(lengths, dtype=np.int64)
+    padded = sum(len(batch) * int(lengths[np.asarray(batch)].max()) for batch in batches if len(batch))
+    return float(lengths.sum() / padded) if padded else 1.0
@@ -0,0 +1,198 @@
+# src/chunk_store.py
+import os
+import json
+import time
+import sqlite3
+import threading
+from typing import List, Optional, Sequence
+
+import numpy as np
+from langchain_core.documents import Document
+
+from src.filters import ChunkFilter
+from src.query_cache import LRUCache
+
+CHUNK_STORE_FILENAME = "chunks.sqlite"
+# Documents kept decoded in RAM for repeated hits
+HOT_CHUNK_CACHE_SIZE = 4096
+# SQLite caps bound parameters per statement; look IDs up in slices of this size
+LOOKUP_BATCH = 500
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS chunks (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    text TEXT NOT NULL,
+    metadata TEXT NOT NULL,
+    added_in INTEGER NOT NULL,
+    removed_in INTEGER,
+    source TEXT,
+    page INTEGER,
+    ingested_at REAL
+);
+"""
+# Filterable columns, added to stores created before metadata filtering
+# (backfilled from the metadata JSON; the ingestion time of those rows is unknown)
+_FILTER_COLUMNS = (("source", "TEXT", "json_extract(metadata, '$.source')"),
+                   ("page", "INTEGER", "json_extract(metadata, '$.page')"),
+                   ("ingested_at", "REAL", "NULL"))
+_INDEXES = """
+CREATE INDEX IF NOT EXISTS chunks_added_in ON chunks (added_in);
+CREATE INDEX IF NOT EXISTS chunks_removed_in ON chunks (removed_in);
+CREATE INDEX IF NOT EXISTS chunks_source ON chunks (source);
+"""
+# PRAGMA user_version of the current layout: 1 = the source column holds the
+# manifest key (path relative to the ingest root), not the bare file name
+SCHEMA_VERSION = 1
+
+
+class ChunkStore:
+    """
+    Chunk text and metadata on disk, keyed by integer chunk ID.
+    The dense and sparse indexes hold only these IDs; text is read back for
+    the final candidates of a search, with an LRU of hot chunks in front.
+    IDs are never reused (AUTOINCREMENT), so one store serves every index
+    version: rows record the version that added them and, once compaction
+    drops them, the version that removed them, and are purged when no kept
+    version can reference them any more.
+    """
+
+    def __init__(self, data_dir: str, cache_size: int = HOT_CHUNK_CACHE_SIZE):
+        self.path = os.path.join(data_dir, CHUNK_STORE_FILENAME)
+        self.cache = LRUCache(cache_size)
+        self._local = threading.local()
+        conn = self._conn()
+        conn.executescript(_SCHEMA)
+        columns = {row[1] for row in conn.execute("PRAGMA table_info(chunks)")}
+        for name, kind, backfill in _FILTER_COLUMNS:
+            if name not in columns:
+                conn.execute(f"ALTER TABLE chunks ADD COLUMN {name} {kind}")
+                conn.execute(f"UPDATE chunks SET {name} = {backfill}")
+        if conn.execute("PRAGMA user_version").fetchone()[0] < 1:
+            self._migrate_source_keys(conn)
+        conn.executescript(_INDEXES)
+        conn.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+        conn.commit()
+
+    @staticmethod
+    def _migrate_source_keys(conn: sqlite3.Connection):
+        """
+        Rewrite the source column of rows written as bare file names with the
+        chunk's metadata source, which ingestion sets to the manifest key.
+        Absolute paths (chunks from before manifest keys) keep their file name.
+        """
+        rows = conn.execute("SELECT id, source, json_extract(metadata, '$.source') FROM chunks").fetchall()
+        updates = []
+        for chunk_id, column, source in rows:
+            key = source_key(source)
+            if key != column:
+                updates.append((key, chunk_id))
+        conn.executemany("UPDATE chunks SET source = ? WHERE id = ?", updates)
+
+    def _conn(self) -> sqlite3.Connection:
+        # One connection per thread; WAL lets searches read while a writer appends
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    # --- Writes ---
+
+    def add(self, docs: List[Document], version: int) -> List[int]:
+        """Store chunks for index version `version`; returns their new IDs in order."""
+        conn = self._conn()
+        ids = []
+        now = time.time()
+        with conn:
+            for doc in docs:
+                source = doc.metadata.get("source")
+                page = doc.metadata.get("page")
+                cursor = conn.execute(
+                    "INSERT INTO chunks (text, metadata, added_in, source, page, ingested_at) VALUES (?, ?, ?, ?, ?, ?)",
+                    (doc.page_content, json.dumps(doc.metadata, default=str), version,
+                     source_key(source), page if isinstance(page, int) else None, now),
+                )
+                ids.append(cursor.lastrowid)
+        return ids
+
+    def mark_removed(self, ids: Sequence[int], version: int):
+        """Record that version `version` no longer references these chunks (compaction)."""
+        conn = self._conn()
+        with conn:
+            conn.executemany("UPDATE chunks SET removed_in = ? WHERE id = ?", [(version, int(i)) for i in ids])
+
+    def purge(self, oldest_version: int):
+        """Delete chunks removed at or before the oldest kept version: nothing can reach them."""
+        conn = self._conn()
+        with conn:
+            conn.execute("DELETE FROM chunks WHERE removed_in IS NOT NULL AND removed_in <= ?", (oldest_version,))
+
+    def restore(self, version: int):
+        """Rolling back to `version` makes chunks removed after it reachable again."""
+        conn = self._conn()
+        with conn:
+            conn.execute("UPDATE chunks SET removed_in = NULL WHERE removed_in > ?", (version,))
+
+    def retain(self, ids: Sequence[int], version: int):
+        """
+        After a rollback: chunks outside `ids` (all the restored version holds)
+        are removed as of `version`, the next version number, so purge reclaims
+        them once every version that may still reference them is pruned.
+        """
+        conn = self._conn()
+        with conn:
+            conn.execute("CREATE TEMP TABLE IF NOT EXISTS retained (id INTEGER PRIMARY KEY)")
+            conn.execute("DELETE FROM retained")
+            conn.executemany("INSERT INTO retained (id) VALUES (?)", ((int(i),) for i in ids))
+            conn.execute("UPDATE chunks SET removed_in = ? WHERE removed_in IS NULL AND id NOT IN (SELECT id FROM retained)",
+                         (version,))
+            conn.execute("DELETE FROM retained")
+
+    def discard(self, version: int):
+        """Drop the chunks of an unpublished draft."""
+        conn = self._conn()
+        with conn:
+            conn.execute("DELETE FROM chunks WHERE added_in = ?", (version,))
+
+    # --- Reads ---
+
+    def get(self, ids: Sequence[int]) -> List[Optional[Document]]:
+        """
+        Documents for chunk IDs, in order (None for unknown IDs), with the ID in
+        metadata["chunk_id"]. Cache misses are read in one query per batch.
+        """
+        docs = [self.cache.get(int(i)) for i in ids]
+        missing = list({int(i) for i, doc in zip(ids, docs) if doc is None})
+        if missing:
+            found = {}
+            conn = self._conn()
+            for start in range(0, len(missing), LOOKUP_BATCH):
+                batch = missing[start:start + LOOKUP_BATCH]
+                rows = conn.execute(
+                    f"SELECT id, text, metadata FROM chunks WHERE id IN ({','.join('?' * len(batch))})", batch
+                )
+                for chunk_id, text, metadata in rows:
+                    doc = Document(page_content=text, metadata={**json.loads(metadata), "chunk_id": chunk_id})
+                    self.cache.put(chunk_id, doc)
+                    found[chunk_id] = doc
+            docs = [doc if doc is not None else found.get(int(i)) for i, doc in zip(ids, docs)]
+        return docs
+
+    def match(self, chunk_filter: ChunkFilter) -> np.ndarray:
+        """Sorted IDs of the chunks a filter selects (rows of every kept version, not just one)."""
+        where, params = chunk_filter.to_sql()
+        rows = self._conn().execute(f"SELECT id FROM chunks WHERE {where} ORDER BY id", params)
+        return np.fromiter((row[0] for row in rows), dtype=np.int64)
+
+    def __len__(self):
+        return self._conn().execute("SELECT COUNT(*) FROM chunks").fetchone()[0]
+
+
+def source_key(source) -> Optional[str]:
+    """Value of the source column for a chunk's metadata source (the manifest key ingestion sets)."""
+    if not source:
+        return None
+    source = str(source)
+    return os.path.basename(source) if os.path.isabs(source) else source
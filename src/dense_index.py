@@ -0,0 +1,308 @@
+# src/dense_index.py
+import os
+import math
+import pickle
+from typing import List, Optional
+
+import numpy as np
+
+# Dense index selection: "auto" picks from corpus size, or force "flat" / "hnsw" / "ivf"
+DENSE_INDEX_TYPE = os.getenv("RAG_DENSE_INDEX", "auto")
+# Exact search below this many vectors; HNSW up to HNSW_MAX_VECTORS; IVF beyond
+FLAT_MAX_VECTORS = 50_000
+HNSW_MAX_VECTORS = 2_000_000
+
+# HNSW graph degree / build beam, and the default search beam
+HNSW_M = 32
+HNSW_EF_CONSTRUCTION = 80
+HNSW_EF_SEARCH = int(os.getenv("RAG_HNSW_EF_SEARCH", "64"))
+
+# IVF: ~4*sqrt(n) lists, trained on up to IVF_TRAIN_PER_LIST vectors per list
+IVF_NPROBE = int(os.getenv("RAG_IVF_NPROBE", "16"))
+IVF_TRAIN_PER_LIST = 64
+# Retrain (rebuild) once the corpus would call for this many times more lists
+IVF_RETRAIN_FACTOR = 2
+
+# Vector storage: "float32" (exact), "fp16" (half), "sq8" (int8 scalar quantizer)
+# or "pq" (product quantizer, PQ_M bytes per vector)
+VECTOR_STORAGE = os.getenv("RAG_VECTOR_STORAGE", "float32")
+PQ_M = 48
+# PQ codebooks need ~39 training vectors per centroid (256 per sub-quantizer);
+# smaller corpora use sq8 instead
+PQ_MIN_TRAIN = 39 * 256
+# Re-score this many times k candidates against the float32 originals when
+# storage is lossy (0 disables re-scoring)
+RESCORE_FACTOR = int(os.getenv("RAG_RESCORE_FACTOR", "4"))
+# float32 originals of a lossy index, next to index.faiss
+EXACT_VECTORS_FILENAME = "exact_vectors.f32"
+
+_CODECS = {"float32": "Flat", "fp16": "SQfp16", "sq8": "SQ8"}
+
+
+def choose_index_type(num_vectors: int) -> str:
+    if DENSE_INDEX_TYPE != "auto":
+        return DENSE_INDEX_TYPE
+    if num_vectors <= FLAT_MAX_VECTORS:
+        return "flat"
+    if num_vectors <= HNSW_MAX_VECTORS:
+        return "hnsw"
+    return "ivf"
+
+
+def ivf_nlist(num_vectors: int) -> int:
+    return max(1, int(4 * math.sqrt(num_vectors)))
+
+
+def choose_storage(num_vectors: int, dim: int) -> str:
+    if VECTOR_STORAGE == "pq" and (dim % PQ_M or num_vectors < PQ_MIN_TRAIN):
+        return "sq8"
+    if VECTOR_STORAGE != "float32" and not num_vectors:
+        # Quantizers cannot be trained on nothing
+        return "float32"
+    return VECTOR_STORAGE
+
+
+def is_lossy(storage: str) -> bool:
+    return storage != "float32"
+
+
+def base_index(index):
+    """The index inside an IndexIDMap (positions, codes, search knobs live there)."""
+    import faiss
+    if isinstance(index, faiss.IndexIDMap):
+        return faiss.downcast_index(index.index)
+    return index
+
+
+def has_chunk_ids(index) -> bool:
+    """Indexes built since stable chunk IDs carry them in an IndexIDMap (search returns chunk IDs)."""
+    import faiss
+    return isinstance(index, faiss.IndexIDMap)
+
+
+def chunk_ids_of(index) -> np.ndarray:
+    """Chunk ID of every position. IDs are appended in increasing order, so the array is sorted."""
+    import faiss
+    return faiss.vector_to_array(index.id_map)
+
+
+def index_type(index) -> str:
+    """Kind of a FAISS index as named by choose_index_type."""
+    import faiss
+    index = base_index(index)
+    if isinstance(index, faiss.IndexHNSW):
+        return "hnsw"
+    if isinstance(index, faiss.IndexIVF):
+        return "ivf"
+    return "flat"
+
+
+def index_storage(index) -> str:
+    """Vector storage of a FAISS index as named by choose_storage."""
+    import faiss
+    index = base_index(index)
+    codes = faiss.downcast_index(index.storage) if isinstance(index, faiss.IndexHNSW) else index
+    if isinstance(codes, (faiss.IndexPQ, faiss.IndexIVFPQ)):
+        return "pq"
+    if isinstance(codes, (faiss.IndexScalarQuantizer, faiss.IndexIVFScalarQuantizer)):
+        return "fp16" if codes.sq.qtype == faiss.ScalarQuantizer.QT_fp16 else "sq8"
+    return "float32"
+
+
+def build_index(kind: str, vectors: np.ndarray, dim: int, storage: str = "float32", ids: Optional[np.ndarray] = None):
+    """
+    Build a FAISS index of `kind` and `storage` (L2, like LangChain's default) holding
+    `vectors` in order, wrapped in an IndexIDMap labelling them with `ids` (default 0..n-1).
+    """
+    import faiss
+    codec = f"PQ{PQ_M}" if storage == "pq" else _CODECS.get(storage)
+    if codec is None:
+        raise ValueError(f"Unknown vector storage: {storage}")
+    train_size = len(vectors)
+    if kind == "hnsw":
+        index = faiss.index_factory(dim, f"IDMap,HNSW{HNSW_M}" if codec == "Flat" else f"IDMap,HNSW{HNSW_M},{codec}")
+        base_index(index).hnsw.efConstruction = HNSW_EF_CONSTRUCTION
+    elif kind == "ivf":
+        nlist = min(ivf_nlist(len(vectors)), max(1, len(vectors) // 39))
+        index = faiss.index_factory(dim, f"IDMap,IVF{nlist},{codec}")
+        train_size = nlist * IVF_TRAIN_PER_LIST
+    elif kind == "flat":
+        index = faiss.index_factory(dim, f"IDMap,{codec}")
+    else:
+        raise ValueError(f"Unknown dense index type: {kind}")
+    if not index.is_trained:
+        sample = vectors
+        if len(vectors) > max(train_size, PQ_MIN_TRAIN):
+            rng = np.random.default_rng(0)
+            sample = vectors[rng.choice(len(vectors), max(train_size, PQ_MIN_TRAIN), replace=False)]
+        index.train(np.ascontiguousarray(sample, dtype=np.float32))
+    if len(vectors):
+        ids = np.arange(len(vectors)) if ids is None else ids
+        index.add_with_ids(np.ascontiguousarray(vectors, dtype=np.float32), np.asarray(ids, dtype=np.int64))
+    return index
+
+
+def configure(index, nprobe: int = IVF_NPROBE, ef_search: int = HNSW_EF_SEARCH):
+    """Apply search-time knobs (stored on the index, so they survive clone and save)."""
+    import faiss
+    inner = base_index(index)
+    if isinstance(inner, faiss.IndexIVF):
+        inner.nprobe = nprobe
+    elif isinstance(inner, faiss.IndexHNSW):
+        inner.hnsw.efSearch = ef_search
+    return index
+
+
+def search_params(index, selector):
+    """SearchParameters restricting a search to `selector`, with the index's current nprobe / efSearch."""
+    import faiss
+    inner = base_index(index)
+    if isinstance(inner, faiss.IndexIVF):
+        return faiss.SearchParametersIVF(sel=selector, nprobe=inner.nprobe)
+    if isinstance(inner, faiss.IndexHNSW):
+        return faiss.SearchParametersHNSW(sel=selector, efSearch=inner.hnsw.efSearch)
+    return faiss.SearchParameters(sel=selector)
+
+
+def vectors_of(index, positions: Optional[np.ndarray] = None) -> np.ndarray:
+    """Stored vectors (all, or the given positions), decoded (lossy for quantized storage)."""
+    import faiss
+    index = base_index(index)
+    if isinstance(index, faiss.IndexIVF):
+        index.make_direct_map()
+    if positions is None:
+        return index.reconstruct_n(0, index.ntotal)
+    return index.reconstruct_batch(np.asarray(positions, dtype=np.int64))
+
+
+def needs_rebuild(index) -> Optional[str]:
+    """The index type the corpus should now use, if it differs from (or outgrew) the current one."""
+    kind = choose_index_type(index.ntotal)
+    if not has_chunk_ids(index):
+        return kind
+    if kind != index_type(index) or choose_storage(index.ntotal, index.d) != index_storage(index):
+        return kind
+    if kind == "ivf" and ivf_nlist(index.ntotal) >= IVF_RETRAIN_FACTOR * base_index(index).nlist:
+        return kind
+    return None
+
+
+def rebuild_vectorstore(vectorstore, keep: Optional[np.ndarray] = None, kind: Optional[str] = None,
+                        exact: Optional["ExactVectors"] = None) -> np.ndarray:
+    """
+    Rebuild a LangChain FAISS store's index in place, optionally keeping only the
+    `keep` positions (compaction) and switching index type and storage. Works for
+    index types without remove_ids (HNSW). Vectors are taken from `exact` when it
+    covers the index, so quantized storage is never re-encoded from its own codes.
+    Indexes from before stable chunk IDs get their IndexIDMap from the
+    position -> chunk ID map here. Returns the vectors the new index was built
+    from, in position order.
+    """
+    index = vectorstore.index
+    positions = np.arange(index.ntotal) if keep is None else np.sort(np.asarray(keep, dtype=np.int64))
+    if has_chunk_ids(index):
+        ids = chunk_ids_of(index)[positions]
+    else:
+        ids = np.array([vectorstore.index_to_docstore_id[int(p)] for p in positions], dtype=np.int64)
+    if not len(positions):
+        vectors = np.zeros((0, index.d), dtype=np.float32)
+    elif exact is not None and len(exact) == index.ntotal:
+        vectors = exact.take(positions)
+    else:
+        vectors = vectors_of(index, positions)
+    kind = kind or choose_index_type(len(positions))
+    storage = choose_storage(len(positions), index.d)
+    vectorstore.index = configure(build_index(kind, vectors, index.d, storage, ids))
+    vectorstore.index_to_docstore_id = {}
+    return vectors
+
+
+def new_vectorstore(embeddings, dim: int):
+    """
+    Empty LangChain FAISS store over an IndexIDMap. Its docstore and
+    index_to_docstore_id stay empty: searches return chunk IDs directly and
+    chunk text lives in the chunk store.
+    """
+    import faiss
+    from langchain_community.docstore.in_memory import InMemoryDocstore
+    from langchain_community.vectorstores import FAISS
+    return FAISS(embeddings, faiss.index_factory(dim, "IDMap,Flat"), InMemoryDocstore(), {})
+
+
+def add_vectors(vectorstore, vectors, ids: List[int]):
+    """Append vectors labelled with their chunk IDs."""
+    vectorstore.index.add_with_ids(np.asarray(vectors, dtype=np.float32), np.asarray(ids, dtype=np.int64))
+
+
+def read_index(path: str):
+    """
+    Read index.faiss memory-mapped and read-only: codes stay in the page cache,
+    shared by every process that opens the same file. Never add to the result;
+    copy it with copy_index first.
+    """
+    import faiss
+    flags = getattr(faiss, "IO_FLAG_MMAP_IFC", faiss.IO_FLAG_MMAP) | faiss.IO_FLAG_READ_ONLY
+    return configure(faiss.read_index(os.path.join(path, "index.faiss"), flags))
+
+
+def copy_index(index):
+    """Owned in-memory copy (clone_index would keep views into a memory-mapped file)."""
+    import faiss
+    return faiss.deserialize_index(faiss.serialize_index(index))
+
+
+def load_vectorstore(path: str, embeddings):
+    """FAISS.load_local with the index memory-mapped (docstore and ID map are unpickled as usual)."""
+    from langchain_community.vectorstores import FAISS
+    with open(os.path.join(path, "index.pkl"), "rb") as f:
+        docstore, index_to_docstore_id = pickle.load(f)
+    return FAISS(embeddings, read_index(path), docstore, index_to_docstore_id)
+
+
+class ExactVectors:
+    """
+    float32 originals of a lossy index, row-aligned with its FAISS positions,
+    for re-scoring top candidates. Loaded memory-mapped; a draft appends new
+    rows in memory, and save() writes the concatenation as a new file.
+    """
+
+    def __init__(self, dim: int, parts: Optional[List[np.ndarray]] = None):
+        self.dim = dim
+        self.parts = [p for p in (parts or []) if len(p)]
+
+    @classmethod
+    def load(cls, path: str, dim: int) -> Optional["ExactVectors"]:
+        file_path = os.path.join(path, EXACT_VECTORS_FILENAME)
+        if not os.path.exists(file_path) or not os.path.getsize(file_path):
+            return None
+        return cls(dim, [np.memmap(file_path, dtype=np.float32, mode="r").reshape(-1, dim)])
+
+    def __len__(self):
+        return sum(len(p) for p in self.parts)
+
+    def fork(self) -> "ExactVectors":
+        return ExactVectors(self.dim, list(self.parts))
+
+    def append(self, vectors):
+        self.parts.append(np.asarray(vectors, dtype=np.float32).reshape(-1, self.dim))
+
+    def take(self, positions: np.ndarray) -> np.ndarray:
+        if len(self.parts) > 1:
+            # Fold appended rows together so lookups stay a single fancy index
+            self.parts = [np.concatenate(self.parts)]
+        if not self.parts:
+            return np.zeros((0, self.dim), dtype=np.float32)
+        return self.parts[0][np.asarray(positions, dtype=np.int64)]
+
+    def save(self, path: str):
+        with open(os.path.join(path, EXACT_VECTORS_FILENAME), "wb") as f:
+            for part in self.parts:
+                f.write(np.ascontiguousarray(part).tobytes())
+
+
+def rescore(exact: ExactVectors, query: np.ndarray, positions: np.ndarray) -> np.ndarray:
+    """Candidate positions re-ordered by exact L2 distance to `query`."""
+    rows = exact.take(positions)
+    distances = ((rows - query) ** 2).sum(axis=1)
+    return positions[np.argsort(distances, kind="stable")]
+
@@ -0,0 +1,287 @@
+# src/embedding_cache.py
+import os
+import re
+import json
+import hashlib
+import threading
+from contextlib import contextmanager
+from typing import List, Optional
+
+try:
+    import fcntl
+except ImportError:
+    # Windows: the cache is only safe to share within one process
+    fcntl = None
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+
+def normalize_text(text: str) -> str:
+    """Collapse whitespace so re-wrapped copies of the same paragraph share a cache entry."""
+    return re.sub(r"\s+", " ", text).strip()
+
+
+class EmbeddingCache:
+    """
+    Persistent, size-bounded store of chunk embeddings keyed by
+    (model name, normalized text hash).
+
+    Layout under `cache_dir/<model>/`:
+      - vectors.bin : np.memmap of shape (capacity, dim), float16 by default
+      - keys.npy    : 16-byte blake2b digest per slot (all zeros: evicted, empty)
+      - ticks.npy   : last-access counter per slot (LRU eviction)
+      - meta.json   : model, dim, dtype, capacity, size, tick
+      - .lock       : flock held while reading (shared) or writing (exclusive)
+
+    Several processes can share one cache. Each one reloads keys and meta when
+    meta.json changed on disk since it last loaded or wrote them, under the
+    lock, so slots are never allocated from a stale view. put_many lists new
+    slots in keys.npy only after their vectors are written. Slots that are
+    reused after an eviction are blanked in keys.npy (and that file is saved)
+    before their vectors are overwritten. A crash therefore never leaves a key
+    pointing at another text's vector.
+    """
+
+    def __init__(self, cache_dir: str, model_name: str, capacity: int = 200_000, dtype: str = "float16"):
+        self.model_name = model_name
+        self.dir = os.path.join(cache_dir, re.sub(r"[^A-Za-z0-9_.-]+", "_", model_name))
+        self.capacity = capacity
+        self.dtype = np.dtype(dtype)
+        self.dim: Optional[int] = None
+        self.size = 0
+        self.tick = 0
+        self.vectors = None
+        self.keys = None
+        self.ticks = None
+        self.index = {}
+        self._stamp = None
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+        os.makedirs(self.dir, exist_ok=True)
+        self._load()
+
+    # --- Storage ---
+
+    def _path(self, name: str) -> str:
+        return os.path.join(self.dir, name)
+
+    @contextmanager
+    def _file_lock(self, shared: bool = False):
+        """Cross-process lock on this cache directory: shared for lookups, exclusive for writes."""
+        with open(self._path(".lock"), "a") as f:
+            if fcntl is not None:
+                fcntl.flock(f.fileno(), fcntl.LOCK_SH if shared else fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+
+    def _meta_stamp(self) -> Optional[tuple]:
+        """(inode, mtime) of meta.json, which every persist replaces; None before the first one."""
+        try:
+            stat = os.stat(self._path("meta.json"))
+        except FileNotFoundError:
+            return None
+        return stat.st_ino, stat.st_mtime_ns
+
+    def _load(self):
+        with self._lock, self._file_lock(shared=True):
+            self._sync()
+
+    def _sync(self):
+        """
+        Reload keys, ticks and meta if another process persisted since this one
+        last did (access ticks recorded here since then are dropped). Called
+        with the file lock held.
+        """
+        stamp = self._meta_stamp()
+        if stamp is None or stamp == self._stamp:
+            return
+        try:
+            with open(self._path("meta.json"), "r") as f:
+                meta = json.load(f)
+            if meta["model"] != self.model_name or np.dtype(meta["dtype"]) != self.dtype:
+                raise ValueError("cache was written for a different model or dtype")
+            if self.vectors is None or self.vectors.shape != (meta["capacity"], meta["dim"]):
+                self.capacity = meta["capacity"]
+                self._allocate(meta["dim"], mode="r+")
+            else:
+                self.keys[:] = 0
+                self.ticks[:] = 0
+            self.size = meta["size"]
+            self.tick = max(self.tick, meta["tick"])
+            self.keys[:self.size] = np.load(self._path("keys.npy"))
+            self.ticks[:self.size] = np.load(self._path("ticks.npy"))
+            self.index = {self.keys[slot].tobytes(): slot for slot in range(self.size) if self.keys[slot].any()}
+        except Exception as e:
+            print(f"Discarding embedding cache: {e}")
+            self.dim, self.size, self.tick, self.index = None, 0, 0, {}
+            self.vectors = self.keys = self.ticks = None
+        self._stamp = stamp
+
+    def _allocate(self, dim: int, mode: str):
+        self.dim = dim
+        self.vectors = np.memmap(self._path("vectors.bin"), dtype=self.dtype, mode=mode, shape=(self.capacity, dim))
+        self.keys = np.zeros((self.capacity, 16), dtype=np.uint8)
+        self.ticks = np.zeros(self.capacity, dtype=np.int64)
+
+    def flush(self):
+        """Persist the slot index; vectors are already in the memory-mapped file."""
+        with self._lock, self._file_lock():
+            stamp = self._stamp
+            self._sync()
+            if self.vectors is None or self._stamp != stamp:
+                return
+            self._persist()
+
+    def _persist(self, size: Optional[int] = None):
+        """Write keys, ticks and meta for the first `size` slots (default: all in use); each file is replaced atomically."""
+        size = self.size if size is None else size
+        self.vectors.flush()
+        self._save_array("keys.npy", self.keys[:size])
+        self._save_array("ticks.npy", self.ticks[:size])
+        meta = {
+            "model": self.model_name,
+            "dim": self.dim,
+            "dtype": self.dtype.name,
+            "capacity": self.capacity,
+            "size": size,
+            "tick": self.tick,
+        }
+        tmp_path = self._path("meta.json.tmp")
+        with open(tmp_path, "w") as f:
+            json.dump(meta, f)
+        os.replace(tmp_path, self._path("meta.json"))
+        self._stamp = self._meta_stamp()
+
+    def _save_array(self, name: str, array: np.ndarray):
+        tmp_path = self._path(name + ".tmp")
+        with open(tmp_path, "wb") as f:
+            np.save(f, array)
+        os.replace(tmp_path, self._path(name))
+
+    # --- Lookup ---
+
+    def key(self, text: str) -> bytes:
+        payload = f"{self.model_name}\0{normalize_text(text)}".encode("utf-8")
+        return hashlib.blake2b(payload, digest_size=16).digest()
+
+    def get_many(self, texts: List[str]) -> List[Optional[List[float]]]:
+        """Return cached vectors (None for misses) and refresh their LRU position."""
+        out: List[Optional[List[float]]] = [None] * len(texts)
+        with self._lock, self._file_lock(shared=True):
+            self._sync()
+            for i, text in enumerate(texts):
+                slot = self.index.get(self.key(text))
+                if slot is None:
+                    self.misses += 1
+                    continue
+                self.hits += 1
+                self.tick += 1
+                self.ticks[slot] = self.tick
+                out[i] = self.vectors[slot].astype(np.float32).tolist()
+        return out
+
+    def stored(self, vectors: List[List[float]]) -> List[List[float]]:
+        """Vectors as a cache hit returns them (rounded to the storage dtype)."""
+        return np.asarray(vectors, dtype=self.dtype).astype(np.float32).tolist()
+
+    def put_many(self, texts: List[str], vectors: List[List[float]]):
+        """Store vectors for texts not cached yet and persist the slot index, so other processes see them."""
+        if not texts:
+            return
+        with self._lock, self._file_lock():
+            self._sync()
+            if self.vectors is None:
+                self._allocate(len(vectors[0]), mode="w+")
+            new = {}
+            for text, vector in zip(texts, vectors):
+                key = self.key(text)
+                if key not in self.index:
+                    new[key] = vector
+            # Keep only what fits when a single batch exceeds the whole cache
+            items = list(new.items())[-self.capacity:]
+            persisted = self.size
+            slots = self._free_slots(len(items))
+            reused = [slot for slot in slots if slot < persisted]
+            if reused:
+                # Unlist the evicted keys on disk before their slots get new vectors
+                self.keys[reused] = 0
+                self.ticks[reused] = 0
+                self._persist(persisted)
+            for slot, (key, vector) in zip(slots, items):
+                self.tick += 1
+                self.vectors[slot] = np.asarray(vector, dtype=self.dtype)
+                self.keys[slot] = np.frombuffer(key, dtype=np.uint8)
+                self.ticks[slot] = self.tick
+                self.index[key] = slot
+            if items:
+                self._persist()
+
+    def _free_slots(self, count: int) -> List[int]:
+        """Hand out unused slots first, then evict the least recently used ones."""
+        occupied = self.size
+        fresh = min(count, self.capacity - occupied)
+        slots = list(range(occupied, occupied + fresh))
+        self.size += fresh
+        needed = count - fresh
+        if needed > 0:
+            used = self.ticks[:occupied]
+            victims = np.argpartition(used, needed - 1)[:needed] if needed < occupied else np.arange(occupied)
+            for slot in victims:
+                self.index.pop(self.keys[slot].tobytes(), None)
+            self.evictions += len(victims)
+            slots.extend(int(slot) for slot in victims)
+        return slots
+
+    # --- Stats ---
+
+    @property
+    def hit_rate(self) -> float:
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+    def reset_stats(self):
+        self.hits = self.misses = self.evictions = 0
+
+
+class CachedEmbeddings(Embeddings):
+    """
+    Embeddings wrapper that serves document vectors from an EmbeddingCache
+    and only sends misses to the underlying model. Queries bypass the cache.
+    """
+
+    def __init__(self, base: Embeddings, cache: EmbeddingCache):
+        self.base = base
+        self.cache = cache
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        vectors = self.cache.get_many(texts)
+        missing = [i for i, vector in enumerate(vectors) if vector is None]
+        if missing:
+            # Embed each distinct missing text once (boilerplate repeats within a batch too)
+            unique = list(dict.fromkeys(texts[i] for i in missing))
+            # Rounded like cached vectors, so a text embeds the same whether or not it was cached
+            computed = dict(zip(unique, self.cache.stored(self.base.embed_documents(unique))))
+            self.cache.put_many(unique, [computed[t] for t in unique])
+            for i in missing:
+                vectors[i] = computed[texts[i]]
+        return vectors
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.base.embed_query(text)
+
+    def embed_queries(self, texts: List[str]) -> List[List[float]]:
+        """
+        Embed several queries in one forward pass. HuggingFaceEmbeddings encodes
+        queries with the document settings unless query_encode_kwargs are set,
+        in which case each query goes through embed_query.
+        """
+        query_kwargs = getattr(self.base, "query_encode_kwargs", None)
+        if query_kwargs and query_kwargs != getattr(self.base, "encode_kwargs", None):
+            return [self.base.embed_query(text) for text in texts]
+        return self.base.embed_documents(texts)
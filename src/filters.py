@@ -0,0 +1,104 @@
+# src/filters.py
+import math
+import re
+from datetime import datetime, timedelta
+from typing import List, Optional, Sequence, Tuple
+
+_TERM_RE = re.compile(r"^(source|page|ingested)\s*(>=|<=|=|>|<)\s*(.+)$")
+_DATE_RE = re.compile(r"^\d{4}-\d{2}-\d{2}$")
+
+
+class ChunkFilter:
+    """
+    Metadata restriction for a search: chunks from any of `sources` (manifest
+    keys: file names, or paths relative to the ingest root; `*` wildcards
+    allowed), with page in [page_min, page_max], ingested in
+    [ingested_from, ingested_until) (Unix seconds). Unset bounds match
+    everything. The chunk store compiles it into a chunk ID bitmap.
+    """
+
+    def __init__(self, sources: Optional[Sequence[str]] = None, page_min: Optional[int] = None,
+                 page_max: Optional[int] = None, ingested_from: Optional[float] = None,
+                 ingested_until: Optional[float] = None):
+        self.sources = tuple(sources) if sources else ()
+        self.page_min = page_min
+        self.page_max = page_max
+        self.ingested_from = ingested_from
+        self.ingested_until = ingested_until
+
+    @classmethod
+    def parse(cls, expression: str) -> "ChunkFilter":
+        """
+        Parse whitespace-separated conditions, all of which must hold, e.g.
+        `source=handbook.pdf,policy*.md page>=3 page<=10 ingested>=2024-05-01`.
+        Dates compare by whole days; datetimes compare exactly.
+        """
+        chunk_filter = cls()
+        for term in expression.split():
+            match = _TERM_RE.match(term)
+            if not match:
+                raise ValueError(f"Invalid filter condition: {term!r}")
+            field, op, value = match.groups()
+            if field == "source":
+                if op != "=":
+                    raise ValueError(f"source only supports '=': {term!r}")
+                chunk_filter.sources += tuple(v for v in value.split(",") if v)
+            elif field == "page":
+                chunk_filter._bound("page", op, int(value), 1)
+            else:
+                chunk_filter._bound("ingested", op, *_parse_time(value))
+        return chunk_filter
+
+    def _bound(self, field: str, op: str, value, step):
+        """Set bounds from one comparison; `step` is the granularity that makes strict comparisons inclusive."""
+        if field == "page":
+            # page_min and page_max are both inclusive
+            names = ("page_min", "page_max")
+            low, high = value + (step if op == ">" else 0), value - (step if op == "<" else 0)
+        else:
+            # ingested_until is exclusive
+            names = ("ingested_from", "ingested_until")
+            low, high = value + (step if op == ">" else 0), value + (step if op in ("=", "<=") else 0)
+        if op in ("=", ">=", ">"):
+            setattr(self, names[0], low)
+        if op in ("=", "<=", "<"):
+            setattr(self, names[1], high)
+
+    def is_empty(self) -> bool:
+        return not self.sources and self.key()[1:] == (None, None, None, None)
+
+    def key(self) -> tuple:
+        """Hashable form, for cache keys."""
+        return (self.sources, self.page_min, self.page_max, self.ingested_from, self.ingested_until)
+
+    def to_sql(self) -> Tuple[str, List]:
+        """WHERE clause and parameters over the chunk store's source/page/ingested_at columns."""
+        clauses, params = [], []
+        if self.sources:
+            clauses.append("(" + " OR ".join("LOWER(source) GLOB ?" for _ in self.sources) + ")")
+            params.extend(_glob(source) for source in self.sources)
+        for column, op, value in (("page", ">=", self.page_min), ("page", "<=", self.page_max),
+                                  ("ingested_at", ">=", self.ingested_from), ("ingested_at", "<", self.ingested_until)):
+            if value is not None:
+                clauses.append(f"{column} {op} ?")
+                params.append(value)
+        return (" AND ".join(clauses) or "1"), params
+
+    def __repr__(self):
+        return f"ChunkFilter{self.key()}"
+
+
+def _glob(pattern: str) -> str:
+    """Case-insensitive GLOB pattern: `*` stays a wildcard, other GLOB syntax is literal."""
+    return re.sub(r"([?\[\]])", r"[\1]", pattern.lower())
+
+
+def _parse_time(value: str) -> Tuple[float, float]:
+    """
+    Unix time of an ISO date or datetime, and the granularity step for strict
+    comparisons: a day for dates, the gap to the next representable timestamp for datetimes.
+    """
+    if _DATE_RE.match(value):
+        return datetime.fromisoformat(value).timestamp(), timedelta(days=1).total_seconds()
+    timestamp = datetime.fromisoformat(value).timestamp()
+    return timestamp, math.ulp(timestamp)
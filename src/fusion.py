@@ -0,0 +1,35 @@
+# src/fusion.py
+from typing import Optional, Sequence, Tuple, Union
+
+import numpy as np
+
+# RRF rank constant: score(d) = sum_i w_i / (RRF_K + rank_i(d)), ranks from 1
+RRF_K = 60
+
+
+def reciprocal_rank_fusion(ranked_ids: Sequence[Sequence[int]], weights: Optional[Sequence[float]] = None,
+                           k: int = RRF_K, return_scores: bool = False) -> Union[np.ndarray, Tuple[np.ndarray, np.ndarray]]:
+    """
+    Weighted Reciprocal Rank Fusion of any number of ranked chunk ID lists.
+    Returns the fused chunk IDs, best first (and their fused scores with
+    `return_scores`). Ties keep the order in which IDs first appear across
+    the lists (earlier lists first).
+    """
+    lists = [np.asarray(ids, dtype=np.int64) for ids in ranked_ids]
+    if weights is None:
+        weights = [1.0] * len(lists)
+    if len(weights) != len(lists):
+        raise ValueError(f"Got {len(weights)} weights for {len(lists)} ranked lists")
+    ids = np.concatenate(lists) if lists else np.empty(0, dtype=np.int64)
+    if not len(ids):
+        return (ids, np.empty(0)) if return_scores else ids
+    contributions = np.concatenate([w / (k + np.arange(1, len(l) + 1)) for w, l in zip(weights, lists)])
+
+    unique, inverse = np.unique(ids, return_inverse=True)
+    scores = np.bincount(inverse, weights=contributions, minlength=len(unique))
+    first_seen = np.full(len(unique), len(ids), dtype=np.int64)
+    np.minimum.at(first_seen, inverse, np.arange(len(ids)))
+    order = np.lexsort((first_seen, -scores))
+    if return_scores:
+        return unique[order], scores[order]
+    return unique[order]
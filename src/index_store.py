@@ -0,0 +1,222 @@
+# src/index_store.py
+import os
+import re
+import shutil
+from contextlib import contextmanager
+from typing import List, Optional, Tuple
+
+try:
+    import fcntl
+except ImportError:
+    # Windows: writers are only serialised within one process
+    fcntl = None
+
+import numpy as np
+from langchain_community.docstore.in_memory import InMemoryDocstore
+from langchain_community.vectorstores import FAISS
+
+from src.dense_index import ExactVectors, chunk_ids_of, copy_index
+
+# On-disk layout: <data>/versions/v<N>/{faiss_index, sparse_index, ingest_manifest.json}
+# plus <data>/CURRENT naming the published version
+VERSIONS_DIRNAME = "versions"
+CURRENT_FILE = "CURRENT"
+FAISS_DIRNAME = "faiss_index"
+SPARSE_DIRNAME = "sparse_index"
+MANIFEST_FILENAME = "ingest_manifest.json"
+# Held (flock) by the writing process from drafting a version to publishing it
+LOCK_FILENAME = ".lock"
+# Published versions kept on disk for rollback (the current one is never pruned)
+KEEP_VERSIONS = 3
+
+_VERSION_RE = re.compile(r"^v(\d+)$")
+
+
+class IndexSnapshot:
+    """
+    One published generation of the indexes: dense store, sparse index,
+    manifest and tombstones that belong together (plus the float32 originals
+    when dense storage is lossy). Searches grab the current
+    snapshot once and use only it, so a concurrent publish never mixes versions.
+    A snapshot is only mutated while it is a draft that has not been published.
+    """
+
+    def __init__(self, version: int, vectorstore: Optional[FAISS], sparse_index, manifest, tombstones: set,
+                 exact: Optional[ExactVectors] = None):
+        self.version = version
+        self.vectorstore = vectorstore
+        self.sparse_index = sparse_index
+        self.manifest = manifest
+        self.tombstones = tombstones
+        self.exact = exact
+        self._chunk_ids = None
+        self._dead = None
+        self._live = None
+
+    def chunk_ids(self) -> np.ndarray:
+        """Chunk ID of every FAISS position (sorted), read from the IndexIDMap on first use."""
+        index = self.vectorstore.index
+        if self._chunk_ids is None or self._chunk_ids[0] is not index or len(self._chunk_ids[1]) != index.ntotal:
+            self._chunk_ids = (index, chunk_ids_of(index))
+        return self._chunk_ids[1]
+
+    def positions(self, chunk_ids: np.ndarray) -> np.ndarray:
+        """FAISS positions of chunk IDs held by the index."""
+        return np.searchsorted(self.chunk_ids(), chunk_ids)
+
+    def dead_ids(self) -> np.ndarray:
+        """Tombstoned chunk IDs as a sorted array, for vectorized masking of search results."""
+        dead = self._dead
+        if dead is None or len(dead) != len(self.tombstones):
+            dead = self._dead = np.array(sorted(self.tombstones), dtype=np.int64)
+        return dead
+
+    def referenced_ids(self) -> np.ndarray:
+        """Every chunk ID either index of this version holds, tombstoned ones included."""
+        parts = [self.chunk_ids()] if self.vectorstore is not None else []
+        parts += [segment.doc_ids for segment in self.sparse_index.segments]
+        return np.unique(np.concatenate(parts)) if parts else np.zeros(0, dtype=np.int64)
+
+    def live_bitmap(self) -> Optional[Tuple[np.ndarray, int]]:
+        """
+        Untombstoned vectors as a little-endian packed bitmap over chunk IDs (an
+        IDSelectorBitmap over len(bitmap) bytes), with the live count. None
+        when nothing is tombstoned.
+        """
+        if not self.tombstones:
+            return None
+        chunk_ids = self.chunk_ids()
+        live = self._live
+        if live is None or live[0] is not chunk_ids or live[1] != len(self.tombstones):
+            size = int(chunk_ids[-1]) + 1 if len(chunk_ids) else 0
+            mask = np.zeros(size, dtype=bool)
+            mask[chunk_ids] = True
+            dead = self.dead_ids()
+            mask[dead[dead < size]] = False
+            live = self._live = (chunk_ids, len(self.tombstones), np.packbits(mask, bitorder="little"), int(mask.sum()))
+        return live[2:]
+
+
+def clone_vectorstore(vectorstore: FAISS) -> FAISS:
+    """Independent, writable copy of a LangChain FAISS store (index, docstore and ID map)."""
+    return FAISS(
+        embedding_function=vectorstore.embedding_function,
+        index=copy_index(vectorstore.index),
+        docstore=InMemoryDocstore(dict(vectorstore.docstore._dict)),
+        index_to_docstore_id=dict(vectorstore.index_to_docstore_id),
+        normalize_L2=vectorstore._normalize_L2,
+        distance_strategy=vectorstore.distance_strategy,
+    )
+
+
+def link_tree(src: str, dst: str):
+    """Hard-link every file of a directory into a new one (copies if linking is unsupported)."""
+    os.makedirs(dst, exist_ok=True)
+    for name in os.listdir(src):
+        try:
+            os.link(os.path.join(src, name), os.path.join(dst, name))
+        except OSError:
+            shutil.copy2(os.path.join(src, name), os.path.join(dst, name))
+
+
+class VersionStore:
+    """Directory-per-version index storage with an atomically swapped CURRENT pointer."""
+
+    def __init__(self, data_dir: str, keep: int = KEEP_VERSIONS):
+        self.data_dir = data_dir
+        self.root = os.path.join(data_dir, VERSIONS_DIRNAME)
+        self.keep = keep
+        os.makedirs(self.root, exist_ok=True)
+
+    def path(self, version: int) -> str:
+        return os.path.join(self.root, f"v{version}")
+
+    def faiss_path(self, version: int) -> str:
+        return os.path.join(self.path(version), FAISS_DIRNAME)
+
+    def sparse_path(self, version: int) -> str:
+        return os.path.join(self.path(version), SPARSE_DIRNAME)
+
+    def manifest_path(self, version: int) -> str:
+        return os.path.join(self.path(version), MANIFEST_FILENAME)
+
+    def versions(self) -> List[int]:
+        found = []
+        for entry in os.listdir(self.root):
+            match = _VERSION_RE.match(entry)
+            if match:
+                found.append(int(match.group(1)))
+        return sorted(found)
+
+    def next_version(self) -> int:
+        """Never reuse a number, even after a rollback to an older version."""
+        versions = self.versions()
+        return versions[-1] + 1 if versions else 1
+
+    def current(self) -> Optional[int]:
+        return read_current(self.data_dir)
+
+    @contextmanager
+    def lock(self):
+        """
+        Exclusive writer lock shared by every process using this data directory.
+        Version numbers are allocated and CURRENT is replaced while it is held.
+        """
+        with open(os.path.join(self.root, LOCK_FILENAME), "a") as f:
+            if fcntl is not None:
+                fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+
+    def current_stamp(self) -> Optional[tuple]:
+        """(inode, mtime) of CURRENT, which every publish replaces; None before the first publish."""
+        try:
+            stat = os.stat(os.path.join(self.data_dir, CURRENT_FILE))
+        except FileNotFoundError:
+            return None
+        return stat.st_ino, stat.st_mtime_ns
+
+    def publish(self, version: int):
+        """Point CURRENT at a fully written version (write-then-rename), then prune old ones."""
+        tmp_path = os.path.join(self.data_dir, CURRENT_FILE + ".tmp")
+        with open(tmp_path, "w") as f:
+            f.write(f"v{version}\n")
+        os.replace(tmp_path, os.path.join(self.data_dir, CURRENT_FILE))
+        self.prune(version)
+
+    def prune(self, current: int):
+        # Readers holding an older snapshot keep working: its files are memory-mapped or in RAM
+        for version in self.versions()[:-self.keep]:
+            if version != current:
+                shutil.rmtree(self.path(version), ignore_errors=True)
+
+    def discard(self, version: int):
+        """Remove an unpublished draft directory."""
+        shutil.rmtree(self.path(version), ignore_errors=True)
+
+
+def read_current(data_dir: str) -> Optional[int]:
+    """Version number named by <data_dir>/CURRENT, or None before the first publish."""
+    try:
+        with open(os.path.join(data_dir, CURRENT_FILE), "r") as f:
+            match = _VERSION_RE.match(f.read().strip())
+    except FileNotFoundError:
+        return None
+    return int(match.group(1)) if match else None
+
+
+def current_paths(data_dir: str) -> Optional[dict]:
+    """FAISS, sparse index and manifest paths of the published version, for read-only consumers."""
+    version = read_current(data_dir)
+    if version is None:
+        return None
+    base = os.path.join(data_dir, VERSIONS_DIRNAME, f"v{version}")
+    return {
+        "version": version,
+        "faiss": os.path.join(base, FAISS_DIRNAME),
+        "sparse": os.path.join(base, SPARSE_DIRNAME),
+        "manifest": os.path.join(base, MANIFEST_FILENAME),
+    }
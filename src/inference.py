@@ -0,0 +1,387 @@
+# src/inference.py
+import os
+import json
+import inspect
+import time
+import shutil
+import threading
+from typing import List, Sequence, Tuple
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+from src.batching import BATCH_TOKEN_BUDGET, MAX_BATCH_SIZE, run_bucketed
+
+# "torch" runs both models through sentence-transformers; "onnx" runs int8
+# dynamically quantized ONNX exports of them on ONNX Runtime (CPU), without
+# importing torch. Exports are created on first use (which needs torch once).
+INFERENCE_BACKEND = os.getenv("RAG_INFERENCE_BACKEND", "torch")
+ONNX_MODEL_DIR = os.getenv("RAG_ONNX_MODEL_DIR", os.path.join("data", "onnx_models"))
+# ONNX Runtime intra-op threads (0 = one per physical core)
+ONNX_THREADS = int(os.getenv("RAG_ONNX_THREADS", "0"))
+
+EMBED_MODEL_NAME = "all-MiniLM-L6-v2"
+RERANK_MODEL_NAME = "cross-encoder/ms-marco-MiniLM-L-6-v2"
+# Chunks per embedding call: the batches streaming ingestion embeds and indexes,
+# and the fixed forward-pass batch when token-budget batching is off (budget 0)
+EMBED_BATCH_SIZE = 256
+ONNX_FILENAME = "model_int8.onnx"
+TOKENIZER_FILENAME = "tokenizer.json"
+CONFIG_FILENAME = "export.json"
+# An export is only kept if it matches PyTorch on PARITY_TEXTS: embedding cosine,
+# and cross-encoder scores over all pairs of them (correlated, or all within an
+# absolute error, for a model whose scores barely vary on the sample)
+MIN_PARITY_COSINE = 0.98
+MIN_PARITY_PEARSON = 0.98
+MAX_PARITY_SCORE_ERROR = 0.01
+PARITY_TEXTS = [
+    "The quarterly report shows revenue growth in all regions.",
+    "Employees may carry over up to five days of unused leave.",
+    "Reset your password from the account settings page.",
+    "The warranty covers manufacturing defects for two years.",
+    "Which documents do I need to file an expense claim?",
+    "How long are backups kept?",
+]
+
+
+def torch_device() -> str:
+    """Best available torch device: mps, cuda, else cpu."""
+    import torch
+    if torch.backends.mps.is_available():
+        return "mps"
+    if torch.cuda.is_available():
+        return "cuda"
+    return "cpu"
+
+
+def load_models(backend: str = INFERENCE_BACKEND) -> Tuple[Embeddings, object]:
+    """
+    The pipeline's (embeddings, cross-encoder) for a backend. Both backends
+    expose the same interface: LangChain Embeddings with normalized vectors,
+    and a cross-encoder with predict(pairs, batch_size) and a `tokenizer`.
+    Both batch their inputs by token budget (src/batching.py).
+    """
+    if backend == "onnx":
+        print(f"🚀 RAG Pipeline using ONNX Runtime int8 models from {ONNX_MODEL_DIR}")
+        return (OnnxEmbeddings(onnx_model_path(EMBED_MODEL_NAME, "embedder")),
+                OnnxCrossEncoder(onnx_model_path(RERANK_MODEL_NAME, "cross-encoder")))
+    if backend != "torch":
+        raise ValueError(f"Unknown RAG_INFERENCE_BACKEND {backend!r} (expected 'torch' or 'onnx')")
+    device = torch_device()
+    print(f"🚀 RAG Pipeline initialized on device: {device}")
+    return TorchEmbeddings(EMBED_MODEL_NAME, device), TorchCrossEncoder(RERANK_MODEL_NAME, device)
+
+
+class TorchEmbeddings(Embeddings):
+    """A sentence-transformers embedder (normalized vectors), called once per token-budget bucket."""
+
+    def __init__(self, model_name: str, device: str, token_budget: int = BATCH_TOKEN_BUDGET):
+        from sentence_transformers import SentenceTransformer
+        self.model = SentenceTransformer(model_name, device=device)
+        self.token_budget = token_budget
+
+    def encode(self, texts: List[str]) -> np.ndarray:
+        def encode_batch(batch):
+            return self.model.encode(batch, batch_size=max(1, len(batch)), normalize_embeddings=True,
+                                     convert_to_numpy=True, show_progress_bar=False)
+        if self.token_budget <= 0:
+            return self.model.encode(texts, batch_size=EMBED_BATCH_SIZE, normalize_embeddings=True,
+                                     convert_to_numpy=True, show_progress_bar=False)
+        lengths = token_lengths(self.model.tokenizer, texts, self.model.max_seq_length)
+        return run_bucketed(encode_batch, texts, lengths, self.token_budget)
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return self.encode(texts).tolist()
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.encode([text])[0].tolist()
+
+
+class TorchCrossEncoder:
+    """A sentence-transformers CrossEncoder whose predict() runs token-budget buckets of pairs."""
+
+    def __init__(self, model_name: str, device: str, token_budget: int = BATCH_TOKEN_BUDGET):
+        from sentence_transformers import CrossEncoder
+        self.model = CrossEncoder(model_name, device=device)
+        self.tokenizer = self.model.tokenizer
+        self.token_budget = token_budget
+
+    def predict(self, pairs: Sequence[Sequence[str]], batch_size: int = 32, **kwargs) -> np.ndarray:
+        def predict_batch(batch):
+            return self.model.predict(batch, batch_size=max(1, len(batch)), show_progress_bar=False)
+        if self.token_budget <= 0:
+            return self.model.predict(pairs, batch_size=batch_size, show_progress_bar=False)
+        max_length = getattr(self.model, "max_length", None) or self.tokenizer.model_max_length
+        lengths = token_lengths(self.tokenizer, pairs, max_length)
+        return run_bucketed(predict_batch, [list(pair) for pair in pairs], lengths, self.token_budget, batch_size)
+
+
+def token_lengths(tokenizer, inputs: Sequence, max_length: int) -> List[int]:
+    """Truncated token counts (special tokens included) of texts or (text, text) pairs."""
+    if not inputs:
+        return []
+    if isinstance(inputs[0], str):
+        encoded = tokenizer(list(inputs), truncation=True, max_length=max_length)
+    else:
+        encoded = tokenizer([pair[0] for pair in inputs], [pair[1] for pair in inputs],
+                            truncation=True, max_length=max_length)
+    return [len(ids) for ids in encoded["input_ids"]]
+
+
+# --- Export ---
+
+def onnx_model_path(model_name: str, kind: str) -> str:
+    """Directory of a model's int8 ONNX export, exporting it first if missing."""
+    path = os.path.join(ONNX_MODEL_DIR, model_name.replace("/", "__"))
+    if not os.path.exists(os.path.join(path, CONFIG_FILENAME)):
+        export_onnx(model_name, kind, path)
+    return path
+
+
+def export_onnx(model_name: str, kind: str, path: str):
+    """
+    Export a sentence-transformers model ("embedder": transformer body, pooling
+    done in NumPy; "cross-encoder": classification logits) to ONNX, quantize
+    its weights to int8 (dynamic quantization: activations are quantized per
+    batch at run time) and save it with its fast tokenizer. The export is
+    checked against the PyTorch model and deleted again if it diverges.
+    """
+    import torch
+    from onnxruntime.quantization import quantize_dynamic, QuantType
+    print(f"Exporting {model_name} to int8 ONNX in {path} ...")
+    start = time.time()
+    if kind == "embedder":
+        from sentence_transformers import SentenceTransformer
+        st_model = SentenceTransformer(model_name, device="cpu")
+        model, tokenizer, max_length = st_model[0].auto_model, st_model.tokenizer, st_model.max_seq_length
+        output_name, activation = "last_hidden_state", None
+    else:
+        from sentence_transformers import CrossEncoder
+        cross_encoder = CrossEncoder(model_name, device="cpu")
+        model, tokenizer = cross_encoder.model, cross_encoder.tokenizer
+        max_length = cross_encoder.max_length or tokenizer.model_max_length
+        output_name = "logits"
+        # predict() applies a sigmoid to single-label models
+        activation = "sigmoid" if model.config.num_labels == 1 else None
+    model.eval()
+
+    os.makedirs(path, exist_ok=True)
+    sample = tokenizer(["an example input"], ["for tracing"] if kind != "embedder" else None, return_tensors="pt")
+    input_names = [name for name in ("input_ids", "attention_mask", "token_type_ids") if name in sample]
+    dynamic = {name: {0: "batch", 1: "sequence"} for name in input_names}
+    dynamic[output_name] = {0: "batch", 1: "sequence"} if kind == "embedder" else {0: "batch"}
+    float_path = os.path.join(path, "model.onnx")
+
+    class Traced(torch.nn.Module):
+        # Inputs by keyword (forward signatures differ across transformers versions), first output only
+        def __init__(self):
+            super().__init__()
+            self.model = model
+
+        def forward(self, *inputs):
+            return self.model(**dict(zip(input_names, inputs)))[0]
+
+    # The TorchScript exporter: newer torch defaults to the dynamo one, which needs onnxscript
+    legacy = {"dynamo": False} if "dynamo" in inspect.signature(torch.onnx.export).parameters else {}
+    with torch.no_grad():
+        torch.onnx.export(
+            Traced(), tuple(sample[name] for name in input_names), float_path,
+            input_names=input_names, output_names=[output_name], dynamic_axes=dynamic, opset_version=14, **legacy,
+        )
+    quantize_dynamic(float_path, os.path.join(path, ONNX_FILENAME), weight_type=QuantType.QInt8)
+    os.remove(float_path)
+    tokenizer.backend_tokenizer.save(os.path.join(path, TOKENIZER_FILENAME))
+    with open(os.path.join(path, CONFIG_FILENAME), "w") as f:
+        json.dump({"model": model_name, "kind": kind, "max_length": max_length, "output": output_name,
+                   "activation": activation}, f)
+
+    # Parity check against PyTorch
+    if kind == "embedder":
+        report = parity(st_model.encode(PARITY_TEXTS, normalize_embeddings=True), OnnxEmbeddings(path).encode(PARITY_TEXTS))
+    else:
+        pairs = [(a, b) for a in PARITY_TEXTS for b in PARITY_TEXTS]
+        report = parity(cross_encoder.predict(pairs), OnnxCrossEncoder(path).predict(pairs))
+    if not parity_passed(report):
+        shutil.rmtree(path, ignore_errors=True)
+        raise ValueError(f"int8 ONNX export of {model_name} diverges from PyTorch: {report}")
+    print(f"Exported {model_name} in {time.time() - start:.1f}s (parity vs PyTorch: {report}).")
+
+
+# --- Runtime (onnxruntime + tokenizers only) ---
+
+class FastTokenizer:
+    """
+    A `tokenizers.Tokenizer` behind the small slice of the transformers
+    tokenizer call interface the pipeline uses (offsets for passage windows).
+    """
+
+    def __init__(self, path: str):
+        from tokenizers import Tokenizer
+        self.tokenizer = Tokenizer.from_file(path)
+        self.tokenizer.no_truncation()
+        self.tokenizer.no_padding()
+
+    def __call__(self, text: str, add_special_tokens: bool = True, return_offsets_mapping: bool = False) -> dict:
+        encoding = self.tokenizer.encode(text, add_special_tokens=add_special_tokens)
+        result = {"input_ids": encoding.ids, "attention_mask": encoding.attention_mask}
+        if return_offsets_mapping:
+            result["offset_mapping"] = encoding.offsets
+        return result
+
+
+class _OnnxModel:
+    """An exported model: ONNX Runtime session plus a truncating batch tokenizer."""
+
+    def __init__(self, path: str):
+        import onnxruntime as ort
+        from tokenizers import Tokenizer
+        with open(os.path.join(path, CONFIG_FILENAME)) as f:
+            self.config = json.load(f)
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if ONNX_THREADS:
+            options.intra_op_num_threads = ONNX_THREADS
+        self.session = ort.InferenceSession(os.path.join(path, ONNX_FILENAME), options,
+                                            providers=["CPUExecutionProvider"])
+        self.input_names = {node.name for node in self.session.get_inputs()}
+        # Unpadded: each bucket is padded to its own longest input in run()
+        self.batch_tokenizer = Tokenizer.from_file(os.path.join(path, TOKENIZER_FILENAME))
+        self.batch_tokenizer.enable_truncation(max_length=self.config["max_length"])
+        self.batch_tokenizer.no_padding()
+        self.pad_id = self.batch_tokenizer.token_to_id("[PAD]") or 0
+        self.tokenizer = FastTokenizer(os.path.join(path, TOKENIZER_FILENAME))
+
+    def encode(self, inputs: Sequence) -> list:
+        """Tokenize texts or (text, text) pairs once; run() takes batches of the encodings."""
+        return self.batch_tokenizer.encode_batch([tuple(item) if not isinstance(item, str) else item for item in inputs])
+
+    def run(self, encodings: list) -> Tuple[np.ndarray, np.ndarray]:
+        """Model output and attention mask for a batch of encodings, padded to its longest."""
+        width = max(len(e.ids) for e in encodings)
+        input_ids = np.full((len(encodings), width), self.pad_id, dtype=np.int64)
+        attention_mask = np.zeros((len(encodings), width), dtype=np.int64)
+        token_type_ids = np.zeros((len(encodings), width), dtype=np.int64)
+        for row, e in enumerate(encodings):
+            input_ids[row, :len(e.ids)] = e.ids
+            attention_mask[row, :len(e.ids)] = e.attention_mask
+            token_type_ids[row, :len(e.ids)] = e.type_ids
+        feeds = {"input_ids": input_ids, "attention_mask": attention_mask, "token_type_ids": token_type_ids}
+        feeds = {name: value for name, value in feeds.items() if name in self.input_names}
+        output = self.session.run([self.config["output"]], feeds)[0]
+        return output, attention_mask
+
+    def run_all(self, encodings: list, token_budget: int, max_batch: int, fn) -> np.ndarray:
+        """fn(run(batch)) over token-budget buckets (fixed, in-order batches of max_batch at budget 0)."""
+        if token_budget <= 0:
+            parts = [fn(self.run(encodings[start:start + max_batch])) for start in range(0, len(encodings), max_batch)]
+            return np.concatenate(parts) if parts else np.empty(0, dtype=np.float32)
+        return run_bucketed(lambda batch: fn(self.run(batch)), encodings, [len(e.ids) for e in encodings],
+                            token_budget, max_batch)
+
+
+class OnnxEmbeddings(Embeddings):
+    """all-MiniLM-L6-v2 on ONNX Runtime: mean pooling and L2 normalization, as sentence-transformers does."""
+
+    def __init__(self, path: str, token_budget: int = BATCH_TOKEN_BUDGET):
+        self.model = _OnnxModel(path)
+        self.token_budget = token_budget
+
+    @staticmethod
+    def _pool(output: Tuple[np.ndarray, np.ndarray]) -> np.ndarray:
+        hidden, mask = output
+        mask = mask[:, :, None].astype(np.float32)
+        pooled = (hidden * mask).sum(axis=1) / np.maximum(mask.sum(axis=1), 1e-9)
+        return (pooled / np.maximum(np.linalg.norm(pooled, axis=1, keepdims=True), 1e-12)).astype(np.float32)
+
+    def encode(self, texts: List[str]) -> np.ndarray:
+        max_batch = MAX_BATCH_SIZE if self.token_budget > 0 else EMBED_BATCH_SIZE
+        return self.model.run_all(self.model.encode(texts), self.token_budget, max_batch, self._pool)
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return self.encode(texts).tolist()
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.encode([text])[0].tolist()
+
+
+class OnnxCrossEncoder:
+    """ms-marco-MiniLM-L-6-v2 on ONNX Runtime with CrossEncoder.predict semantics (sigmoid scores)."""
+
+    def __init__(self, path: str, token_budget: int = BATCH_TOKEN_BUDGET):
+        self.model = _OnnxModel(path)
+        self.tokenizer = self.model.tokenizer
+        self.token_budget = token_budget
+
+    def predict(self, pairs: Sequence[Sequence[str]], batch_size: int = 32, **kwargs) -> np.ndarray:
+        def logits(output):
+            return output[0][:, 0] if output[0].shape[1] == 1 else output[0]
+        scores = self.model.run_all(self.model.encode(pairs), self.token_budget, batch_size, logits).astype(np.float32)
+        if self.model.config["activation"] == "sigmoid":
+            scores = 1.0 / (1.0 + np.exp(-scores))
+        return scores
+
+
+def parity(reference: np.ndarray, candidate: np.ndarray) -> dict:
+    """Agreement of two backends' outputs: cosine for vector rows, correlation and max error for scores."""
+    reference = np.asarray(reference, dtype=np.float64)
+    candidate = np.asarray(candidate, dtype=np.float64)
+    if reference.ndim == 2:
+        cosine = (reference * candidate).sum(axis=1) / (
+            np.linalg.norm(reference, axis=1) * np.linalg.norm(candidate, axis=1))
+        return {"min_cosine": float(cosine.min()), "mean_cosine": float(cosine.mean())}
+    return {"pearson": float(np.corrcoef(reference, candidate)[0, 1]),
+            "max_abs_error": float(np.abs(reference - candidate).max())}
+
+
+def parity_passed(report: dict) -> bool:
+    """Whether a parity() report is within the thresholds an export must meet."""
+    if "min_cosine" in report:
+        return report["min_cosine"] >= MIN_PARITY_COSINE
+    return report["pearson"] >= MIN_PARITY_PEARSON or report["max_abs_error"] <= MAX_PARITY_SCORE_ERROR
+
+
+class LazyModels:
+    """A backend's (embeddings, cross-encoder), loaded by the first caller that needs them (thread-safe)."""
+
+    def __init__(self, backend: str = INFERENCE_BACKEND):
+        self.backend = backend
+        self._models = None
+        self._lock = threading.Lock()
+
+    @property
+    def loaded(self) -> bool:
+        return self._models is not None
+
+    def get(self) -> Tuple[Embeddings, object]:
+        if self._models is None:
+            with self._lock:
+                if self._models is None:
+                    self._models = load_models(self.backend)
+        return self._models
+
+
+class LazyEmbeddings(Embeddings):
+    """Embeddings that load the model on the first embed call."""
+
+    def __init__(self, models: LazyModels):
+        self.models = models
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return self.models.get()[0].embed_documents(texts)
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.models.get()[0].embed_query(text)
+
+
+class LazyCrossEncoder:
+    """Cross-encoder that loads the model on the first predict (or tokenizer) use."""
+
+    def __init__(self, models: LazyModels):
+        self.models = models
+
+    @property
+    def tokenizer(self):
+        return self.models.get()[1].tokenizer
+
+    def predict(self, pairs: Sequence[Sequence[str]], batch_size: int = 32, **kwargs) -> np.ndarray:
+        return self.models.get()[1].predict(pairs, batch_size=batch_size, **kwargs)
@@ -1,179 +1,980 @@
 # Standard & Third Party Imports
-from concurrent.futures import ProcessPoolExecutor
-import streamlit as st
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
 import os
-import shutil
-import pickle
-from typing import List, Tuple, Optional
-from langchain_community.document_loaders import PyPDFLoader, TextLoader, UnstructuredMarkdownLoader, Docx2txtLoader
-from langchain_text_splitters import RecursiveCharacterTextSplitter
-from langchain_openai import OpenAIEmbeddings
+import asyncio
+import queue
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+from typing import Callable, Dict, List, Tuple, Optional, Iterator
 from langchain_community.vectorstores import FAISS
-from langchain_community.retrievers import BM25Retriever
 from langchain_core.documents import Document
-from sentence_transformers import CrossEncoder
 import numpy as np
 
 # Import worker from lightweight helper to avoid model re-loading in workers
-from src.ingest_helper import load_and_split
+from src.ingest_helper import load_and_split_many
+from src.worker_pool import IngestWorkerPool, PartAssembler, split_work, plan_tasks
+from src.manifest import IngestManifest, file_sha256
+from src.embedding_cache import EmbeddingCache, CachedEmbeddings
+from src.sparse_index import SparseIndex
+from src.index_store import IndexSnapshot, VersionStore, clone_vectorstore, link_tree
+from src.dense_index import (
+    ExactVectors, RESCORE_FACTOR, add_vectors, copy_index, has_chunk_ids, index_storage, index_type, is_lossy,
+    load_vectorstore, needs_rebuild, new_vectorstore, read_index, rebuild_vectorstore, rescore, search_params,
+    vectors_of,
+)
+from src.chunk_store import ChunkStore
+from src.filters import ChunkFilter
+from src.fusion import reciprocal_rank_fusion, RRF_K
+from src.rerank import CascadedReranker
+from src.inference import EMBED_BATCH_SIZE, EMBED_MODEL_NAME, INFERENCE_BACKEND, LazyModels, LazyEmbeddings, LazyCrossEncoder
+from src.query_cache import LRUCache, normalize_query, QUERY_EMBED_CACHE_SIZE, RESULT_CACHE_SIZE
 
 # Constants
 DATA_DIR = "data"
+# Pre-versioning index locations, adopted as the first version on startup
+# (live indexes are under data/versions/, see src/index_store.py)
 FAISS_INDEX_PATH = os.path.join(DATA_DIR, "faiss_index")
-BM25_INDEX_PATH = os.path.join(DATA_DIR, "bm25_index.pkl")
+SPARSE_INDEX_PATH = os.path.join(DATA_DIR, "sparse_index")
+MANIFEST_PATH = os.path.join(DATA_DIR, "ingest_manifest.json")
+EMBED_CACHE_DIR = os.path.join(DATA_DIR, "embedding_cache")
+# Max cached vectors (~768 bytes each at float16 for MiniLM's 384 dims)
+EMBED_CACHE_MAX_ENTRIES = 200_000
+
+# Streaming ingestion knobs: parsed files buffered ahead of the embedder and
+# worker tasks in flight per worker. Together with the chunks per embedding
+# call (EMBED_BATCH_SIZE, src/inference.py) they cap peak memory independently
+# of corpus size.
+PARSED_QUEUE_SIZE = 8
+TASKS_IN_FLIGHT_PER_WORKER = 2
+
+# Start a background compaction once this fraction of dense vectors is tombstoned
+COMPACT_TOMBSTONE_RATIO = 0.2
+
+# Queries per FAISS search call. FAISS switches flat search to BLAS at 20 queries,
+# so smaller blocks take the same exact code path as a single-query search.
+FAISS_SEARCH_BLOCK = 16
+
+# Threads shared by all searches for running the dense and sparse legs side by side
+SEARCH_POOL_WORKERS = 4
+
+# RRF weight of each retriever's ranking: (dense, sparse)
+FUSION_WEIGHTS = (1.0, 1.0)
+
+# Metadata filters: compiled chunk ID bitmaps kept per (filter, version), and the
+# largest filtered subset searched by brute force instead of an ID selector
+# (HNSW graph search misses neighbours when few nodes pass the filter)
+FILTER_CACHE_SIZE = 64
+FILTER_EXACT_MAX = 2048
+
+_STREAM_DONE = object()
+
+
+def source_name(path: str, root: Optional[str] = None) -> str:
+    """Manifest key of a file: its path relative to the ingest `root`, or its bare file name without one."""
+    if root:
+        return os.path.relpath(path, root).replace(os.sep, "/")
+    return os.path.basename(path)
+
+
+def stream_parsed(executor, tasks: List[List[tuple]], window: int, queue_size: int = PARSED_QUEUE_SIZE) -> Iterator[tuple]:
+    """
+    Yield (work unit, chunks) as workers finish parsing, in completion order.
+    A feeder thread keeps at most `window` tasks in flight and blocks on a bounded
+    queue when the consumer (the embedder) falls behind, so parsing overlaps with
+    embedding without letting parsed chunks pile up in memory.
+    Each task is a list of WorkUnits (see src.worker_pool).
+    """
+    out = queue.Queue(maxsize=queue_size)
+    stop = threading.Event()
+
+    def put(obj):
+        while not stop.is_set():
+            try:
+                out.put(obj, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def feed():
+        try:
+            pending = iter(tasks)
+            in_flight = {}
+
+            def submit_next():
+                task = next(pending, None)
+                if task is not None:
+                    in_flight[executor.submit(load_and_split_many, [unit.spec for unit in task])] = task
+
+            for _ in range(window):
+                submit_next()
+            while in_flight and not stop.is_set():
+                done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                for fut in done:
+                    task = in_flight.pop(fut)
+                    for unit, chunks in zip(task, fut.result()):
+                        if not put((unit, chunks)):
+                            return
+                    submit_next()
+        except Exception as e:
+            put(e)
+        finally:
+            put(_STREAM_DONE)
+
+    feeder = threading.Thread(target=feed, name="ingest-feeder", daemon=True)
+    feeder.start()
+    try:
+        while True:
+            msg = out.get()
+            if msg is _STREAM_DONE:
+                break
+            if isinstance(msg, Exception):
+                raise msg
+            yield msg
+    finally:
+        stop.set()
+        feeder.join()
 
 class RAGPipeline:
     def __init__(self):
-        # Determine device
-        import torch
-        device = "cpu"
-        if torch.backends.mps.is_available():
-            device = "mps"
-        elif torch.cuda.is_available():
-            device = "cuda"
-        print(f"🚀 RAG Pipeline initialized on device: {device}")
-
-        # Embeddings
-        from langchain_huggingface import HuggingFaceEmbeddings
-        model_kwargs = {'device': device}
-        # Increased batch size for speed
-        encode_kwargs = {'normalize_embeddings': True, 'batch_size': 64}
-        self.embeddings = HuggingFaceEmbeddings(
-            model_name="all-MiniLM-L6-v2",
-            model_kwargs=model_kwargs,
-            encode_kwargs=encode_kwargs
-        )
-        
-        # Reranker
-        self.reranker = CrossEncoder('cross-encoder/ms-marco-MiniLM-L-6-v2', device=device)
-        
         # Ensure data directory exists
         os.makedirs(DATA_DIR, exist_ok=True)
-        
-        # Load indices if they exist
-        self.vectorstore = None
-        self.bm25_retriever = None
-        self.load_indices()
 
-    def load_indices(self):
-        if os.path.exists(FAISS_INDEX_PATH):
+        # Embedder and cross-encoder on the selected backend (RAG_INFERENCE_BACKEND: torch or onnx),
+        # loaded on first use or by warm_up(), so constructing the pipeline stays cheap
+        self.models = LazyModels(INFERENCE_BACKEND)
+        # Chunk vectors are served from the on-disk cache first; only misses hit the model.
+        # int8 ONNX vectors differ slightly from PyTorch ones, so each backend has its own cache.
+        cache_model = EMBED_MODEL_NAME if INFERENCE_BACKEND == "torch" else f"{EMBED_MODEL_NAME}-{INFERENCE_BACKEND}-int8"
+        self.embedding_cache = EmbeddingCache(EMBED_CACHE_DIR, cache_model, capacity=EMBED_CACHE_MAX_ENTRIES)
+        self.embeddings = CachedEmbeddings(LazyEmbeddings(self.models), self.embedding_cache)
+
+        # Reranker
+        self.reranker = CascadedReranker(LazyCrossEncoder(self.models))
+
+        # Repeated questions: query vectors, and final results per index version
+        self.query_embedding_cache = LRUCache(QUERY_EMBED_CACHE_SIZE)
+        self.result_cache = LRUCache(RESULT_CACHE_SIZE)
+        self.filter_cache = LRUCache(FILTER_CACHE_SIZE)
+        # Bounded pool for search legs (FAISS, NumPy and torch release the GIL)
+        self.search_pool = ThreadPoolExecutor(max_workers=SEARCH_POOL_WORKERS, thread_name_prefix="search")
+
+        # Persistent parse/chunk workers, spawned on demand and reused across uploads
+        self.worker_pool = IngestWorkerPool()
+
+        # Chunk text and metadata by integer chunk ID; the indexes hold only IDs
+        self.chunk_store = ChunkStore(DATA_DIR)
+
+        # Versioned indexes: searches read the published `snapshot`; ingestion,
+        # deletion and compaction build the next version on the side (one writer
+        # at a time) and swap it in atomically
+        self.versions = VersionStore(DATA_DIR)
+        self._write_lock = threading.Lock()
+        self._compact_thread = None
+        self._snapshot = IndexSnapshot(0, None, SparseIndex(), IngestManifest(self.versions.manifest_path(0)), set())
+
+        # Indices are loaded on first access to the snapshot (or by warm_up())
+        self._load_lock = threading.RLock()
+        self._indices_loaded = False
+        self._loading = False
+        # CURRENT as of the snapshot being served (see refresh())
+        self._current_stamp = None
+        # Why the last warm_up() failed, for readiness()
+        self.warm_up_error: Optional[str] = None
+
+    @property
+    def snapshot(self) -> IndexSnapshot:
+        """The published index version; the first access loads it from disk."""
+        if not self._indices_loaded:
+            self._ensure_indices()
+        return self._snapshot
+
+    @snapshot.setter
+    def snapshot(self, snapshot: IndexSnapshot):
+        self._snapshot = snapshot
+
+    async def asnapshot(self) -> IndexSnapshot:
+        """
+        `snapshot` for coroutines, first switched to the version data/CURRENT
+        names (see refresh). Only a stat runs on the event loop; loading or
+        reloading the indices runs in a thread.
+        """
+        if self._indices_loaded and self.versions.current_stamp() in (None, self._current_stamp):
+            return self._snapshot
+        await asyncio.to_thread(self.refresh)
+        return self._snapshot
+
+    def _ensure_indices(self):
+        """Load the published indices once; other threads wait, re-entrant reads during loading see the placeholder."""
+        with self._load_lock:
+            if self._indices_loaded or self._loading:
+                return
+            self._loading = True
             try:
-                self.vectorstore = FAISS.load_local(
-                    FAISS_INDEX_PATH, 
-                    self.embeddings, 
-                    allow_dangerous_deserialization=True
-                )
-            except Exception as e:
-                print(f"Failed to load FAISS index: {e}")
-        
-        if os.path.exists(BM25_INDEX_PATH):
+                self.load_indices()
+                self._indices_loaded = True
+            finally:
+                self._loading = False
+
+    def refresh(self) -> bool:
+        """
+        Switch to the version named by data/CURRENT when another process has
+        published (or rolled back to) a different one since it was loaded.
+        Costs a stat of CURRENT per call; the file is only read once replaced.
+        Returns whether the snapshot changed.
+        """
+        self._ensure_indices()
+        stamp = self.versions.current_stamp()
+        if stamp is None or stamp == self._current_stamp:
+            return False
+        try:
+            return self._sync()
+        except Exception as e:
+            # e.g. pruned while loading; the next call retries
+            print(f"Failed to reload the published index version: {e}")
+            return False
+
+    def _sync(self) -> bool:
+        """Load the version CURRENT names if it is not the one being served; returns whether it switched."""
+        with self._load_lock:
+            stamp = self.versions.current_stamp()
+            if stamp is None or stamp == self._current_stamp:
+                return False
+            version = self.versions.current()
+            if version is None or version == self._snapshot.version:
+                self._current_stamp = stamp
+                return False
+            self._swap(self._load_version(version), stamp)
+        print(f"Reloaded index version v{version}.")
+        return True
+
+    def _swap(self, snapshot: IndexSnapshot, stamp: Optional[tuple]):
+        """Serve `snapshot` (the version CURRENT names, as of `stamp`) to new searches; under the load lock."""
+        self.snapshot = snapshot
+        self._current_stamp = stamp
+        # Keys carry the version, so stale results could never be served; drop them to free memory
+        self.result_cache.clear()
+        self.filter_cache.clear()
+
+    @contextmanager
+    def _writing(self):
+        """
+        Writer section: this process's writer lock, then the cross-process one on
+        data/versions/.lock. The snapshot is brought up to CURRENT before the
+        caller drafts from it, so a version another process published is built
+        on rather than overwritten. Taken after the indices are loaded (loading
+        takes the locks itself).
+        """
+        self._ensure_indices()
+        with self._write_lock, self.versions.lock():
+            self._sync()
+            yield
+
+    # Views of the published snapshot (each access may see a newer version)
+    @property
+    def vectorstore(self) -> Optional[FAISS]:
+        return self.snapshot.vectorstore
+
+    @property
+    def sparse_index(self) -> SparseIndex:
+        return self.snapshot.sparse_index
+
+    @property
+    def manifest(self) -> IngestManifest:
+        return self.snapshot.manifest
+
+    @property
+    def tombstones(self) -> set:
+        return self.snapshot.tombstones
+
+    def load_indices(self):
+        version = self.versions.current()
+        if version is not None:
             try:
-                with open(BM25_INDEX_PATH, "rb") as f:
-                    self.bm25_retriever = pickle.load(f)
+                snapshot = self._load_version(version)
             except Exception as e:
-                print(f"Failed to load BM25 index: {e}")
+                print(f"Failed to load index version v{version}: {e}")
+            else:
+                self.snapshot = snapshot
+                with self._write_lock, self.versions.lock():
+                    # Another process may have published (or upgraded) since
+                    self._sync()
+                    self._upgrade(self._snapshot)
+                return
+        if os.path.exists(FAISS_INDEX_PATH):
+            self._migrate_legacy()
+
+    def _upgrade(self, snapshot: IndexSnapshot) -> int:
+        """
+        Republish a loaded (current) version written by an older layout as the
+        next version; returns the version now current. Chunk text still in the
+        FAISS docstore moves to the chunk store, and a position -> chunk ID map
+        becomes an IndexIDMap (the dense index is rebuilt on publish).
+        """
+        if snapshot.vectorstore is None:
+            return snapshot.version
+        if len(snapshot.vectorstore.docstore._dict):
+            return self._adopt_docstore(snapshot.vectorstore, snapshot.manifest, snapshot.tombstones, snapshot.exact)
+        if not has_chunk_ids(snapshot.vectorstore.index):
+            print("Storing chunk IDs in the dense index...")
+            draft = self._draft(dense=True)
+            self._publish(draft, dense_changed=True)
+            return draft.version
+        return snapshot.version
+
+    def _load_version(self, version: int) -> IndexSnapshot:
+        vectorstore = None
+        exact = None
+        faiss_path = self.versions.faiss_path(version)
+        if os.path.exists(faiss_path):
+            # Memory-mapped and read-only: every process shares one copy of the codes
+            vectorstore = load_vectorstore(faiss_path, self.embeddings)
+            exact = ExactVectors.load(faiss_path, vectorstore.index.d)
+        if vectorstore is not None and len(vectorstore.docstore._dict):
+            # Pre-chunk-store version (string chunk IDs): the sparse index is rebuilt on adoption
+            sparse_index = SparseIndex()
+        else:
+            # Memory-mapped: only index.json is read eagerly
+            sparse_index = SparseIndex.load(self.versions.sparse_path(version))
+        manifest = IngestManifest(self.versions.manifest_path(version))
+        return IndexSnapshot(version, vectorstore, sparse_index, manifest, set(manifest.tombstones), exact)
+
+    def _migrate_legacy(self):
+        """Adopt the pre-versioning data/faiss_index + data/sparse_index layout as the first version."""
+        try:
+            vectorstore = FAISS.load_local(
+                FAISS_INDEX_PATH, 
+                self.embeddings, 
+                allow_dangerous_deserialization=True
+            )
+        except Exception as e:
+            print(f"Failed to load FAISS index: {e}")
+            return
+        # The legacy sparse index (keyed by string IDs) is rebuilt from the docstore chunks
+        manifest = IngestManifest(MANIFEST_PATH)
+        with self._write_lock, self.versions.lock():
+            if self.versions.current() is not None:
+                # Another process migrated first
+                self._sync()
+                return
+            version = self._adopt_docstore(vectorstore, manifest, set(manifest.tombstones))
+        print(f"Migrated existing indexes to {self.versions.path(version)}")
+
+    def _adopt_docstore(self, vectorstore: FAISS, manifest: IngestManifest, tombstones: set,
+                        exact: Optional[ExactVectors] = None) -> int:
+        """
+        Publish an index whose chunk text lives in the FAISS docstore as the next
+        version: move the chunks into the chunk store under new integer IDs, remap
+        the manifest and tombstones, and rebuild the sparse index over those IDs.
+        """
+        version = self.versions.next_version()
+        positions = sorted(vectorstore.index_to_docstore_id)
+        old_ids = [vectorstore.index_to_docstore_id[p] for p in positions]
+        docs = [vectorstore.docstore._dict[doc_id] for doc_id in old_ids]
+        print(f"Moving {len(docs)} chunks into the chunk store...")
+        new_ids = self.chunk_store.add(docs, version)
+        remap = dict(zip(old_ids, new_ids))
+
+        adopted = new_vectorstore(self.embeddings, vectorstore.index.d)
+        adopted.index = copy_index(vectorstore.index)
+        adopted.index_to_docstore_id = {p: remap[doc_id] for p, doc_id in zip(positions, old_ids)}
+        dead = {remap[doc_id] for doc_id in tombstones if doc_id in remap}
+        sparse_index = SparseIndex()
+        sparse_index.add_documents(docs, new_ids)
+        sparse_index.delete(dead)
+        manifest = manifest.fork(self.versions.manifest_path(version))
+        for source, entry in list(manifest.entries.items()):
+            manifest.entries[source] = {**entry, "chunk_ids": [remap[c] for c in entry["chunk_ids"] if c in remap]}
+        self._publish(IndexSnapshot(version, adopted, sparse_index, manifest, dead, exact), dense_changed=True)
+        return version
+
+    def _draft(self, dense: bool) -> IndexSnapshot:
+        """
+        Start the next version from the published one. The sparse index and the
+        manifest are forked copy-on-write; FAISS is cloned only when the writer
+        will add or remove vectors (`dense`), otherwise it is shared.
+        """
+        base = self.snapshot
+        version = self.versions.next_version()
+        vectorstore = base.vectorstore
+        exact = base.exact
+        if dense and vectorstore:
+            vectorstore = clone_vectorstore(vectorstore)
+            exact = exact.fork() if exact is not None else None
+        manifest = base.manifest.fork(self.versions.manifest_path(version))
+        return IndexSnapshot(version, vectorstore, base.sparse_index.fork(), manifest, set(base.tombstones), exact)
+
+    def _rebuild(self, draft: IndexSnapshot, keep: Optional[np.ndarray] = None, kind: Optional[str] = None):
+        """Rebuild the draft's dense index, keeping float32 originals alongside lossy storage."""
+        vectors = rebuild_vectorstore(draft.vectorstore, keep=keep, kind=kind, exact=draft.exact)
+        index = draft.vectorstore.index
+        draft.exact = ExactVectors(index.d, [vectors]) if is_lossy(index_storage(index)) else None
+
+    def _publish(self, draft: IndexSnapshot, dense_changed: bool):
+        """Write a draft to versions/v<N>, point CURRENT at it, then swap it in for new searches."""
+        base = self.snapshot
+        if dense_changed and draft.vectorstore:
+            # Flat -> HNSW -> IVF as the corpus grows (or shrinks)
+            kind = needs_rebuild(draft.vectorstore.index)
+            if kind:
+                print(f"Rebuilding dense index as {kind} for {draft.vectorstore.index.ntotal} vectors...")
+                self._rebuild(draft, kind=kind)
+        try:
+            os.makedirs(self.versions.path(draft.version), exist_ok=True)
+            if draft.vectorstore:
+                faiss_path = self.versions.faiss_path(draft.version)
+                if dense_changed or base.vectorstore is None:
+                    draft.vectorstore.save_local(faiss_path)
+                    if draft.exact is not None:
+                        draft.exact.save(faiss_path)
+                    # Serve the saved files memory-mapped rather than the in-memory draft copies
+                    draft.vectorstore.index = read_index(faiss_path)
+                    draft.exact = ExactVectors.load(faiss_path, draft.vectorstore.index.d)
+                else:
+                    # Unchanged dense index: the previous version's files are immutable, share them
+                    link_tree(self.versions.faiss_path(base.version), self.versions.faiss_path(draft.version))
+            # Merges started on the draft finish first: a published version's
+            # segments (and so its IDF and doc counts) never change afterwards
+            draft.sparse_index.wait_for_merges()
+            draft.sparse_index.save(self.versions.sparse_path(draft.version))
+            # Manifest last: only claim files are indexed once the indexes are on disk
+            draft.manifest.tombstones = sorted(draft.tombstones)
+            draft.manifest.save()
+            # CURRENT and the served snapshot move together, so refresh() never reloads our own publish
+            with self._load_lock:
+                self.versions.publish(draft.version)
+                self._swap(draft, self.versions.current_stamp())
+        except Exception:
+            self.versions.discard(draft.version)
+            self.chunk_store.discard(draft.version)
+            raise
+        # Chunks compacted away before the oldest kept version are unreachable now
+        self.chunk_store.purge(self.versions.versions()[0])
+        print(f"Published index version v{draft.version}.")
+
+    def rollback(self, version: Optional[int] = None) -> int:
+        """Make a kept older version current again (default: the one before the current)."""
+        with self._writing():
+            kept = [v for v in self.versions.versions() if v != self.snapshot.version]
+            if version is None:
+                older = [v for v in kept if v < self.snapshot.version]
+                if not older:
+                    raise ValueError("No older index version to roll back to")
+                version = older[-1]
+            elif version not in kept:
+                raise ValueError(f"Index version v{version} is not available")
+            snapshot = self._load_version(version)
+            with self._load_lock:
+                self.versions.publish(version)
+                self.chunk_store.restore(version)
+                # Rows only newer (now abandoned) versions reference must stay purgeable
+                self.chunk_store.retain(snapshot.referenced_ids(), self.versions.next_version())
+                self._swap(snapshot, self.versions.current_stamp())
+            version = self._upgrade(snapshot)
+        print(f"Rolled back to index version v{version}.")
+        return version
 
     def render_upload_ui(self):
         """Streamlit UI for uploading and ingesting files."""
         # Legacy stub for compatibility
         pass
 
-    def process_documents(self, file_paths: List[str]):
-        """Parallel Load, Chunk, and Index."""
-        print(f"Propocessing {len(file_paths)} files with parallel workers...")
-        
-        chunks = []
-        # Use ProcessPool for CPU-bound loading/splitting
-        with ProcessPoolExecutor(max_workers=os.cpu_count()) as executor:
-            results = executor.map(load_and_split, file_paths)
-            for res in results:
-                chunks.extend(res)
-        
-        if not chunks:
+    def process_documents(self, file_paths: List[str], progress: Optional[Callable[[dict], None]] = None,
+                          digests: Optional[Dict[str, str]] = None, root: Optional[str] = None) -> dict:
+        """
+        Parallel Load, Chunk, and Index.
+        Files whose content hash matches the manifest are skipped; changed files
+        have their previous chunks replaced. Returns added/updated/skipped counts.
+        `progress`, if given, receives {"file", "status", "chunks"} when a file is
+        skipped or fully parsed and {"chunks_indexed"} after every embedded batch.
+        `digests` maps paths to content hashes already computed (e.g. while uploading).
+        Files are identified by their name, or by their path relative to `root`
+        when given (so a/report.pdf and b/report.pdf are different documents);
+        two files with the same identity in one call are rejected.
+        Indexing goes into a new index version, published when complete; searches
+        keep using the previous version until then.
+        """
+        stats = {"added": 0, "updated": 0, "skipped": 0, "chunks": 0, "failed": [], "embedding_cache_hit_rate": 0.0}
+        report = progress or (lambda event: None)
+        sources = [source_name(path, root) for path in file_paths]
+        duplicates = sorted(source for source, count in Counter(sources).items() if count > 1)
+        if duplicates:
+            raise ValueError(f"Several files would be indexed as {', '.join(duplicates)}"
+                             + ("" if root else "; pass `root` to tell them apart by relative path"))
+        with self._writing():
+            self._process_documents(file_paths, sources, digests, stats, report)
+        self.maybe_compact()
+        return stats
+
+    def _process_documents(self, file_paths: List[str], sources: List[str], digests: Optional[Dict[str, str]],
+                           stats: dict, report):
+        self.embedding_cache.reset_stats()
+
+        # 1. Diff against the manifest
+        pending = []
+        stale_ids = []
+        for path, source in zip(file_paths, sources):
+            digest = (digests or {}).get(path) or file_sha256(path)
+            entry = self.manifest.get(source)
+            if entry and entry["hash"] == digest:
+                stats["skipped"] += 1
+                report({"file": source, "status": "skipped", "chunks": len(entry["chunk_ids"])})
+                continue
+            if entry:
+                stale_ids.extend(entry["chunk_ids"])
+                stats["updated"] += 1
+            else:
+                stats["added"] += 1
+            pending.append((path, source, digest))
+
+        if not pending:
+            print(f"All {len(file_paths)} files unchanged. Nothing to index.")
+            return
+
+        # 2. Next version on the side; tombstone superseded chunks of changed files there
+        draft = self._draft(dense=True)
+        if stale_ids:
+            self._tombstone(draft, stale_ids)
+            print(f"Removed {len(stale_ids)} superseded chunks.")
+        try:
+            self._index_pending(draft, pending, stale_ids, stats, report)
+        except Exception:
+            self.chunk_store.discard(draft.version)
+            raise
+        finally:
+            # Vectors embedded before a failure stay valid; keep them for the retry
+            self.embedding_cache.flush()
+
+    def _index_pending(self, draft: IndexSnapshot, pending: List[tuple], stale_ids: list, stats: dict, report):
+        # 3. Streaming Load -> Chunk -> Embed -> Append
+        # Workers keep parsing while the main thread embeds fixed-size batches,
+        # and each batch is appended to FAISS before the next is collected.
+        # Large PDFs are cut into page ranges; small files are packed into shared tasks
+        units = split_work(pending, self.worker_pool.max_workers)
+        tasks = plan_tasks(units)
+        print(f"Processing {len(pending)} files as {len(tasks)} worker tasks ({stats['skipped']} unchanged)...")
+        batch: List[Document] = []
+        batch_ids: List[int] = []
+        file_ids = {}
+        # Parts that failed to parse, per file; a file with any failed part is not indexed
+        failed_parts: Dict[tuple, List[str]] = {}
+        failed_ids: List[int] = []
+        assembler = PartAssembler()
+        # The persistent pool only grows when a job has more tasks than warm workers
+        executor = self.worker_pool.executor(len(tasks))
+        window = min(len(tasks), self.worker_pool.size * TASKS_IN_FLIGHT_PER_WORKER)
+        for unit, res in stream_parsed(executor, tasks, window=window):
+            if res is None:
+                failed_parts.setdefault(unit.item, []).append(
+                    f"pages {unit.spec[1] + 1}-{unit.spec[2]}" if isinstance(unit.spec, tuple) else "the file")
+                res = []
+            # Page ranges are released in page order, whatever order workers finish in
+            for (path, source, digest), chunks, last_part in assembler.add(unit, res):
+                # Workers label chunks with the bare file name; the manifest key identifies the file
+                for chunk in chunks:
+                    chunk.metadata["source"] = source
+                # Text goes to the chunk store now; only the IDs travel on to the indexes
+                ids = self.chunk_store.add(chunks, draft.version)
+                file_ids.setdefault(source, []).extend(ids)
+                if last_part:
+                    source_ids = file_ids.pop(source)
+                    errors = failed_parts.pop((path, source, digest), None)
+                    if source_ids and not errors:
+                        draft.manifest.record(source, digest, source_ids)
+                        report({"file": source, "status": "parsed", "chunks": len(source_ids)})
+                    else:
+                        # Nothing indexable (unsupported or failed parse), or only part of it: forget
+                        # the file so a retry re-parses it whole, and drop the parts that did parse
+                        draft.manifest.remove(source)
+                        failed_ids.extend(source_ids)
+                        stats["failed"].append(source)
+                        event = {"file": source, "status": "failed", "chunks": 0}
+                        if errors:
+                            event["error"] = f"could not parse {', '.join(errors)}"
+                        report(event)
+                batch.extend(chunks)
+                batch_ids.extend(ids)
+            while len(batch) >= EMBED_BATCH_SIZE:
+                self._index_batch(draft, batch[:EMBED_BATCH_SIZE], batch_ids[:EMBED_BATCH_SIZE])
+                stats["chunks"] += EMBED_BATCH_SIZE
+                del batch[:EMBED_BATCH_SIZE], batch_ids[:EMBED_BATCH_SIZE]
+                report({"chunks_indexed": stats["chunks"]})
+        if batch:
+            self._index_batch(draft, batch, batch_ids)
+            stats["chunks"] += len(batch)
+            report({"chunks_indexed": stats["chunks"]})
+        if failed_ids:
+            # Embedded with their batches already; tombstoned until compaction
+            self._tombstone(draft, failed_ids)
+
+        if not stats["chunks"] and not stale_ids:
             print("No new chunks to index.")
             return
 
-        print(f"Generated {len(chunks)} chunks. Updating indexes...")
+        stats["embedding_cache_hit_rate"] = round(self.embedding_cache.hit_rate, 4)
+        print(f"Embedded {stats['chunks']} chunks (cache hit rate {stats['embedding_cache_hit_rate']:.1%}). Saving indexes...")
 
-        # Dense Indexing (GPU Accelerated via embeddings batch_size)
-        if self.vectorstore:
-            self.vectorstore.add_documents(chunks)
-        else:
-            self.vectorstore = FAISS.from_documents(chunks, self.embeddings)
-        self.vectorstore.save_local(FAISS_INDEX_PATH)
-
-        # Sparse Indexing (Re-build BM25 from ALL vectorstore docs + new chunks)
-        # Fix: Previously, we discarded old BM25 data on new upload. Now we merge.
-        all_docs_for_bm25 = []
-        if self.vectorstore and hasattr(self.vectorstore, "docstore"):
-            # Fetch existing docs from FAISS in-memory docstore
-            try:
-                all_docs_for_bm25.extend(list(self.vectorstore.docstore._dict.values()))
-            except Exception as e:
-                print(f"Warning: Could not fetch existing docs from FAISS: {e}")
-        
-        # Add new chunks (if not already in vectorstore, though they just were added)
-        # Note: vectorstore.add_documents adds them to docstore too, so they might be duplicated if we blindly add.
-        # Actually, self.vectorstore.add_documents(chunks) updates the docstore.
-        # So fetching .values() AFTER add_documents should be sufficient!
-        
-        if not all_docs_for_bm25:
-            all_docs_for_bm25 = chunks
+        # Sparse Indexing: new chunks were appended as their own segments batch by
+        # batch above, so only the new segments are written; older ones are hard-linked.
+        self._publish(draft, dense_changed=True)
             
-        self.bm25_retriever = BM25Retriever.from_documents(all_docs_for_bm25)
+        print(f"Indexed {stats['chunks']} new chunks. Total BM25 Docs: {len(draft.sparse_index)}")
+        print(f"Files added: {stats['added']}, updated: {stats['updated']}, skipped: {stats['skipped']}, "
+              f"failed: {len(stats['failed'])}")
 
-        with open(BM25_INDEX_PATH, "wb") as f:
-            pickle.dump(self.bm25_retriever, f)
-            
-        print(f"Indexed {len(chunks)} new chunks. Total BM25 Docs: {len(all_docs_for_bm25)}")
+    # --- Deletion & Compaction ---
+
+    def delete_source(self, source: str) -> int:
+        """
+        Remove every chunk of a source file from both indexes.
+        Chunks are tombstoned (hidden from searches as soon as the new version
+        is published) and physically reclaimed by compaction.
+        Returns the number of chunks deleted.
+        """
+        with self._writing():
+            if not self.manifest.get(source):
+                return 0
+            # Tombstones only: the dense index itself is shared with the previous version
+            draft = self._draft(dense=False)
+            ids = draft.manifest.remove(source)
+            self._tombstone(draft, ids)
+            self._publish(draft, dense_changed=False)
+        print(f"Deleted {len(ids)} chunks of {source}.")
+        self.maybe_compact()
+        return len(ids)
+
+    def _tombstone(self, draft: IndexSnapshot, ids: List[int]):
+        draft.tombstones.update(ids)
+        draft.sparse_index.delete(ids)
+
+    def maybe_compact(self):
+        """Start a background compaction once tombstones pass COMPACT_TOMBSTONE_RATIO of the dense index."""
+        snapshot = self.snapshot
+        total = snapshot.vectorstore.index.ntotal if snapshot.vectorstore else 0
+        if total and len(snapshot.tombstones) >= COMPACT_TOMBSTONE_RATIO * total:
+            self.compact_in_background()
+
+    def compact_in_background(self) -> bool:
+        """Run compact() on a background thread; returns False if one is already running."""
+        if self._compact_thread and self._compact_thread.is_alive():
+            return False
+        self._compact_thread = threading.Thread(target=self.compact, name="index-compaction", daemon=True)
+        self._compact_thread.start()
+        return True
+
+    def compact(self) -> dict:
+        """
+        Physically drop tombstoned chunks in a new index version: remove their
+        vectors from FAISS, rewrite the sparse segments that hold them, and
+        publish with the tombstones cleared. Their chunk store rows are purged
+        once no kept version references them.
+        """
+        with self._writing():
+            ids = list(self.tombstones)
+            if not ids:
+                return {"dense_removed": 0, "sparse_removed": 0}
+            draft = self._draft(dense=True)
+            dense_removed = 0
+            if draft.vectorstore:
+                # Rebuilt rather than remove_ids: HNSW does not support removal
+                keep = np.flatnonzero(~np.isin(draft.chunk_ids(), draft.dead_ids()))
+                before = draft.vectorstore.index.ntotal
+                if len(keep) < before:
+                    self._rebuild(draft, keep=keep)
+                    dense_removed = before - draft.vectorstore.index.ntotal
+            sparse_before = draft.sparse_index.num_docs
+            draft.sparse_index.compact()
+            draft.tombstones.difference_update(ids)
+            self._publish(draft, dense_changed=True)
+            self.chunk_store.mark_removed(ids, draft.version)
+        stats = {"dense_removed": dense_removed, "sparse_removed": sparse_before - draft.sparse_index.num_docs}
+        print(f"Compaction removed {stats['dense_removed']} dense and {stats['sparse_removed']} sparse chunks.")
+        return stats
+
+    def warm_up_workers(self):
+        """Pre-spawn ingestion workers (called at server startup)."""
+        self.worker_pool.warm()
+
+    def shutdown(self):
+        """Stop background work owned by the pipeline."""
+        self.worker_pool.shutdown()
+        self.search_pool.shutdown(wait=True)
+        if self._compact_thread:
+            self._compact_thread.join()
+        # Not self.snapshot: shutting down must not load indices that were never used
+        self._snapshot.sparse_index.wait_for_merges()
+
+    def warm_up(self):
+        """
+        Load the indices and models and run one query through both models, so
+        the first request does not pay for it (called at server startup).
+        """
+        start = time.time()
+        try:
+            self._ensure_indices()
+            embeddings, cross_encoder = self.models.get()
+            embeddings.embed_query("warm up")
+            cross_encoder.predict([["warm up", "warm up"]])
+        except Exception as e:
+            self.warm_up_error = f"{type(e).__name__}: {e}"
+            raise
+        self.warm_up_error = None
+        print(f"Pipeline warm ({INFERENCE_BACKEND} backend, index v{self._snapshot.version}) "
+              f"in {time.time() - start:.1f}s.")
 
-    def hybrid_search(self, query: str, k_fusion: int = 25, k_final: int = 5) -> List[Document]:
+    def readiness(self) -> dict:
+        """Whether the indices and models are loaded, without loading them."""
+        return {
+            "ready": self._indices_loaded and self.models.loaded,
+            "indices": self._indices_loaded,
+            "models": self.models.loaded,
+            "backend": INFERENCE_BACKEND,
+            "version": self._snapshot.version if self._indices_loaded else None,
+            "error": self.warm_up_error,
+        }
+
+    def _index_batch(self, draft: IndexSnapshot, docs: List[Document], ids: List[int]):
+        """Embed one batch of chunks and append their IDs to the draft's dense and sparse indexes."""
+        vectors = self.embeddings.embed_documents([doc.page_content for doc in docs])
+        if not draft.vectorstore:
+            draft.vectorstore = new_vectorstore(self.embeddings, len(vectors[0]))
+        add_vectors(draft.vectorstore, vectors, ids)
+        if draft.exact is not None:
+            draft.exact.append(vectors)
+        draft.sparse_index.add_documents(docs, ids)
+
+    def hybrid_search(self, query: str, k_fusion: int = 25, k_final: int = 5,
+                      chunk_filter: Optional[ChunkFilter] = None) -> List[Document]:
         """
         Execute Hybrid Search (Dense + Sparse) with RRF and Reranking.
+        The published snapshot is read once, so both legs see the same version.
+        `chunk_filter` restricts both legs to matching chunks before their top-k.
+        Results are cached per (normalized query, k_fusion, k_final, filter, version).
         """
-        if not self.vectorstore or not self.bm25_retriever:
-            return []
+        return self.hybrid_search_batch([query], k_fusion, k_final, chunk_filter)[0]
 
-        # 1. Retrieve Candidate Lists
-        dense_results = self.vectorstore.similarity_search(query, k=k_fusion)
-        
-        self.bm25_retriever.k = k_fusion
-        sparse_results = self.bm25_retriever.invoke(query)
+    def hybrid_search_batch(self, queries: List[str], k_fusion: int = 25, k_final: int = 5,
+                            chunk_filter: Optional[ChunkFilter] = None) -> List[List[Document]]:
+        """
+        hybrid_search for many queries: one embedding pass, blocked FAISS
+        searches, shared BM25 term scoring and a single CrossEncoder.predict
+        over every (query, candidate) pair. Returns one result list per query.
+        """
+        # Serve what data/CURRENT names, which another process may have replaced
+        self.refresh()
+        snapshot = self.snapshot
+        if not snapshot.vectorstore:
+            return [[] for _ in queries]
 
-        # 2. Reciprocal Rank Fusion (k=60)
-        fused_docs = self._rrf(dense_results, sparse_results, k=60)
-        top_fusion = fused_docs[:k_fusion]
+        results: List[Optional[List[Document]]] = [None] * len(queries)
+        pending = {}
+        for i, query in enumerate(queries):
+            cache_key = self._result_key(query, k_fusion, k_final, chunk_filter, snapshot)
+            cached = self.result_cache.get(cache_key)
+            if cached is not None:
+                results[i] = list(cached)
+            else:
+                pending.setdefault(cache_key, []).append(i)
+        if pending:
+            keys = list(pending)
+            allowed = self._allowed(snapshot, chunk_filter)
+            batch = self._hybrid_search(snapshot, [queries[pending[key][0]] for key in keys], k_fusion, k_final, allowed)
+            for key, docs in zip(keys, batch):
+                self.result_cache.put(key, tuple(docs))
+                for i in pending[key]:
+                    results[i] = list(docs)
+        return results
 
-        # 3. Cross-Encoder Reranking
-        if not top_fusion:
+    async def ahybrid_search(self, query: str, k_fusion: int = 25, k_final: int = 5,
+                             chunk_filter: Optional[ChunkFilter] = None) -> List[Document]:
+        """
+        hybrid_search as a coroutine: the dense and sparse legs run concurrently
+        on the bounded search pool, followed by fusion and reranking there, so
+        the event loop never blocks. Only the captured snapshot and the
+        thread-safe caches are touched, so any number of sessions may call it.
+        """
+        snapshot = await self.asnapshot()
+        if not snapshot.vectorstore:
             return []
-            
-        pairs = [[query, doc.page_content] for doc in top_fusion]
-        # Optimization: Use batch_size for faster inference on GPU/MPS
-        scores = self.reranker.predict(pairs, batch_size=32)
-        
-        # Sort by cross-encoder score
-        ranked = sorted(zip(top_fusion, scores), key=lambda x: x[1], reverse=True)
-        return [doc for doc, score in ranked[:k_final]]
-
-    def _rrf(self, list1: List[Document], list2: List[Document], k: int = 60) -> List[Document]:
-        """Combine two lists using Reciprocal Rank Fusion."""
-        scores = {}
-        doc_map = {}
-        
-        # Helper to process a list
-        def process_list(doc_list):
-            for rank, doc in enumerate(doc_list):
-                content = doc.page_content
-                if content not in doc_map:
-                    doc_map[content] = doc
-                scores[content] = scores.get(content, 0.0) + 1.0 / (k + rank + 1)
-        
-        process_list(list1)
-        process_list(list2)
-        
-        sorted_content = sorted(scores.keys(), key=lambda x: scores[x], reverse=True)
-        return [doc_map[c] for c in sorted_content]
+        cache_key = self._result_key(query, k_fusion, k_final, chunk_filter, snapshot)
+        cached = self.result_cache.get(cache_key)
+        if cached is not None:
+            return list(cached)
+
+        loop = asyncio.get_running_loop()
+        allowed = await loop.run_in_executor(self.search_pool, self._allowed, snapshot, chunk_filter)
+        dense_lists, sparse_lists = await asyncio.gather(
+            loop.run_in_executor(self.search_pool, self._dense_leg, snapshot, [query], k_fusion, allowed),
+            loop.run_in_executor(self.search_pool, self._sparse_leg, snapshot, [query], k_fusion, allowed),
+        )
+        results = await loop.run_in_executor(
+            self.search_pool, self._fuse_and_rerank, [query], dense_lists, sparse_lists, k_fusion, k_final
+        )
+        self.result_cache.put(cache_key, tuple(results[0]))
+        return results[0]
+
+    @staticmethod
+    def _result_key(query: str, k_fusion: int, k_final: int, chunk_filter: Optional[ChunkFilter],
+                    snapshot: IndexSnapshot) -> tuple:
+        filter_key = chunk_filter.key() if chunk_filter is not None and not chunk_filter.is_empty() else None
+        return (normalize_query(query), k_fusion, k_final, filter_key, snapshot.version)
+
+    def _allowed(self, snapshot: IndexSnapshot, chunk_filter: Optional[ChunkFilter]) -> Optional[np.ndarray]:
+        """
+        The filter compiled into a boolean bitmap indexed by chunk ID: chunks
+        the chunk store matches, minus tombstones. None means unfiltered.
+        Cached per (filter, version), since a version's chunks never change.
+        """
+        if chunk_filter is None or chunk_filter.is_empty():
+            return None
+        cache_key = (chunk_filter.key(), snapshot.version)
+        allowed = self.filter_cache.get(cache_key)
+        if allowed is None:
+            matched = self.chunk_store.match(chunk_filter)
+            chunk_ids = snapshot.chunk_ids()
+            size = max(int(chunk_ids[-1]) if len(chunk_ids) else -1, int(matched[-1]) if len(matched) else -1) + 1
+            allowed = np.zeros(size, dtype=bool)
+            allowed[matched] = True
+            allowed[snapshot.dead_ids()] = False
+            allowed.setflags(write=False)
+            self.filter_cache.put(cache_key, allowed)
+        return allowed
+
+    def _hybrid_search(self, snapshot: IndexSnapshot, queries: List[str], k_fusion: int, k_final: int,
+                       allowed: Optional[np.ndarray] = None) -> List[List[Document]]:
+        # 1. Retrieve Candidate Lists: the sparse leg runs on the search pool meanwhile
+        sparse_future = self.search_pool.submit(self._sparse_leg, snapshot, queries, k_fusion, allowed)
+        dense_lists = self._dense_leg(snapshot, queries, k_fusion, allowed)
+        sparse_lists = sparse_future.result()
+        return self._fuse_and_rerank(queries, dense_lists, sparse_lists, k_fusion, k_final)
+
+    def _dense_leg(self, snapshot: IndexSnapshot, queries: List[str], k: int,
+                   allowed: Optional[np.ndarray] = None) -> List[List[int]]:
+        return self._dense_search(snapshot, self._embed_queries(queries), k=k, allowed=allowed)
+
+    def _sparse_leg(self, snapshot: IndexSnapshot, queries: List[str], k: int,
+                    allowed: Optional[np.ndarray] = None) -> List[List[int]]:
+        hits = snapshot.sparse_index.search_batch(queries, k=k, allowed=allowed)
+        return [[chunk_id for chunk_id, _ in query_hits] for query_hits in hits]
+    def _fuse_and_rerank(self, queries: List[str], dense_lists: List[List[int]], sparse_lists: List[List[int]],
+                         k_fusion: int, k_final: int) -> List[List[Document]]:
+        candidates, candidate_scores = self._fuse(dense_lists, sparse_lists, k_fusion)
+        # 3. Cascaded Cross-Encoder Reranking: adaptive depth, windowed passages,
+        # cached scores, and every query's remaining pairs in one predict call
+        return self.reranker.rerank(queries, candidates, candidate_scores, k_final)
+
+    def _fuse(self, dense_lists: List[List[int]], sparse_lists: List[List[int]],
+              k_fusion: int) -> Tuple[List[List[Document]], List[np.ndarray]]:
+        """Top k_fusion fused Documents per query, best first, with their RRF scores."""
+        # 2. Weighted Reciprocal Rank Fusion (k=60) over chunk IDs, per query
+        fused = [
+            reciprocal_rank_fusion([dense_ids, sparse_ids], FUSION_WEIGHTS, k=RRF_K, return_scores=True)
+            for dense_ids, sparse_ids in zip(dense_lists, sparse_lists)
+        ]
+        fused_ids = [ids[:k_fusion].tolist() for ids, _ in fused]
+        # Only the fused candidates' text is read from the chunk store, in one lookup
+        docs = iter(self.chunk_store.get([chunk_id for ids in fused_ids for chunk_id in ids]))
+        candidates, candidate_scores = [], []
+        for ids, (_, scores) in zip(fused_ids, fused):
+            found = [(doc, score) for doc, score in zip((next(docs) for _ in ids), scores[:len(ids)]) if doc is not None]
+            candidates.append([doc for doc, _ in found])
+            candidate_scores.append(np.array([score for _, score in found]))
+        return candidates, candidate_scores
+
+    def _dense_search(self, snapshot: IndexSnapshot, vectors: np.ndarray, k: int,
+                      allowed: Optional[np.ndarray] = None) -> List[List[int]]:
+        """
+        FAISS k-NN per query vector that skips tombstoned vectors: FAISS only
+        visits live IDs through an IDSelectorBitmap. With lossy storage,
+        RESCORE_FACTOR * k candidates are re-ranked by exact distance to the
+        float32 originals before the cut to k. With a filter bitmap (`allowed`,
+        tombstones already cleared), the selector admits only allowed IDs;
+        small subsets are searched by brute force instead.
+        """
+        index = snapshot.vectorstore.index
+        if not index.ntotal:
+            return [[] for _ in vectors]
+        exact = snapshot.exact
+        depth = k
+        if exact is not None and RESCORE_FACTOR > 0 and len(exact) == index.ntotal:
+            depth = k * RESCORE_FACTOR
+        else:
+            exact = None
+
+        import faiss
+        params = None
+        if allowed is None:
+            fetch = min(index.ntotal, depth)
+            live = snapshot.live_bitmap()
+            if live is not None:
+                bits, count = live
+                if not count:
+                    return [[] for _ in vectors]
+                # IDSelectorBitmap takes the bitmap's length in bytes
+                params = search_params(index, faiss.IDSelectorBitmap(len(bits), faiss.swig_ptr(bits)))
+                fetch = min(count, depth)
+        else:
+            positions = np.flatnonzero(allowed[snapshot.chunk_ids()])
+            if not len(positions):
+                return [[] for _ in vectors]
+            # IVF has no thread-safe random access to its vectors, so it needs the exact copy
+            if len(positions) <= FILTER_EXACT_MAX and (exact is not None or index_type(index) != "ivf"):
+                return self._filtered_exact_search(snapshot, vectors, k, positions)
+            bits = np.packbits(allowed, bitorder="little")
+            params = search_params(index, faiss.IDSelectorBitmap(len(bits), faiss.swig_ptr(bits)))
+            fetch = min(len(positions), depth)
+
+        results = []
+        for start in range(0, len(vectors), FAISS_SEARCH_BLOCK):
+            block_vectors = np.ascontiguousarray(vectors[start:start + FAISS_SEARCH_BLOCK])
+            # The IndexIDMap labels hits with chunk IDs
+            _, block = index.search(block_vectors, fetch, params=params)
+            for query, ids in zip(block_vectors, block):
+                ids = ids[ids >= 0]
+                if exact is not None:
+                    ids = snapshot.chunk_ids()[rescore(exact, query, snapshot.positions(ids))]
+                results.append(ids[:k].tolist())
+        return results
+
+    def _filtered_exact_search(self, snapshot: IndexSnapshot, vectors: np.ndarray, k: int,
+                               positions: np.ndarray) -> List[List[int]]:
+        """Brute-force L2 k-NN over the given index positions (exact originals when kept)."""
+        exact = snapshot.exact
+        if exact is not None and len(exact) == snapshot.vectorstore.index.ntotal:
+            rows = exact.take(positions)
+        else:
+            rows = vectors_of(snapshot.vectorstore.index, positions)
+        chunk_ids = snapshot.chunk_ids()[positions]
+        results = []
+        for query in vectors:
+            distances = ((rows - query) ** 2).sum(axis=1)
+            results.append(chunk_ids[np.argsort(distances, kind="stable")[:k]].tolist())
+        return results
+
+    def _embed_queries(self, queries: List[str]) -> np.ndarray:
+        """Query vectors from the LRU cache, with all misses embedded in one call."""
+        keys = [normalize_query(query) for query in queries]
+        vectors = [self.query_embedding_cache.get(key) for key in keys]
+        missing = [i for i, vector in enumerate(vectors) if vector is None]
+        if missing:
+            computed = self.embeddings.embed_queries([queries[i] for i in missing])
+            for i, vector in zip(missing, computed):
+                vector = np.asarray(vector, dtype=np.float32)
+                vector.setflags(write=False)
+                self.query_embedding_cache.put(keys[i], vector)
+                vectors[i] = vector
+        return np.stack(vectors)
+
+    def cache_stats(self) -> dict:
+        """Hit/miss/eviction counters of the query embedding and result caches."""
+        return {
+            "query_embeddings": self.query_embedding_cache.stats(),
+            "results": self.result_cache.stats(),
+            "rerank_scores": self.reranker.cache.stats(),
+        }
+
 
 # Singleton instance for simple import
 rag = RAGPipeline()
@@ -1,15 +1,40 @@
 # src/ingest_helper.py
+import io
 import os
-from typing import List
+from typing import List, Optional, Tuple, Union
 from langchain_community.document_loaders import PyPDFLoader, TextLoader, UnstructuredMarkdownLoader, Docx2txtLoader
+from langchain_community.document_loaders.blob_loaders import Blob
+from langchain_community.document_loaders.parsers.pdf import PyPDFParser
 from langchain_text_splitters import RecursiveCharacterTextSplitter
 from langchain_core.documents import Document
 
-def load_and_split(path: str) -> List[Document]:
+# A worker spec is either a whole file path or (pdf path, first page, end page)
+WorkSpec = Union[str, Tuple[str, int, int]]
+
+def _split(raw_docs: List[Document], path: str) -> List[Document]:
+    # optimized "Semantic-ish" Chunking
+    # Prioritizes paragraphs (double newline) then sentences
+    text_splitter = RecursiveCharacterTextSplitter(
+        chunk_size=1000,
+        chunk_overlap=200,
+        separators=["\n\n", "\n", ".", "!", "?", " ", ""],
+        add_start_index=True
+    )
+    chunks = text_splitter.split_documents(raw_docs)
+
+    # Clean Metadata
+    fname = os.path.basename(path)
+    for chunk in chunks:
+        chunk.metadata["source"] = fname
+
+    return chunks
+
+def load_and_split(path: str) -> Optional[List[Document]]:
     """
     Worker function to load and split a single file.
     Must be top-level for ProcessPoolExecutor pickling.
     This file intentionally DOES NOT import heavy ML libraries.
+    Returns [] for unsupported files and None if parsing failed.
     """
     ext = os.path.splitext(path)[1].lower()
     try:
@@ -23,25 +48,69 @@ def load_and_split(path: str) -> List[Document]:
             loader = Docx2txtLoader(path)
         else:
             return []
-        
+
         raw_docs = loader.load()
-        
-        # optimized "Semantic-ish" Chunking
-        # Prioritizes paragraphs (double newline) then sentences
-        text_splitter = RecursiveCharacterTextSplitter(
-            chunk_size=1000,
-            chunk_overlap=200,
-            separators=["\n\n", "\n", ".", "!", "?", " ", ""],
-            add_start_index=True
-        )
-        chunks = text_splitter.split_documents(raw_docs)
-        
-        # Clean Metadata
-        fname = os.path.basename(path)
-        for chunk in chunks:
-            chunk.metadata["source"] = fname
-            
-        return chunks
+        return _split(raw_docs, path)
     except Exception as e:
         print(f"Error processing {path}: {e}")
-        return []
+        return None
+
+def count_pdf_pages(path: str) -> int:
+    """Page count without extracting any text (reads the page tree only)."""
+    from pypdf import PdfReader
+    return len(PdfReader(path).pages)
+
+def load_and_split_pages(path: str, start: int, end: int) -> Optional[List[Document]]:
+    """
+    Worker function for pages [start, end) of a large PDF.
+    The range is copied into an in-memory PDF and run through the same
+    PyPDFParser that PyPDFLoader uses, then page numbers are shifted back, so
+    page text, `page` and the per-page `start_index` match a whole-file load.
+    Returns None if the range failed to parse.
+    """
+    from pypdf import PdfReader, PdfWriter
+    try:
+        reader = PdfReader(path)
+        writer = PdfWriter()
+        for page_number in range(start, end):
+            writer.add_page(reader.pages[page_number])
+        if reader.metadata:
+            writer.add_metadata(reader.metadata)
+        buffer = io.BytesIO()
+        writer.write(buffer)
+
+        raw_docs = list(PyPDFParser().lazy_parse(Blob.from_data(buffer.getvalue(), path=path)))
+        total_pages = len(reader.pages)
+        for offset, doc in enumerate(raw_docs):
+            page_number = start + offset
+            doc.metadata["page"] = page_number
+            if "page_label" in doc.metadata:
+                doc.metadata["page_label"] = reader.page_labels[page_number]
+            if "total_pages" in doc.metadata:
+                doc.metadata["total_pages"] = total_pages
+        return _split(raw_docs, path)
+    except Exception as e:
+        print(f"Error processing {path} pages {start}-{end}: {e}")
+        return None
+
+def load_and_split_many(specs: List[WorkSpec]) -> List[Optional[List[Document]]]:
+    """
+    Worker function for a batch of work specs (one result list per spec, None
+    for a spec that failed to parse).
+    Batching amortises the per-task IPC round trip for tiny uploads.
+    """
+    results = []
+    for spec in specs:
+        if isinstance(spec, str):
+            results.append(load_and_split(spec))
+        else:
+            results.append(load_and_split_pages(*spec))
+    return results
+
+def warm_worker() -> int:
+    """
+    No-op task used to pre-spawn pool workers.
+    Importing this module already pulled in the loaders and splitter,
+    so by the time this returns the worker is ready for real files.
+    """
+    return os.getpid()
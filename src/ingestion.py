@@ -1,26 +1,20 @@
 import os
-import shutil
 from typing import List, Optional
 from langchain_community.document_loaders import PyPDFLoader, TextLoader, UnstructuredMarkdownLoader
-from langchain_experimental.text_splitter import SemanticChunker
-from langchain_openai import OpenAIEmbeddings
-from langchain_community.vectorstores import FAISS
-from langchain_community.retrievers import BM25Retriever
 from langchain_core.documents import Document
-import pickle
 
-DATA_DIR = "data"
-FAISS_INDEX_PATH = os.path.join(DATA_DIR, "faiss_index")
-BM25_INDEX_PATH = os.path.join(DATA_DIR, "bm25_index.pkl")
+from src.ingest import rag, RAGPipeline
 
 class IngestionPipeline:
-    def __init__(self):
-        self.embeddings = OpenAIEmbeddings()
-        # Semantic chunking relies on embeddings to find break points
-        self.text_splitter = SemanticChunker(self.embeddings, breakpoint_threshold_type="percentile")
-        
-        # Ensure data directory exists
-        os.makedirs(DATA_DIR, exist_ok=True)
+    """
+    Write-side view of the shared ingestion pipeline (src.ingest.rag), kept for
+    integrations of this module. Files go through rag.process_documents, so
+    they land in the published index version that src.retrieval, the agent and
+    the server search (same chunking, embeddings and manifest).
+    """
+
+    def __init__(self, pipeline: Optional[RAGPipeline] = None):
+        self.pipeline = pipeline or rag
 
     def load_file(self, file_path: str) -> List[Document]:
         """Load a file based on its extension."""
@@ -33,50 +27,33 @@ class IngestionPipeline:
             loader = UnstructuredMarkdownLoader(file_path)
         else:
             raise ValueError(f"Unsupported file type: {ext}")
-        
+
         return loader.load()
 
     def ingest_files(self, file_paths: List[str]) -> dict:
         """
-        Load files, split them into chunks, and create/update indices.
-        Returns a summary of ingestion.
+        Index files into a new version of the shared indexes (unchanged files
+        are skipped). Returns a summary of ingestion.
         """
-        all_docs = []
+        existing = []
         for path in file_paths:
-            try:
-                docs = self.load_file(path)
-                all_docs.extend(docs)
-            except Exception as e:
-                print(f"Error loading {path}: {e}")
-
-        if not all_docs:
+            if os.path.exists(path):
+                existing.append(path)
+            else:
+                print(f"Error loading {path}: file not found")
+        if not existing:
             return {"status": "failed", "message": "No documents loaded"}
 
-        # Semantic Chunking
-        print("Chunking documents...")
-        chunks = self.text_splitter.split_documents(all_docs)
-        print(f"Created {len(chunks)} chunks with Semantic Chunking.")
-
-        # Update metadata for chunks (ensure source is persistent)
-        for i, chunk in enumerate(chunks):
-            chunk.metadata["chunk_id"] = i
-
-        # Create/Save FAISS Index
-        print("Creating FAISS index...")
-        vectorstore = FAISS.from_documents(chunks, self.embeddings)
-        vectorstore.save_local(FAISS_INDEX_PATH)
-
-        # Create/Save BM25 Index
-        print("Creating BM25 index...")
-        bm25_retriever = BM25Retriever.from_documents(chunks)
-        # Pickle the BM25 retriever (it's not a standard vector store)
-        with open(BM25_INDEX_PATH, "wb") as f:
-            pickle.dump(bm25_retriever, f)
+        stats = self.pipeline.process_documents(existing)
+        if len(stats["failed"]) == len(existing):
+            return {"status": "failed", "message": "No documents loaded", "files_failed": stats["failed"]}
 
         return {
             "status": "success",
-            "chunks_created": len(chunks),
-            "files_processed": len(file_paths)
+            "chunks_created": stats["chunks"],
+            "files_processed": len(file_paths),
+            "files_skipped": stats["skipped"],
+            "files_failed": stats["failed"],
         }
 
 if __name__ == "__main__":
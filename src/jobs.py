@@ -0,0 +1,141 @@
+# src/jobs.py
+import time
+import uuid
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, List, Optional
+
+# Finished jobs kept around for status queries
+MAX_FINISHED_JOBS = 100
+
+
+class IngestJob:
+    """Status of one background ingestion request, with per-file progress."""
+
+    def __init__(self, file_paths: List[str], names: List[str], digests: Optional[Dict[str, str]] = None):
+        self.id = uuid.uuid4().hex
+        self.file_paths = file_paths
+        self.digests = digests
+        self.status = "queued"
+        self.files: Dict[str, dict] = {name: {"status": "queued", "chunks": 0} for name in names}
+        self.chunks_indexed = 0
+        self.stats: Optional[dict] = None
+        self.error: Optional[str] = None
+        self.created_at = time.time()
+        self.finished_at: Optional[float] = None
+
+    def to_dict(self) -> dict:
+        return {
+            "job_id": self.id,
+            "status": self.status,
+            "files": self.files,
+            "chunks_indexed": self.chunks_indexed,
+            "stats": self.stats,
+            "error": self.error,
+            "created_at": self.created_at,
+            "finished_at": self.finished_at,
+        }
+
+
+class IngestJobManager:
+    """
+    Runs RAGPipeline.process_documents off the request path.
+    Jobs execute one at a time on a dedicated thread (ingestion mutates the
+    shared indexes), and every progress change is pushed to subscribers.
+    """
+
+    def __init__(self, pipeline):
+        self.pipeline = pipeline
+        self.jobs: Dict[str, IngestJob] = {}
+        self._subscribers: List[Callable[[dict], None]] = []
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="ingest-job")
+
+    def subscribe(self, callback: Callable[[dict], None]):
+        """Register a callback receiving job snapshots; it is called from the job thread."""
+        with self._lock:
+            self._subscribers.append(callback)
+
+    def unsubscribe(self, callback: Callable[[dict], None]):
+        with self._lock:
+            if callback in self._subscribers:
+                self._subscribers.remove(callback)
+
+    def submit(self, file_paths: List[str], names: List[str], digests: Optional[Dict[str, str]] = None,
+               on_finish: Optional[Callable[[IngestJob], None]] = None) -> IngestJob:
+        """Queue an ingestion; `digests` (path -> sha256) spares re-hashing files hashed during upload."""
+        job = IngestJob(file_paths, names, digests)
+        with self._lock:
+            self.jobs[job.id] = job
+            self._prune()
+        future = self._executor.submit(self._run, job, on_finish)
+        # Jobs still queued at shutdown are cancelled without running; clean up after them too
+        future.add_done_callback(lambda f: self._cancelled(job, on_finish) if f.cancelled() else None)
+        self._publish(job)
+        return job
+
+    def get(self, job_id: str) -> Optional[IngestJob]:
+        return self.jobs.get(job_id)
+
+    def shutdown(self):
+        """Finish the running job; queued ones are cancelled (their on_finish still runs)."""
+        self._executor.shutdown(wait=True, cancel_futures=True)
+
+    def _run(self, job: IngestJob, on_finish):
+        job.status = "running"
+        for entry in job.files.values():
+            entry["status"] = "parsing"
+        self._publish(job)
+
+        def progress(event: dict):
+            if "file" in event and event["file"] in job.files:
+                job.files[event["file"]].update(status=event["status"], chunks=event.get("chunks", 0))
+                if "error" in event:
+                    job.files[event["file"]]["error"] = event["error"]
+            if "chunks_indexed" in event:
+                job.chunks_indexed = event["chunks_indexed"]
+            self._publish(job)
+
+        try:
+            job.stats = self.pipeline.process_documents(job.file_paths, progress=progress, digests=job.digests)
+            for entry in job.files.values():
+                if entry["status"] == "parsed":
+                    entry["status"] = "indexed"
+            job.status = "succeeded"
+        except Exception as e:
+            print(f"Ingestion job {job.id} failed: {e}")
+            job.status = "failed"
+            job.error = str(e)
+        finally:
+            self._finish(job, on_finish)
+
+    def _cancelled(self, job: IngestJob, on_finish):
+        job.status = "cancelled"
+        for entry in job.files.values():
+            entry["status"] = "cancelled"
+        self._finish(job, on_finish)
+
+    def _finish(self, job: IngestJob, on_finish):
+        job.finished_at = time.time()
+        if on_finish:
+            try:
+                on_finish(job)
+            except Exception as e:
+                print(f"Ingestion job {job.id} cleanup failed: {e}")
+        self._publish(job)
+
+    def _publish(self, job: IngestJob):
+        snapshot = job.to_dict()
+        with self._lock:
+            subscribers = list(self._subscribers)
+        for callback in subscribers:
+            try:
+                callback(snapshot)
+            except Exception as e:
+                print(f"Job subscriber failed: {e}")
+
+    def _prune(self):
+        finished = [job for job in self.jobs.values() if job.finished_at is not None]
+        finished.sort(key=lambda job: job.finished_at)
+        for job in finished[:max(0, len(finished) - MAX_FINISHED_JOBS)]:
+            del self.jobs[job.id]
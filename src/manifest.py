@@ -0,0 +1,69 @@
+# src/manifest.py
+import os
+import json
+import hashlib
+from typing import Dict, List, Optional
+
+
+def file_sha256(path: str, chunk_size: int = 1024 * 1024) -> str:
+    """Hash a file's content in fixed-size chunks so large files never sit fully in RAM."""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(chunk_size), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+class IngestManifest:
+    """
+    Persistent record of every indexed source file.
+    Maps source name -> {"hash": <sha256 of content>, "chunk_ids": [...]}
+    so re-ingesting an unchanged file is a no-op and a changed file can
+    have its old chunks removed from the indexes before re-embedding.
+    Also holds the tombstones: chunk IDs deleted from the dense index
+    logically but not yet compacted away.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.entries: Dict[str, dict] = {}
+        self.tombstones: List[str] = []
+        self.load()
+
+    def load(self):
+        if not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path, "r") as f:
+                data = json.load(f)
+            self.entries = data.get("sources", {})
+            self.tombstones = data.get("tombstones", [])
+        except Exception as e:
+            print(f"Failed to load ingest manifest: {e}")
+            self.entries = {}
+            self.tombstones = []
+
+    def save(self):
+        # Write-then-rename so a crash mid-write never leaves a truncated manifest
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w") as f:
+            json.dump({"sources": self.entries, "tombstones": self.tombstones}, f)
+        os.replace(tmp_path, self.path)
+
+    def fork(self, path: str) -> "IngestManifest":
+        """Copy for the next index version, saved to `path` (entries are replaced, never edited in place)."""
+        manifest = IngestManifest(path)
+        manifest.entries = dict(self.entries)
+        manifest.tombstones = list(self.tombstones)
+        return manifest
+
+    def get(self, source: str) -> Optional[dict]:
+        return self.entries.get(source)
+
+    def record(self, source: str, digest: str, chunk_ids: List[int]):
+        self.entries[source] = {"hash": digest, "chunk_ids": list(chunk_ids)}
+
+    def remove(self, source: str) -> List[int]:
+        """Drop a source and return the chunk IDs it owned."""
+        entry = self.entries.pop(source, None)
+        return entry["chunk_ids"] if entry else []
@@ -0,0 +1,70 @@
+# src/query_cache.py
+import threading
+from collections import OrderedDict
+from typing import Any, Hashable, Optional
+
+from src.embedding_cache import normalize_text
+
+# Entry limits for the in-process query caches
+QUERY_EMBED_CACHE_SIZE = 4096
+RESULT_CACHE_SIZE = 1024
+RERANK_SCORE_CACHE_SIZE = 16384
+
+
+def normalize_query(query: str) -> str:
+    """
+    Cache key form of a query: collapsed whitespace, case-folded.
+    Both MiniLM models are uncased and BM25 tokenizes lowercase, so queries
+    that differ only in case or spacing retrieve exactly the same chunks.
+    """
+    return normalize_text(query).casefold()
+
+
+class LRUCache:
+    """Thread-safe bounded LRU map with hit/miss/eviction counters."""
+
+    def __init__(self, capacity: int):
+        self.capacity = capacity
+        self._data: "OrderedDict[Hashable, Any]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        with self._lock:
+            value = self._data.get(key)
+            if value is None:
+                self.misses += 1
+                return None
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key: Hashable, value: Any):
+        if self.capacity <= 0:
+            return
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            while len(self._data) > self.capacity:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            "size": len(self._data),
+            "capacity": self.capacity,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": round(self.hits / total, 4) if total else 0.0,
+        }
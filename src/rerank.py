@@ -0,0 +1,117 @@
+# src/rerank.py
+import os
+from typing import List, Optional, Sequence, Set
+
+import numpy as np
+from langchain_core.documents import Document
+
+from src.query_cache import LRUCache, normalize_query, RERANK_SCORE_CACHE_SIZE
+from src.sparse_index import tokenize
+
+# Cascade knobs, off by default. Candidates whose fused score is below
+# RERANK_SCORE_RATIO x the best fused score are cut before the cross-encoder
+# (0 disables the cut), but never below RERANK_MIN_DEPTH (or k_final)
+# candidates. The scores are RRF scores, so when the top chunk was found by
+# both retrievers, any ratio above ~0.5 keeps only chunks both retrievers found.
+# Passages longer than RERANK_PASSAGE_TOKENS cross-encoder tokens are scored on
+# their best window (0 scores whole chunks, up to the model's own 512-token
+# limit). Both change the top k; enable them only where scripts/rerank_report.py
+# shows top-k agreement on the corpus.
+RERANK_SCORE_RATIO = float(os.getenv("RAG_RERANK_SCORE_RATIO", "0"))
+RERANK_MIN_DEPTH = int(os.getenv("RAG_RERANK_MIN_DEPTH", "10"))
+RERANK_PASSAGE_TOKENS = int(os.getenv("RAG_RERANK_PASSAGE_TOKENS", "0"))
+RERANK_BATCH_SIZE = 32
+
+
+class CascadedReranker:
+    """
+    Second stage of hybrid search: a cross-encoder over the fused candidates,
+    made cheaper three ways. Rerank depth follows the fusion scores (a few
+    candidates both retrievers agree on are not padded out to k_fusion),
+    each passage is cut to its best token window for the query, and
+    (query, chunk ID) scores are cached, so follow-up questions only score
+    chunks they have not seen. Chunk IDs are never reused and chunk text
+    never changes, so cached scores stay valid across index versions.
+    """
+
+    def __init__(self, model, score_ratio: float = RERANK_SCORE_RATIO, min_depth: int = RERANK_MIN_DEPTH,
+                 passage_tokens: int = RERANK_PASSAGE_TOKENS, cache_size: int = RERANK_SCORE_CACHE_SIZE):
+        self.model = model
+        self.score_ratio = score_ratio
+        self.min_depth = min_depth
+        self.passage_tokens = passage_tokens
+        self.cache = LRUCache(cache_size)
+
+    def depth(self, fused_scores: np.ndarray, k_final: int) -> int:
+        """How many of the fused candidates (best first) go through the cross-encoder."""
+        if self.score_ratio <= 0 or not len(fused_scores):
+            return len(fused_scores)
+        confident = int(np.count_nonzero(fused_scores >= self.score_ratio * fused_scores[0]))
+        return min(len(fused_scores), max(confident, k_final, self.min_depth))
+
+    def rerank(self, queries: List[str], candidates: List[List[Document]], fused_scores: List[np.ndarray],
+               k_final: int) -> List[List[Document]]:
+        """
+        Top k_final documents per query by cross-encoder score. `candidates`
+        are the fused documents best first, `fused_scores` their RRF scores.
+        Every query's uncached pairs are scored in one predict call.
+        """
+        heads = [docs[:self.depth(scores, k_final)] for docs, scores in zip(candidates, fused_scores)]
+        scores = self.score(queries, heads)
+        results = []
+        for docs, doc_scores in zip(heads, scores):
+            order = np.argsort(-doc_scores, kind="stable")[:k_final]
+            results.append([docs[i] for i in order])
+        return results
+
+    def score(self, queries: List[str], candidates: List[List[Document]]) -> List[np.ndarray]:
+        """Cross-encoder scores of each query's candidates, from the cache where possible."""
+        scores = [np.empty(len(docs), dtype=np.float32) for docs in candidates]
+        missing = []
+        for q, (query, docs) in enumerate(zip(queries, candidates)):
+            key = normalize_query(query)
+            for i, doc in enumerate(docs):
+                cache_key = (key, doc.metadata.get("chunk_id"), self.passage_tokens)
+                cached = self.cache.get(cache_key) if cache_key[1] is not None else None
+                if cached is None:
+                    missing.append((q, i, cache_key))
+                else:
+                    scores[q][i] = cached
+        if missing:
+            pairs = []
+            for q, i, _ in missing:
+                query = queries[q]
+                pairs.append([query, self.passage(query, candidates[q][i].page_content)])
+            computed = self.model.predict(pairs, batch_size=RERANK_BATCH_SIZE)
+            for (q, i, cache_key), value in zip(missing, computed):
+                scores[q][i] = value
+                if cache_key[1] is not None:
+                    self.cache.put(cache_key, float(value))
+        return scores
+
+    def passage(self, query: str, text: str) -> str:
+        """`text` cut to its best window of passage_tokens tokens for `query`."""
+        if self.passage_tokens <= 0:
+            return text
+        offsets = self.model.tokenizer(text, add_special_tokens=False, return_offsets_mapping=True)["offset_mapping"]
+        return best_window(text, offsets, set(tokenize(query)), self.passage_tokens)
+
+
+def best_window(text: str, offsets: Sequence, query_terms: Set[str], budget: int) -> str:
+    """
+    The span of `budget` consecutive tokens (half-overlapping windows, character
+    `offsets` per token) sharing the most distinct terms with the query; the
+    earliest wins ties, so a passage without query terms keeps its opening.
+    """
+    if len(offsets) <= budget:
+        return text
+    stride = max(1, budget // 2)
+    starts = list(range(0, len(offsets) - budget, stride)) + [len(offsets) - budget]
+    best: Optional[str] = None
+    best_hits = -1
+    for start in starts:
+        window = text[offsets[start][0]:offsets[start + budget - 1][1]]
+        hits = len(query_terms.intersection(tokenize(window)))
+        if hits > best_hits:
+            best, best_hits = window, hits
+    return best
@@ -1,114 +1,96 @@
 import os
-import pickle
-from typing import List, Dict
-from langchain_community.vectorstores import FAISS
-from langchain_openai import OpenAIEmbeddings
+import threading
+from typing import List, Optional
 from langchain_core.documents import Document
-from sentence_transformers import CrossEncoder
 from langchain_core.tools import tool
-import numpy as np
 
-DATA_DIR = "data"
-FAISS_INDEX_PATH = os.path.join(DATA_DIR, "faiss_index")
-BM25_INDEX_PATH = os.path.join(DATA_DIR, "bm25_index.pkl")
+from src.ingest import rag, RAGPipeline
+from src.chunk_store import ChunkStore
+from src.filters import ChunkFilter
+from src.fusion import reciprocal_rank_fusion
+from src.sparse_index import SparseIndex
+
+# Pre-pipeline defaults of this module's retrieve(): 10 fused candidates, 3 results
+TOP_K_FUSION = 10
+TOP_K_FINAL = 3
 
 class RetrievalPipeline:
-    def __init__(self):
-        self.embeddings = OpenAIEmbeddings()
-        
-        # Load FAISS index
-        if os.path.exists(FAISS_INDEX_PATH):
-            self.vectorstore = FAISS.load_local(
-                FAISS_INDEX_PATH, 
-                self.embeddings, 
-                allow_dangerous_deserialization=True
-            )
-        else:
-            self.vectorstore = None
-            print("Warning: FAISS index not found.")
-
-        # Load BM25 index
-        if os.path.exists(BM25_INDEX_PATH):
-            with open(BM25_INDEX_PATH, "rb") as f:
-                self.bm25_retriever = pickle.load(f)
-        else:
-            self.bm25_retriever = None
-            print("Warning: BM25 index not found.")
-
-        # Initialize Cross-Encoder for reranking
-        # This will download the model on first run
-        self.reranker = CrossEncoder('cross-encoder/ms-marco-MiniLM-L-6-v2')
+    """
+    Read-side view of the shared ingestion pipeline (src.ingest.rag), kept for
+    integrations of this module. Models, indexes and caches are the process's
+    one copy, so constructing this is free; searches are hybrid_search of
+    src/ingest.py, on the newest version published under data/ (a version
+    published by another process is picked up on the next call).
+    """
+
+    def __init__(self, pipeline: Optional[RAGPipeline] = None):
+        self.pipeline = pipeline or rag
+
+    @property
+    def embeddings(self):
+        return self.pipeline.embeddings
+
+    @property
+    def chunk_store(self) -> ChunkStore:
+        return self.pipeline.chunk_store
+
+    @property
+    def vectorstore(self):
+        self.pipeline.refresh()
+        return self.pipeline.vectorstore
+
+    @property
+    def sparse_index(self) -> SparseIndex:
+        self.pipeline.refresh()
+        return self.pipeline.sparse_index
 
     def reciprocal_rank_fusion(self, results: List[List[Document]], k=60) -> List[Document]:
         """
-        Combine multiple lists of documents using Reciprocal Rank Fusion.
+        Combine multiple lists of documents using Reciprocal Rank Fusion,
+        identifying chunks by their stable chunk ID.
         """
-        fused_scores = {}
-        doc_map = {}
-
-        for docs in results:
-            for rank, doc in enumerate(docs):
-                doc_str = doc.page_content
-                if doc_str not in doc_map:
-                    doc_map[doc_str] = doc
-                
-                if doc_str not in fused_scores:
-                    fused_scores[doc_str] = 0.0
-                
-                fused_scores[doc_str] += 1.0 / (k + rank + 1)
-
-        reranked_results = sorted(fused_scores.items(), key=lambda x: x[1], reverse=True)
-        return [doc_map[doc_str] for doc_str, score in reranked_results]
-
-    def retrieve(self, query: str, top_k_fusion: int = 10, top_k_final: int = 3) -> List[Document]:
+        doc_map = {doc.metadata["chunk_id"]: doc for docs in results for doc in docs}
+        fused_ids = reciprocal_rank_fusion([[doc.metadata["chunk_id"] for doc in docs] for docs in results], k=k)
+        return [doc_map[int(chunk_id)] for chunk_id in fused_ids]
+
+    def hybrid_search(self, query: str, k_fusion: int = 25, k_final: int = 5,
+                      chunk_filter: Optional[ChunkFilter] = None) -> List[Document]:
+        """src.ingest hybrid_search (dense + sparse -> RRF -> cascaded reranking) on the published version."""
+        return self.pipeline.hybrid_search(query, k_fusion=k_fusion, k_final=k_final, chunk_filter=chunk_filter)
+
+    def retrieve(self, query: str, top_k_fusion: int = TOP_K_FUSION, top_k_final: int = TOP_K_FINAL,
+                 source: Optional[str] = None) -> List[Document]:
         """
-        Retrieve documents using Hybrid Search (Dense + Sparse) -> RRF -> Reranking.
+        Retrieve documents using Hybrid Search (Dense + Sparse) -> RRF -> Reranking,
+        optionally only from one source file.
         """
-        if not self.vectorstore or not self.bm25_retriever:
-            return []
-
-        # 1. Dense Search (Vector)
-        dense_docs = self.vectorstore.similarity_search(query, k=top_k_fusion)
-        
-        # 2. Sparse Search (BM25)
-        # BM25Retriever doesn't support 'k' param in invoke directly easily without kwarg adjustment usually
-        # But we can set k on the retriever object if needed, or just take default. 
-        # Default is usually 4. Let's force it to top_k_fusion if possible.
-        self.bm25_retriever.k = top_k_fusion
-        sparse_docs = self.bm25_retriever.invoke(query)
-
-        # 3. Reciprocal Rank Fusion
-        hybrid_docs = self.reciprocal_rank_fusion([dense_docs, sparse_docs])
-        
-        # Slice to top candidate pool for reranking (e.g. top 10 from fusion)
-        candidates = hybrid_docs[:top_k_fusion]
-        
-        if not candidates:
-            return []
-
-        # 4. Cross-Encoder Reranking
-        pairs = [[query, doc.page_content] for doc in candidates]
-        scores = self.reranker.predict(pairs)
-        
-        # Combine docs with scores
-        scored_docs = sorted(zip(candidates, scores), key=lambda x: x[1], reverse=True)
-        
-        # Select top 3
-        final_docs = [doc for doc, score in scored_docs[:top_k_final]]
-        
-        return final_docs
+        chunk_filter = ChunkFilter(sources=[source]) if source else None
+        return self.hybrid_search(query, k_fusion=top_k_fusion, k_final=top_k_final, chunk_filter=chunk_filter)
+
+# Process-wide registry: one pipeline shared by every caller and thread
+_pipeline: Optional[RetrievalPipeline] = None
+_pipeline_lock = threading.Lock()
+
+def get_pipeline() -> RetrievalPipeline:
+    """The process's RetrievalPipeline, created on first use."""
+    global _pipeline
+    if _pipeline is None:
+        with _pipeline_lock:
+            if _pipeline is None:
+                _pipeline = RetrievalPipeline()
+    return _pipeline
 
 @tool
-def retrieve_docs(query: str) -> str:
+def retrieve_docs(query: str, source: Optional[str] = None) -> str:
     """
-    Search the knowledge base for information. 
+    Search the knowledge base for information.
     Use this tool when the user asks questions about uploaded documents or specific knowledge.
+    Pass `source` (a file name) when the question is about one particular file.
     """
-    pipeline = RetrievalPipeline()
-    docs = pipeline.retrieve(query)
+    docs = get_pipeline().retrieve(query, source=source)
     if not docs:
         return "No relevant information found in the knowledge base."
-    
+
     result = "Found the following information:\n\n"
     for i, doc in enumerate(docs):
         # Include citation info in the tool output so the LLM can cite it
@@ -118,9 +100,9 @@ def retrieve_docs(query: str) -> str:
         citation_meta = f"Source: {os.path.basename(source)}"
         if page is not None:
             citation_meta += f", Page: {page}"
-            
+
         result += f"--- Document {i+1} ---\nMetadata provided: [{citation_meta}]\nContent:\n{doc.page_content}\n\n"
-    
+
     return result
 
 if __name__ == "__main__":
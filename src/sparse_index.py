@@ -0,0 +1,557 @@
+# src/sparse_index.py
+import os
+import re
+import json
+import math
+import uuid
+import shutil
+import bisect
+import itertools
+import threading
+from collections import Counter
+from typing import List, Tuple, Iterable, Optional, Sequence
+
+import numpy as np
+from langchain_core.documents import Document
+
+# BM25 parameters: k1 and b are rank_bm25.BM25Okapi's defaults, but IDF is Lucene's
+# log(1 + (N - df + .5) / (df + .5)) (never negative, no epsilon floor) and tokens are
+# lowercase \w+ runs, not whitespace-split text, so scores differ from BM25Okapi's
+BM25_K1 = 1.5
+BM25_B = 0.75
+
+# Merge the smallest segments in the background once there are more than this many
+MAX_SEGMENTS = 8
+MERGE_FACTOR = 4
+
+# On-disk format (see SparseIndex.save): bump the version on incompatible layout changes
+FORMAT_NAME = "sparse-index"
+FORMAT_VERSION = 2
+INDEX_FILE = "index.json"
+SEGMENT_PREFIX = "seg_"
+
+_TOKEN_RE = re.compile(r"\w+")
+
+# Deleted-set versions come from one process-wide counter, so segments shared by
+# forked indexes never reuse a tombstone bitmap cached for another index
+_deleted_versions = itertools.count(1)
+
+
+def tokenize(text: str) -> List[str]:
+    return _TOKEN_RE.findall(text.lower())
+
+
+class MappedTerms(Sequence):
+    """
+    Sorted vocabulary backed by a memory-mapped UTF-8 blob plus offsets.
+    Terms are decoded on access, so `bisect` can search it without loading it.
+    """
+
+    def __init__(self, blob: np.ndarray, offsets: np.ndarray):
+        self.blob = blob
+        self.offsets = offsets
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self[i]
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [self[j] for j in range(*i.indices(len(self)))]
+        return bytes(self.blob[self.offsets[i]:self.offsets[i + 1]]).decode("utf-8")
+
+
+class Segment:
+    """
+    Immutable batch of indexed chunks stored as a CSR term-document matrix:
+    row r (term `terms[r]`, sorted) holds doc positions indices[indptr[r]:indptr[r+1]]
+    with term frequencies in the same slice of `tfs`.
+    Freshly built segments live in RAM; once written they are re-attached as
+    read-only memory maps of their on-disk arrays.
+    """
+
+    def __init__(self, terms: Sequence[str], indptr: np.ndarray, indices: np.ndarray, tfs: np.ndarray,
+                 doc_ids: np.ndarray, doc_lens: np.ndarray):
+        self.path: Optional[str] = None
+        self.terms = terms
+        self.indptr = indptr
+        self.indices = indices
+        self.tfs = tfs
+        self.doc_ids = doc_ids
+        self.doc_lens = doc_lens
+        # Derived per-doc arrays, recomputed when the inputs they depend on change.
+        # Each is cached as one (key, array) tuple: segments are shared by versions
+        # searched concurrently, so key and array must be swapped in a single store
+        self._norm = None
+        self._dead = None
+
+    @classmethod
+    def from_postings(cls, terms: List[str], row_col: np.ndarray, doc_col: np.ndarray, tf_col: np.ndarray,
+                      doc_ids: np.ndarray, doc_lens: np.ndarray) -> "Segment":
+        """
+        Build the CSR layout from parallel (term row, doc position, tf) posting columns,
+        where `terms[row]` names each row. Rows come out sorted by term and empty rows are dropped.
+        """
+        by_term = sorted(range(len(terms)), key=terms.__getitem__)
+        rank = np.empty(len(terms), dtype=np.int64)
+        rank[by_term] = np.arange(len(terms))
+        rows = rank[row_col]
+        counts = np.bincount(rows, minlength=len(terms))
+        used = counts > 0
+        compact = np.cumsum(used) - 1
+        rows = compact[rows]
+        counts = counts[used]
+
+        order = np.lexsort((doc_col, rows))
+        indptr = np.zeros(len(counts) + 1, dtype=np.int64)
+        np.cumsum(counts, out=indptr[1:])
+        return cls(
+            [terms[i] for i, keep in zip(by_term, used) if keep],
+            indptr,
+            doc_col[order].astype(np.int32),
+            tf_col[order].astype(np.float32),
+            doc_ids,
+            doc_lens.astype(np.float32),
+        )
+
+    @classmethod
+    def build(cls, ids: List[int], token_lists: Iterable[List[str]]) -> "Segment":
+        vocab = {}
+        row_col, doc_col, tf_col, doc_lens = [], [], [], []
+        for pos, tokens in enumerate(token_lists):
+            doc_lens.append(len(tokens))
+            for term, tf in Counter(tokens).items():
+                row_col.append(vocab.setdefault(term, len(vocab)))
+                doc_col.append(pos)
+                tf_col.append(tf)
+        return cls.from_postings(
+            list(vocab),
+            np.array(row_col, dtype=np.int64),
+            np.array(doc_col, dtype=np.int64),
+            np.array(tf_col, dtype=np.float32),
+            np.array(ids, dtype=np.int64),
+            np.array(doc_lens, dtype=np.float32),
+        )
+
+    # --- Persistence ---
+
+    def write(self, path: str):
+        """Write the segment's arrays and map them back in place of the in-RAM copies."""
+        tmp_path = path + ".tmp"
+        os.makedirs(tmp_path, exist_ok=True)
+        encoded = [term.encode("utf-8") for term in self.terms]
+        offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+        np.cumsum([len(term) for term in encoded], out=offsets[1:])
+        np.save(os.path.join(tmp_path, "terms.npy"), np.frombuffer(b"".join(encoded), dtype=np.uint8))
+        np.save(os.path.join(tmp_path, "term_offsets.npy"), offsets)
+        np.save(os.path.join(tmp_path, "indptr.npy"), self.indptr)
+        np.save(os.path.join(tmp_path, "indices.npy"), self.indices)
+        np.save(os.path.join(tmp_path, "tfs.npy"), self.tfs)
+        np.save(os.path.join(tmp_path, "doc_ids.npy"), self.doc_ids)
+        np.save(os.path.join(tmp_path, "doc_lens.npy"), self.doc_lens)
+        os.replace(tmp_path, path)
+        self._attach(path)
+
+    def link(self, path: str):
+        """Hard-link an already written segment into another index directory (falls back to a copy)."""
+        tmp_path = path + ".tmp"
+        try:
+            os.makedirs(tmp_path, exist_ok=True)
+            for name in os.listdir(self.path):
+                os.link(os.path.join(self.path, name), os.path.join(tmp_path, name))
+            os.replace(tmp_path, path)
+            self.path = path
+        except OSError:
+            shutil.rmtree(tmp_path, ignore_errors=True)
+            self.write(path)
+
+    def _attach(self, path: str):
+        def load(name):
+            return np.load(os.path.join(path, name), mmap_mode="r")
+
+        self.terms = MappedTerms(load("terms.npy"), load("term_offsets.npy"))
+        self.indptr = load("indptr.npy")
+        self.indices = load("indices.npy")
+        self.tfs = load("tfs.npy")
+        self.doc_ids = load("doc_ids.npy")
+        self.doc_lens = load("doc_lens.npy")
+        self.path = path
+
+    @classmethod
+    def open(cls, path: str) -> "Segment":
+        segment = cls([], None, None, None, None, None)
+        segment._attach(path)
+        return segment
+
+    def __len__(self):
+        return len(self.doc_ids)
+
+    def row(self, term: str) -> Optional[int]:
+        """Binary-search the sorted vocabulary for a term's row."""
+        i = bisect.bisect_left(self.terms, term)
+        if i < len(self.terms) and self.terms[i] == term:
+            return i
+        return None
+
+    def row_df(self, row: int) -> int:
+        return int(self.indptr[row + 1] - self.indptr[row])
+
+    def postings(self) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """Expand back to (term row, doc position, tf) columns, e.g. for merging."""
+        rows = np.repeat(np.arange(len(self.terms)), np.diff(self.indptr))
+        return rows, self.indices.astype(np.int64), self.tfs
+
+    def norm(self, avgdl: float) -> np.ndarray:
+        """Precomputed BM25 length normalisation k1 * (1 - b + b * |d| / avgdl) per doc."""
+        cached = self._norm
+        if cached is not None and cached[0] == avgdl:
+            return cached[1]
+        norm = BM25_K1 * (1 - BM25_B + BM25_B * self.doc_lens / avgdl)
+        self._norm = (avgdl, norm)
+        return norm
+
+    def dead(self, deleted: set, version: int) -> np.ndarray:
+        """Tombstone bitmap for this segment, rebuilt only when the deleted set changed."""
+        cached = self._dead
+        if cached is not None and cached[0] == version:
+            return cached[1]
+        dead = np.isin(self.doc_ids, list(deleted)) if deleted else np.zeros(len(self), dtype=bool)
+        self._dead = (version, dead)
+        return dead
+
+    def term_scores(self, term: str, avgdl: float) -> Optional[Tuple[np.ndarray, np.ndarray]]:
+        """Doc positions and saturated term frequencies tf * (k1 + 1) / (tf + norm) of one term's row."""
+        row = self.row(term)
+        if row is None:
+            return None
+        start, end = self.indptr[row], self.indptr[row + 1]
+        docs = self.indices[start:end]
+        tf = self.tfs[start:end]
+        return docs, tf * (BM25_K1 + 1) / (tf + self.norm(avgdl)[docs])
+
+    def score(self, weights: List[Tuple[str, float]], avgdl: float, rows: Optional[dict] = None) -> np.ndarray:
+        """
+        BM25 score of every doc in the segment for pre-weighted query terms.
+        `rows` memoizes term_scores across the queries of a batch.
+        """
+        scores = np.zeros(len(self), dtype=np.float32)
+        for term, weight in weights:
+            if rows is None:
+                hit = self.term_scores(term, avgdl)
+            else:
+                if term not in rows:
+                    rows[term] = self.term_scores(term, avgdl)
+                hit = rows[term]
+            if hit is None:
+                continue
+            docs, saturated = hit
+            # Doc positions are unique within a row, so fancy-index += is safe
+            scores[docs] += weight * saturated
+        return scores
+
+
+def top_k(scores: np.ndarray, k: int) -> np.ndarray:
+    """Indices of the k largest scores, best first, using argpartition instead of a full sort."""
+    if k <= 0 or not len(scores):
+        return np.empty(0, dtype=np.int64)
+    if k < len(scores):
+        candidates = np.argpartition(-scores, k - 1)[:k]
+    else:
+        candidates = np.arange(len(scores))
+    return candidates[np.argsort(-scores[candidates], kind="stable")]
+
+
+def _lookup(bitmap: np.ndarray, ids: np.ndarray) -> np.ndarray:
+    """bitmap[ids], with IDs past the end of the bitmap reading as False."""
+    inside = ids < len(bitmap)
+    if inside.all():
+        return bitmap[ids]
+    out = np.zeros(len(ids), dtype=bool)
+    out[inside] = bitmap[ids[inside]]
+    return out
+
+
+class SparseIndex:
+    """
+    Segment-based BM25 inverted index.
+    Each upload is tokenized once into a new segment and only the global doc
+    count and length totals are updated, so indexing cost is proportional to
+    the upload rather than the corpus. Deletions are
+    tombstones until a background merge rewrites the affected segments.
+    Queries are scored per segment with NumPy over the CSR rows of the query
+    terms, followed by argpartition top-k selection.
+    Document frequencies are summed from the segments' row lengths at query
+    time (tombstoned docs count until merged away, as in Lucene), so no
+    global vocabulary has to be held in RAM.
+    """
+
+    def __init__(self):
+        self.segments: List[Segment] = []
+        self.deleted = set()
+        self.num_docs = 0
+        self.total_len = 0
+        self._deleted_version = next(_deleted_versions)
+        self._lock = threading.RLock()
+        self._merge_thread = None
+
+    # --- Persistence ---
+
+    def save(self, path: str):
+        """
+        Persist to a directory: one sub-directory of .npy arrays per segment plus
+        an index.json listing the live segments and global stats. Segments are
+        immutable, so only new ones are written, segments saved under another
+        directory (a previous index version) are hard-linked, and merged-away
+        ones are removed.
+        """
+        with self._lock:
+            os.makedirs(path, exist_ok=True)
+            names = []
+            for segment in self.segments:
+                if segment.path is None:
+                    segment.write(os.path.join(path, f"{SEGMENT_PREFIX}{uuid.uuid4().hex[:12]}"))
+                elif os.path.dirname(segment.path) != os.path.normpath(path):
+                    segment.link(os.path.join(path, os.path.basename(segment.path)))
+                names.append(os.path.basename(segment.path))
+            meta = {
+                "format": FORMAT_NAME,
+                "version": FORMAT_VERSION,
+                "segments": names,
+                "num_docs": self.num_docs,
+                "total_len": self.total_len,
+                "deleted": sorted(self.deleted),
+            }
+            tmp_path = os.path.join(path, INDEX_FILE + ".tmp")
+            with open(tmp_path, "w") as f:
+                json.dump(meta, f)
+            os.replace(tmp_path, os.path.join(path, INDEX_FILE))
+
+            # Unlinking is safe even if another process still has the files mapped
+            for entry in os.listdir(path):
+                if entry.startswith(SEGMENT_PREFIX) and entry not in names:
+                    shutil.rmtree(os.path.join(path, entry), ignore_errors=True)
+
+    @classmethod
+    def load(cls, path: str) -> "SparseIndex":
+        """Open a saved index; segment arrays are memory-mapped, not read."""
+        with open(os.path.join(path, INDEX_FILE), "r") as f:
+            meta = json.load(f)
+        if meta.get("format") != FORMAT_NAME or meta.get("version") != FORMAT_VERSION:
+            raise ValueError(f"Unsupported sparse index format {meta.get('format')} v{meta.get('version')}")
+        index = cls()
+        index.segments = [Segment.open(os.path.join(path, name)) for name in meta["segments"]]
+        index.num_docs = meta["num_docs"]
+        index.total_len = meta["total_len"]
+        index.deleted = set(meta["deleted"])
+        return index
+
+    # --- Writes ---
+
+    def add_documents(self, docs: List[Document], ids: List[int]):
+        """Tokenize only the new chunks into a fresh segment and fold in their statistics."""
+        if not docs:
+            return
+        segment = Segment.build(ids, (tokenize(doc.page_content) for doc in docs))
+        with self._lock:
+            self.segments.append(segment)
+            self.num_docs += len(segment)
+            self.total_len += int(segment.doc_lens.sum())
+        self.maybe_merge()
+
+    def delete(self, ids: Iterable[int]):
+        """Tombstone chunks; they stop matching immediately and are purged on the next merge."""
+        with self._lock:
+            self.deleted.update(ids)
+            self._deleted_version = next(_deleted_versions)
+
+    def __len__(self):
+        return self.num_docs - len(self.deleted)
+
+    def fork(self) -> "SparseIndex":
+        """Copy-on-write copy for building the next index version; segments are shared, not copied."""
+        with self._lock:
+            index = SparseIndex()
+            index.segments = list(self.segments)
+            index.deleted = set(self.deleted)
+            index.num_docs = self.num_docs
+            index.total_len = self.total_len
+        return index
+
+    # --- Merging ---
+
+    def maybe_merge(self):
+        """Start a background merge if there are too many segments and none is running."""
+        with self._lock:
+            if len(self.segments) <= MAX_SEGMENTS:
+                return
+            if self._merge_thread and self._merge_thread.is_alive():
+                return
+            # Tiered policy: fold the smallest segments together
+            victims = sorted(self.segments, key=len)[:MERGE_FACTOR]
+            self._merge_thread = threading.Thread(target=self._merge, args=(victims,), name="sparse-merge", daemon=True)
+            self._merge_thread.start()
+
+    def wait_for_merges(self):
+        """
+        Block until no merge is running (merges may chain into follow-up merges).
+        Called before an index is published, since merges swap segments in place.
+        """
+        while True:
+            thread = self._merge_thread
+            if thread is None or thread is threading.current_thread():
+                return
+            thread.join()
+            if self._merge_thread is thread:
+                return
+
+    def compact(self):
+        """Synchronously rewrite every segment that holds tombstoned docs, purging them."""
+        while True:
+            self.wait_for_merges()
+            with self._lock:
+                if self._merge_thread and self._merge_thread.is_alive():
+                    continue
+                victims = [s for s in self.segments if s.dead(self.deleted, self._deleted_version).any()]
+                if not victims:
+                    return
+                # Claim the merge slot so no background merge picks the same segments
+                self._merge_thread = threading.current_thread()
+            self._merge(victims)
+            return
+
+    def _merge(self, victims: List[Segment]):
+        with self._lock:
+            deleted = set(self.deleted)
+        merged, dropped_docs, dropped_len = self._merge_segments(victims, deleted)
+
+        with self._lock:
+            # Statistics lose the purged docs now that they are physically gone
+            self.num_docs -= len(dropped_docs)
+            self.total_len -= dropped_len
+            self.deleted -= dropped_docs
+            self._deleted_version = next(_deleted_versions)
+            keep = [s for s in self.segments if not any(s is v for v in victims)]
+            self.segments = keep + ([merged] if len(merged) else [])
+        # Uploads may have added segments while this merge ran
+        self._merge_thread = None
+        self.maybe_merge()
+
+    @staticmethod
+    def _merge_segments(segments: List[Segment], deleted: set):
+        """Concatenate segments, dropping tombstoned docs. Returns the new segment and what was purged."""
+        vocab = {}
+        row_cols, doc_cols, tf_cols, id_cols, len_cols = [], [], [], [], []
+        dropped_docs = set()
+        dropped_len = 0
+        offset = 0
+        for segment in segments:
+            dead = np.isin(segment.doc_ids, list(deleted)) if deleted else np.zeros(len(segment), dtype=bool)
+            alive = int((~dead).sum())
+            # New positions for surviving docs, -1 for purged ones
+            remap = np.full(len(segment), -1, dtype=np.int64)
+            remap[~dead] = offset + np.arange(alive)
+            offset += alive
+            # Segment rows -> rows of the merged vocabulary
+            row_map = np.array([vocab.setdefault(term, len(vocab)) for term in segment.terms], dtype=np.int64)
+
+            rows, docs, tfs = segment.postings()
+            keep = ~dead[docs]
+            dropped_docs.update(segment.doc_ids[dead].tolist())
+            dropped_len += int(segment.doc_lens[dead].sum())
+
+            row_cols.append(row_map[rows[keep]])
+            doc_cols.append(remap[docs[keep]])
+            tf_cols.append(tfs[keep])
+            id_cols.append(segment.doc_ids[~dead])
+            len_cols.append(segment.doc_lens[~dead])
+
+        merged = Segment.from_postings(
+            list(vocab),
+            np.concatenate(row_cols),
+            np.concatenate(doc_cols),
+            np.concatenate(tf_cols),
+            np.concatenate(id_cols),
+            np.concatenate(len_cols),
+        )
+        return merged, dropped_docs, dropped_len
+
+    # --- Reads ---
+
+    def doc_freq(self, term: str) -> int:
+        df = 0
+        for segment in self.segments:
+            row = segment.row(term)
+            if row is not None:
+                df += segment.row_df(row)
+        return df
+
+    def idf(self, df: int) -> float:
+        """Lucene's BM25 IDF: positive even for terms in over half the corpus."""
+        return math.log(1.0 + (self.num_docs - df + 0.5) / (df + 0.5))
+
+    def search(self, query: str, k: int = 4, allowed: Optional[np.ndarray] = None) -> List[Tuple[int, float]]:
+        """Return the top-k (chunk id, BM25 score) pairs for a query."""
+        return self.search_batch([query], k, allowed)[0]
+
+    def search_batch(self, queries: List[str], k: int = 4,
+                     allowed: Optional[np.ndarray] = None) -> List[List[Tuple[int, float]]]:
+        """
+        search() for several queries at once. Document frequencies and each
+        term's saturated postings are computed once per batch and shared by
+        every query using the term; per-query scores are accumulated in the
+        same order as a single search, so results are identical.
+        `allowed` is a boolean bitmap indexed by chunk ID (metadata filter):
+        other chunks are zeroed before each segment's top-k, like tombstones.
+        IDF stays corpus-wide, so scores do not depend on the filter.
+        """
+        with self._lock:
+            if not self.num_docs:
+                return [[] for _ in queries]
+            segments = list(self.segments)
+            deleted = set(self.deleted)
+            version = self._deleted_version
+            avgdl = self.total_len / self.num_docs
+            # Repeated query terms count once per occurrence, as in BM25Okapi
+            idfs = {}
+            batch_weights = []
+            for query in queries:
+                weights = []
+                for term, qtf in Counter(tokenize(query)).items():
+                    if term not in idfs:
+                        df = self.doc_freq(term)
+                        idfs[term] = self.idf(df) if df else None
+                    if idfs[term] is not None:
+                        weights.append((term, qtf * idfs[term]))
+                batch_weights.append(weights)
+
+        # Per-segment top-k, then a global top-k over the survivors
+        cand_ids = [[] for _ in queries]
+        cand_scores = [[] for _ in queries]
+        for segment in segments:
+            rows = {}
+            dead = segment.dead(deleted, version)
+            if allowed is not None:
+                dead = dead | ~_lookup(allowed, segment.doc_ids)
+            for q, weights in enumerate(batch_weights):
+                if not weights:
+                    continue
+                scores = segment.score(weights, avgdl, rows)
+                scores[dead] = 0.0
+                best = top_k(scores, k)
+                best = best[scores[best] > 0]
+                cand_ids[q].append(segment.doc_ids[best])
+                cand_scores[q].append(scores[best])
+
+        results = []
+        for ids, scores in zip(cand_ids, cand_scores):
+            if not ids:
+                results.append([])
+                continue
+            ids = np.concatenate(ids)
+            scores = np.concatenate(scores)
+            order = top_k(scores, k)
+            results.append([(int(ids[i]), float(scores[i])) for i in order])
+        return results
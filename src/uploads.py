@@ -0,0 +1,143 @@
+# src/uploads.py
+import os
+import shutil
+import asyncio
+import hashlib
+import tempfile
+from typing import List, Optional, Tuple
+
+try:
+    from python_multipart import MultipartParser
+    from python_multipart.multipart import parse_options_header
+except ModuleNotFoundError:  # python-multipart < 0.0.13
+    from multipart import MultipartParser
+    from multipart.multipart import parse_options_header
+
+# Every request spools into its own directory under here
+UPLOAD_ROOT = "temp_uploads"
+# Read/write granularity while streaming an upload to disk
+SPOOL_CHUNK_BYTES = 1024 * 1024
+# Hard limits, enforced while the bytes arrive
+MAX_FILE_BYTES = 200 * 1024 * 1024
+MAX_REQUEST_BYTES = 1024 * 1024 * 1024
+
+
+class UploadTooLarge(Exception):
+    """Raised mid-stream as soon as an upload crosses a size limit."""
+
+
+class InvalidUpload(ValueError):
+    """Raised for a request body that cannot be spooled (malformed, or a filename sent twice)."""
+
+
+def make_spool_dir() -> str:
+    """Private directory for one request, so concurrent uploads never share or delete each other's files."""
+    os.makedirs(UPLOAD_ROOT, exist_ok=True)
+    return tempfile.mkdtemp(prefix="upload_", dir=UPLOAD_ROOT)
+
+
+def remove_spool_dir(path: str):
+    shutil.rmtree(path, ignore_errors=True)
+
+
+def safe_filename(filename: str) -> str:
+    """Strip client-supplied directories so a filename cannot escape the spool directory."""
+    name = os.path.basename((filename or "").replace("\\", "/"))
+    if name in ("", ".", ".."):
+        raise ValueError(f"Invalid upload filename: {filename!r}")
+    return name
+
+
+class _SpoolFile:
+    """One file part being written to the spool directory."""
+
+    def __init__(self, filename: str, path: str, handle):
+        self.filename = filename
+        self.path = path
+        self.handle = handle
+        self.digest = hashlib.sha256()
+        self.size = 0
+
+
+async def spool_multipart(request, dest_dir: str, field: str = "files", max_file_bytes: int = MAX_FILE_BYTES,
+                          max_request_bytes: int = MAX_REQUEST_BYTES) -> List[Tuple[str, str, int]]:
+    """
+    Stream a multipart/form-data request body into `dest_dir` as it arrives.
+    The whole body is never spooled first, as FastAPI's File() parameters do.
+    Each `field` file is hashed in chunks, and opened and written in a worker
+    thread, so the event loop never blocks on disk I/O. Other form fields are
+    ignored.
+    Returns (path, sha256 hex digest, size) per file. Raises UploadTooLarge
+    as soon as the bytes received cross a limit, and InvalidUpload for a
+    malformed body or a filename sent twice.
+    """
+    _, params = parse_options_header(request.headers.get("content-type", ""))
+    boundary = params.get(b"boundary")
+    if not boundary:
+        raise InvalidUpload("Expected a multipart/form-data body")
+
+    # The parser calls back synchronously; its events are replayed with awaits after each chunk
+    events = []
+    headers = []
+    header = [b"", b""]
+
+    def on_header_field(data: bytes, start: int, end: int):
+        header[0] += data[start:end]
+
+    def on_header_value(data: bytes, start: int, end: int):
+        header[1] += data[start:end]
+
+    def on_header_end():
+        headers.append((header[0].lower(), header[1]))
+        header[0] = header[1] = b""
+
+    def on_headers_finished():
+        _, options = parse_options_header(dict(headers).get(b"content-disposition", b""))
+        headers.clear()
+        filename = options.get(b"filename")
+        is_file = filename is not None and options.get(b"name") == field.encode()
+        events.append(("open", filename.decode("utf-8", "replace") if is_file else None))
+
+    parser = MultipartParser(boundary, {
+        "on_header_field": on_header_field,
+        "on_header_value": on_header_value,
+        "on_header_end": on_header_end,
+        "on_headers_finished": on_headers_finished,
+        "on_part_data": lambda data, start, end: events.append(("data", data[start:end])),
+        "on_part_end": lambda: events.append(("close", None)),
+    })
+
+    spooled = []
+    names = set()
+    current: Optional[_SpoolFile] = None
+    received = 0
+    try:
+        async for chunk in request.stream():
+            received += len(chunk)
+            if received > max_request_bytes:
+                raise UploadTooLarge("Upload exceeds the request size limit")
+            parser.write(chunk)
+            for kind, value in events:
+                if kind == "open" and value is not None:
+                    name = safe_filename(value)
+                    if name in names:
+                        raise InvalidUpload(f"{name} is uploaded more than once")
+                    names.add(name)
+                    path = os.path.join(dest_dir, name)
+                    current = _SpoolFile(value, path, await asyncio.to_thread(open, path, "wb"))
+                elif kind == "data" and current is not None:
+                    current.size += len(value)
+                    if current.size > max_file_bytes:
+                        raise UploadTooLarge(f"{current.filename} exceeds the upload size limit")
+                    current.digest.update(value)
+                    await asyncio.to_thread(current.handle.write, value)
+                elif kind == "close" and current is not None:
+                    await asyncio.to_thread(current.handle.close)
+                    spooled.append((current.path, current.digest.hexdigest(), current.size))
+                    current = None
+            events.clear()
+        parser.finalize()
+    finally:
+        if current is not None:
+            await asyncio.to_thread(current.handle.close)
+    return spooled
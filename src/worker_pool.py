@@ -0,0 +1,148 @@
+# src/worker_pool.py
+import os
+import math
+import threading
+from concurrent.futures import ProcessPoolExecutor, wait
+from typing import List, NamedTuple, Optional, Tuple
+
+from langchain_core.documents import Document
+
+from src.ingest_helper import WorkSpec, count_pdf_pages, warm_worker
+
+# Files below this size are grouped into one task, up to TASK_BATCH_BYTES per task
+SMALL_FILE_BYTES = 1024 * 1024
+TASK_BATCH_BYTES = 8 * 1024 * 1024
+MAX_FILES_PER_TASK = 16
+# PDFs at least this large are split into page ranges parsed by different workers
+PDF_SPLIT_MIN_BYTES = SMALL_FILE_BYTES
+PDF_MIN_PAGES_PER_PART = 50
+# Workers started ahead of the first upload
+PREWARM_WORKERS = 2
+
+
+class WorkUnit(NamedTuple):
+    """One piece of parsing work: a whole file, or one page range of a large PDF."""
+    item: tuple     # (path, source, digest) of the file this belongs to
+    spec: WorkSpec  # what the worker loads (see ingest_helper.load_and_split_many)
+    part: int
+    parts: int
+    size: int       # estimated bytes, used for scheduling
+
+
+def split_work(items: List[tuple], workers: int) -> List[WorkUnit]:
+    """
+    Turn files into work units. Large PDFs are cut into contiguous page ranges
+    (at least PDF_MIN_PAGES_PER_PART pages, about one range per worker) so a
+    single huge document no longer runs on one core.
+    """
+    units = []
+    for item in items:
+        path = item[0]
+        size = os.path.getsize(path)
+        pages = 0
+        if workers > 1 and path.lower().endswith(".pdf") and size >= PDF_SPLIT_MIN_BYTES:
+            try:
+                pages = count_pdf_pages(path)
+            except Exception as e:
+                print(f"Could not count pages of {path}, parsing it whole: {e}")
+        per_part = max(PDF_MIN_PAGES_PER_PART, math.ceil(pages / workers)) if pages else 0
+        if pages > per_part:
+            ranges = [(start, min(start + per_part, pages)) for start in range(0, pages, per_part)]
+            for part, (start, end) in enumerate(ranges):
+                units.append(WorkUnit(item, (path, start, end), part, len(ranges), size * (end - start) // pages))
+        else:
+            units.append(WorkUnit(item, path, 0, 1, size))
+    return units
+
+
+def plan_tasks(units: List[WorkUnit]) -> List[List[WorkUnit]]:
+    """
+    Group work units into worker tasks by size.
+    Large units get a task of their own; small files are packed together so a
+    burst of tiny uploads does not pay one IPC round trip per file. Tasks are
+    ordered largest-first so the longest parse starts as early as possible.
+    """
+    tasks, batch, batch_bytes = [], [], 0
+    for unit in sorted(units, key=lambda u: u.size, reverse=True):
+        if unit.size >= SMALL_FILE_BYTES:
+            tasks.append((unit.size, [unit]))
+            continue
+        if batch and (batch_bytes + unit.size > TASK_BATCH_BYTES or len(batch) >= MAX_FILES_PER_TASK):
+            tasks.append((batch_bytes, batch))
+            batch, batch_bytes = [], 0
+        batch.append(unit)
+        batch_bytes += unit.size
+    if batch:
+        tasks.append((batch_bytes, batch))
+    tasks.sort(key=lambda x: x[0], reverse=True)
+    return [task for _, task in tasks]
+
+
+class PartAssembler:
+    """
+    Re-sequences page-range results, which finish in any order, so each
+    file's chunks are released strictly in page order.
+    """
+
+    def __init__(self):
+        self._pending = {}
+
+    def add(self, unit: WorkUnit, chunks: List[Document]) -> List[Tuple[tuple, List[Document], bool]]:
+        """Return the (item, chunks, is_last_part) runs that are now contiguous."""
+        if unit.parts == 1:
+            return [(unit.item, chunks, True)]
+        next_part, waiting = self._pending.get(unit.item, (0, {}))
+        waiting[unit.part] = chunks
+        ready = []
+        while next_part in waiting:
+            ready.append((unit.item, waiting.pop(next_part), next_part == unit.parts - 1))
+            next_part += 1
+        if next_part == unit.parts:
+            self._pending.pop(unit.item, None)
+        else:
+            self._pending[unit.item] = (next_part, waiting)
+        return ready
+
+
+class IngestWorkerPool:
+    """
+    Long-lived process pool for parsing/chunking, owned by RAGPipeline.
+    Starts small and is only rebuilt larger when a job has more tasks than
+    there are workers (capped at max_workers), so a one-file upload reuses a
+    warm worker instead of spawning one per core.
+    """
+
+    def __init__(self, max_workers: Optional[int] = None):
+        self.max_workers = max_workers or os.cpu_count() or 1
+        self.size = 0
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._lock = threading.Lock()
+
+    def executor(self, workers: int = 1) -> ProcessPoolExecutor:
+        """Return the pool, growing it to `workers` processes if it is smaller."""
+        workers = max(1, min(workers, self.max_workers))
+        with self._lock:
+            # A crashed worker (e.g. a malformed PDF killing the parser) breaks the pool for good
+            if self._executor is not None and getattr(self._executor, "_broken", False):
+                self._executor.shutdown(wait=False, cancel_futures=True)
+                self._executor = None
+            if self._executor is not None and self.size < workers:
+                # Pending work on the old pool still completes; new tasks go to the bigger one
+                self._executor.shutdown(wait=False)
+                self._executor = None
+            if self._executor is None:
+                self._executor = ProcessPoolExecutor(max_workers=workers)
+                self.size = workers
+            return self._executor
+
+    def warm(self, workers: int = PREWARM_WORKERS):
+        """Start and import-warm a few workers so the first upload does not pay for it."""
+        executor = self.executor(workers)
+        wait([executor.submit(warm_worker) for _ in range(self.size)])
+
+    def shutdown(self):
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown(wait=True, cancel_futures=True)
+                self._executor = None
+                self.size = 0